@@ -65,10 +65,23 @@ export const converterTecd = async (file: File): Promise<Blob> => {
   return response.data;
 };
 
+// Listagens paginadas por cursor: segue o header X-Next-Cursor até a última página
+const PAGE_SIZE = 1000;
+
+const getAllPages = async <T>(url: string): Promise<T[]> => {
+  const items: T[] = [];
+  let cursor: string | undefined;
+  do {
+    const response = await api.get(url, { params: { limit: PAGE_SIZE, cursor } });
+    items.push(...response.data);
+    cursor = response.headers['x-next-cursor'];
+  } while (cursor);
+  return items;
+};
+
 // Localidades
 export const getLocalidades = async (): Promise<Localidade[]> => {
-  const response = await api.get('/localidades/');
-  return response.data;
+  return getAllPages<Localidade>('/localidades/');
 };
 
 export const createLocalidade = async (localidade: LocalidadeCreate): Promise<Localidade> => {
@@ -78,8 +91,7 @@ export const createLocalidade = async (localidade: LocalidadeCreate): Promise<Lo
 
 // Agentes
 export const getAgentes = async (): Promise<Agente[]> => {
-  const response = await api.get('/agentes/');
-  return response.data;
+  return getAllPages<Agente>('/agentes/');
 };
 
 export const createAgente = async (agente: AgenteCreate): Promise<Agente> => {
@@ -99,13 +111,15 @@ export const calcularComissao = async (
   dataInicio: string,
   dataFim: string
 ): Promise<ComissaoResponse> => {
+  // A ordem importa: o servidor processa as vendas enquanto o arquivo chega,
+  // então datas e parceiros vão antes
   const formData = new FormData();
-  formData.append('vendas_file', vendasFile);
-  formData.append('parceiros_file', parceirosFile);
   formData.append('data_inicio', dataInicio);
   formData.append('data_fim', dataFim);
+  formData.append('parceiros_file', parceirosFile);
+  formData.append('vendas_file', vendasFile);
 
-  const response = await api.post('/calcular-comissao/', formData, {
+  const response = await api.post('/calcular-comissao/stream', formData, {
     headers: {
       'Content-Type': 'multipart/form-data',
     },
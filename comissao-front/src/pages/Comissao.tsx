@@ -779,7 +779,7 @@ export default function Comissao() {
               <div className="file-input-container">
                 <input
                   type="file"
-                  accept=".csv"
+                  accept=".csv,.gz,.zip,.zst,.parquet,.arrow"
                   id="vendas-file"
                   className="file-input"
                   onChange={(e) => {
@@ -800,7 +800,7 @@ export default function Comissao() {
               <div className="file-input-container">
                 <input
                   type="file"
-                  accept=".csv"
+                  accept=".csv,.gz,.zip,.zst,.parquet,.arrow"
                   id="parceiros-file"
                   className="file-input"
                   onChange={(e) => {
@@ -121,7 +121,7 @@ export default function ConverterPlanilhas() {
           <div className="file-input-container">
             <input
               type="file"
-              accept=".xlsx,.xls"
+              accept=".xlsx,.xls,.gz,.zip,.zst"
               onChange={handleFileChangeRemuneracao}
               className="file-input"
               id="file-remuneracao"
@@ -144,7 +144,7 @@ export default function ConverterPlanilhas() {
           <div className="file-input-container">
             <input
               type="file"
-              accept=".xlsx,.xls"
+              accept=".xlsx,.xls,.gz,.zip,.zst"
               onChange={handleFileChangeTecd}
               className="file-input"
               id="file-tecd"
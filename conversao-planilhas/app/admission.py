@@ -0,0 +1,245 @@
+# admission.py
+"""Controle de admissão dos endpoints pesados (conversões, comissão, lote e importação).
+
+Cada requisição pesada tem um custo de memória estimado a partir do tamanho
+do upload (já salvo em disco pelo Starlette). Ela só começa quando:
+
+- a soma dos custos das requisições em andamento cabe em ``ADMISSION_MEMORY_BUDGET_MB``;
+- a pista (lane) do endpoint tem vaga (``ADMISSION_MAX_CONCURRENT`` por endpoint,
+  ou menos nas pistas de ``LANE_MAX_CONCURRENT``).
+
+Enquanto isso ela espera numa fila por ordem de chegada, limitada a
+``ADMISSION_MAX_QUEUE`` requisições por pista e ``ADMISSION_QUEUE_TIMEOUT_SECONDS``
+de espera. Quem não couber recebe 429 com o header ``Retry-After``.
+
+Os endpoints leves (CRUD, autenticação, métricas) não passam por aqui: como o
+trabalho pesado roda no pool de processos, eles continuam respondendo mesmo
+com as pistas pesadas cheias.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Iterable
+
+from fastapi import HTTPException, UploadFile
+
+from . import metrics
+from .config import settings
+from .instrumentation import stage
+
+MB = 1024 * 1024
+
+# Memória fixa estimada de qualquer requisição pesada (template, buffers, respostas)
+REQUEST_BASE_MEMORY = 32 * MB
+
+# Quantas vezes o tamanho do arquivo a requisição ocupa em memória, por pista.
+# XLSX é compactado (as linhas ocupam bem mais que o arquivo). Na comissão as
+# vendas viram tuplas só com as colunas usadas (~7x o CSV), mas a resposta tem
+# um objeto por venda e o JSON (~2x o CSV): medido ~20x no cálculo completo e
+# ~16x no streaming, que não guarda as linhas (1 milhão de vendas, todas no período).
+LANE_MEMORY_FACTORS = {
+    "remuneracao": 12,
+    "tecd": 12,
+    "lote": 12,
+    "comissao": 20,
+    "comissao_stream": 16,
+    "importacao": 10,
+}
+
+# Pistas com menos vagas que ADMISSION_MAX_CONCURRENT. O upload em streaming da
+# comissão lê o CSV e calcula numa thread do próprio processo da API, segurando
+# o GIL: duas ao mesmo tempo só disputariam a mesma CPU com o event loop.
+LANE_MAX_CONCURRENT = {
+    "comissao_stream": 1,
+}
+
+admission_active_requests = metrics.gauge(
+    "admission_active_requests",
+    "Requisições pesadas em andamento",
+    labelnames=("lane",),
+)
+admission_queued_requests = metrics.gauge(
+    "admission_queued_requests",
+    "Requisições pesadas aguardando admissão",
+    labelnames=("lane",),
+)
+admission_memory_reserved_bytes = metrics.gauge(
+    "admission_memory_reserved_bytes",
+    "Memória estimada reservada pelas requisições pesadas em andamento",
+)
+admission_wait_seconds = metrics.histogram(
+    "admission_wait_seconds",
+    "Tempo de espera na fila de admissão",
+    labelnames=("lane",),
+)
+admission_rejected_total = metrics.counter(
+    "admission_rejected_total",
+    "Requisições pesadas recusadas com 429",
+    labelnames=("lane", "reason"),
+)
+
+
+def upload_size(upload: UploadFile) -> int:
+    """Tamanho do arquivo enviado (sem mexer na posição de leitura)."""
+    if upload.size is not None:
+        return upload.size
+    position = upload.file.tell()
+    upload.file.seek(0, 2)
+    size = upload.file.tell()
+    upload.file.seek(position)
+    return size
+
+
+def estimate_memory(lane: str, sizes: Iterable[int]) -> int:
+    """Custo de memória estimado da requisição a partir do tamanho dos arquivos."""
+    return REQUEST_BASE_MEMORY + LANE_MEMORY_FACTORS[lane] * sum(sizes)
+
+
+def lane_max_concurrent(lane: str) -> int:
+    """Requisições simultâneas admitidas na pista."""
+    return min(settings.ADMISSION_MAX_CONCURRENT, LANE_MAX_CONCURRENT.get(lane, settings.ADMISSION_MAX_CONCURRENT))
+
+
+class _Lane:
+    def __init__(self, name: str):
+        self.name = name
+        self.active = 0
+        self.queued = 0
+        # Média móvel da duração das requisições, usada no Retry-After
+        self.avg_duration = 5.0
+
+
+class _Waiter:
+    def __init__(self, lane: _Lane, cost: int):
+        self.lane = lane
+        self.cost = cost
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class AdmissionController:
+    """Reserva memória e vagas por pista; a fila é única e atendida por ordem de chegada."""
+
+    def __init__(self):
+        self._lanes: Dict[str, _Lane] = {}
+        self._waiters: Deque[_Waiter] = deque()
+        self._memory_reserved = 0
+
+    @property
+    def memory_budget(self) -> int:
+        return settings.ADMISSION_MEMORY_BUDGET_MB * MB
+
+    def _lane(self, name: str) -> _Lane:
+        lane = self._lanes.get(name)
+        if lane is None:
+            lane = self._lanes[name] = _Lane(name)
+        return lane
+
+    def _fits(self, lane: _Lane, cost: int) -> bool:
+        return lane.active < lane_max_concurrent(lane.name) and self._memory_reserved + cost <= self.memory_budget
+
+    def _start(self, lane: _Lane, cost: int):
+        lane.active += 1
+        self._memory_reserved += cost
+        self._update_gauges(lane)
+
+    def _release(self, lane: _Lane, cost: int):
+        lane.active -= 1
+        self._memory_reserved -= cost
+        self._update_gauges(lane)
+        self._wake()
+
+    def _wake(self):
+        """Admite as requisições da fila que couberem, por ordem de chegada.
+
+        Requisições de pistas lotadas são puladas; a primeira que não couber na
+        memória bloqueia as seguintes, para que arquivos grandes não fiquem
+        esperando para sempre atrás de arquivos pequenos.
+        """
+        for waiter in list(self._waiters):
+            if waiter.future.done():
+                continue
+            if waiter.lane.active >= lane_max_concurrent(waiter.lane.name):
+                continue
+            if not self._fits(waiter.lane, waiter.cost):
+                break
+            self._waiters.remove(waiter)
+            waiter.lane.queued -= 1
+            self._start(waiter.lane, waiter.cost)
+            waiter.future.set_result(None)
+
+    def _update_gauges(self, lane: _Lane):
+        admission_active_requests.set(lane.active, lane=lane.name)
+        admission_queued_requests.set(lane.queued, lane=lane.name)
+        admission_memory_reserved_bytes.set(self._memory_reserved)
+
+    def _reject(self, lane: _Lane, reason: str, detail: str):
+        admission_rejected_total.inc(lane=lane.name, reason=reason)
+        # Tempo estimado até abrir uma vaga para quem está na fila
+        rounds = (lane.queued + 1) / max(1, lane_max_concurrent(lane.name))
+        retry_after = max(1, math.ceil(lane.avg_duration * rounds))
+        raise HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(retry_after)})
+
+    async def _acquire(self, lane: _Lane, cost: int):
+        if not self._waiters and self._fits(lane, cost):
+            self._start(lane, cost)
+            return
+        if lane.queued >= settings.ADMISSION_MAX_QUEUE:
+            self._reject(lane, "queue_full", "Servidor ocupado processando outros arquivos. Tente novamente em instantes.")
+
+        waiter = _Waiter(lane, cost)
+        self._waiters.append(waiter)
+        lane.queued += 1
+        self._update_gauges(lane)
+        # Os que estão na frente podem estar esperando vaga em outras pistas
+        self._wake()
+        started_at = time.perf_counter()
+        try:
+            with stage("admission_wait"):
+                await asyncio.wait_for(asyncio.shield(waiter.future), settings.ADMISSION_QUEUE_TIMEOUT_SECONDS)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done():
+                # Admitida no mesmo instante em que desistiu: devolve a vaga
+                self._release(lane, cost)
+            else:
+                waiter.future.cancel()
+                self._waiters.remove(waiter)
+                lane.queued -= 1
+                self._update_gauges(lane)
+                self._wake()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._reject(lane, "timeout", "Tempo de espera esgotado: servidor ocupado processando outros arquivos.")
+        finally:
+            admission_wait_seconds.observe(time.perf_counter() - started_at, lane=lane.name)
+
+    @asynccontextmanager
+    async def admit(self, lane_name: str, memory: int):
+        """Espera a vez da requisição; ``memory`` é o custo estimado (``estimate_memory``).
+
+        Uma requisição maior que o orçamento inteiro é admitida quando não
+        houver mais nada em andamento (roda sozinha).
+        """
+        if not settings.ADMISSION_ENABLED:
+            yield
+            return
+
+        lane = self._lane(lane_name)
+        cost = min(memory, self.memory_budget)
+        await self._acquire(lane, cost)
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - started_at
+            lane.avg_duration = 0.8 * lane.avg_duration + 0.2 * duration
+            self._release(lane, cost)
+
+
+admission_controller = AdmissionController()
+
+
+def admit_uploads(lane: str, *uploads: UploadFile):
+    """Atalho: admissão pelo tamanho dos arquivos enviados."""
+    return admission_controller.admit(lane, estimate_memory(lane, (upload_size(upload) for upload in uploads)))
@@ -1,5 +1,8 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status, Header
@@ -7,7 +10,7 @@ from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
-from . import models, schemas
+from . import metrics, models, schemas
 from .database import get_db
 from .config import settings
 
@@ -17,6 +20,48 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 # Configuração OAuth2
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+
+class AuthenticatedUserCache:
+    """Cache em memória dos usuários autenticados, por (username, expiração do token).
+
+    Evita a consulta ao banco em toda requisição autenticada. Cada entrada vale
+    por ``AUTH_USER_CACHE_TTL_SECONDS`` (nunca além da expiração do token) e é
+    removida quando o usuário é desativado neste processo; em outros processos
+    do servidor a mudança aparece depois do TTL.
+    """
+    MAX_ENTRIES = 1024
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, int], Tuple[float, schemas.User]] = {}
+
+    def get(self, username: str, token_exp: int) -> Optional[schemas.User]:
+        entry = self._entries.get((username, token_exp))
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if time.time() >= expires_at:
+            self._entries.pop((username, token_exp), None)
+            return None
+        return user
+
+    def put(self, username: str, token_exp: int, user: schemas.User):
+        if settings.AUTH_USER_CACHE_TTL_SECONDS <= 0:
+            return
+        now = time.time()
+        if len(self._entries) >= self.MAX_ENTRIES:
+            self._entries = {key: entry for key, entry in self._entries.items() if entry[0] > now}
+            if len(self._entries) >= self.MAX_ENTRIES:
+                self._entries.clear()
+        expires_at = min(now + settings.AUTH_USER_CACHE_TTL_SECONDS, token_exp)
+        self._entries[(username, token_exp)] = (expires_at, user)
+
+    def invalidate(self, username: str):
+        for key in [key for key in self._entries if key[0] == username]:
+            del self._entries[key]
+
+
+authenticated_user_cache = AuthenticatedUserCache()
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifica se a senha fornecida corresponde ao hash"""
     return pwd_context.verify(plain_password, hashed_password)
@@ -25,6 +70,68 @@ def get_password_hash(password: str) -> str:
     """Gera hash da senha"""
     return pwd_context.hash(password)
 
+# O bcrypt leva centenas de milissegundos por senha; ele roda num pool de
+# threads limitado para não travar o event loop (o bcrypt libera o GIL)
+_password_executor: Optional[ThreadPoolExecutor] = None
+
+password_hash_seconds = metrics.histogram(
+    "password_hash_duration_seconds",
+    "Tempo de cálculo do bcrypt (sem a espera na fila)",
+    labelnames=("operation",),
+)
+password_hash_wait_seconds = metrics.histogram(
+    "password_hash_queue_wait_seconds",
+    "Tempo de espera na fila do pool de hash de senhas",
+    labelnames=("operation",),
+)
+password_hash_queue_depth = metrics.gauge(
+    "password_hash_queue_depth",
+    "Hashes de senha aguardando uma thread livre",
+)
+password_hash_in_progress = metrics.gauge(
+    "password_hash_in_progress",
+    "Hashes de senha sendo calculados",
+)
+
+
+def get_password_executor() -> ThreadPoolExecutor:
+    global _password_executor
+    if _password_executor is None:
+        _password_executor = ThreadPoolExecutor(
+            max_workers=settings.PASSWORD_HASH_CONCURRENCY,
+            thread_name_prefix="password-hash",
+        )
+    return _password_executor
+
+
+def _timed_password_operation(operation: str, queued_at: float, func, *args):
+    started_at = time.perf_counter()
+    password_hash_queue_depth.dec()
+    password_hash_in_progress.inc()
+    password_hash_wait_seconds.observe(started_at - queued_at, operation=operation)
+    try:
+        return func(*args)
+    finally:
+        password_hash_in_progress.dec()
+        password_hash_seconds.observe(time.perf_counter() - started_at, operation=operation)
+
+
+async def _run_password_operation(operation: str, func, *args):
+    loop = asyncio.get_running_loop()
+    password_hash_queue_depth.inc()
+    return await loop.run_in_executor(
+        get_password_executor(), _timed_password_operation, operation, time.perf_counter(), func, *args
+    )
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Como ``verify_password``, mas no pool de hash de senhas"""
+    return await _run_password_operation("verify", verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Como ``get_password_hash``, mas no pool de hash de senhas"""
+    return await _run_password_operation("hash", get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Cria um token JWT"""
     to_encode = data.copy()
@@ -53,15 +160,19 @@ async def authenticate_user(db: AsyncSession, username: str, password: str) -> O
     user = await get_user_by_username(db, username)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         return None
     return user
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: AsyncSession = Depends(get_db)
-) -> models.User:
-    """Obtém o usuário atual a partir do token JWT"""
+) -> schemas.User:
+    """Obtém o usuário atual a partir do token JWT.
+
+    Retorna sempre uma cópia (``schemas.User``), venha ela do cache ou do banco,
+    e não o objeto da sessão.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -75,15 +186,22 @@ async def get_current_user(
         token_data = schemas.TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    
-    user = await get_user_by_username(db, username=token_data.username)
-    if user is None:
+
+    token_exp = int(payload.get("exp", 0))
+    cached_user = authenticated_user_cache.get(token_data.username, token_exp)
+    if cached_user is not None:
+        return cached_user
+
+    db_user = await get_user_by_username(db, username=token_data.username)
+    if db_user is None:
         raise credentials_exception
+    user = schemas.User.model_validate(db_user)
+    authenticated_user_cache.put(token_data.username, token_exp, user)
     return user
 
 async def get_current_active_user(
-    current_user: models.User = Depends(get_current_user)
-) -> models.User:
+    current_user: schemas.User = Depends(get_current_user)
+) -> schemas.User:
     """Verifica se o usuário atual está ativo"""
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
@@ -1,15 +1,64 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import List
+from typing import List, Literal
 
 class Settings(BaseSettings):
     # Carrega a variável do arquivo .env
     DATABASE_URL: str
+    # Pool de conexões do banco (por processo: multiplique pelo número de workers do uvicorn)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    # Recicla conexões antes do wait_timeout do MySQL derrubá-las
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Tempo (segundos) que o usuário autenticado fica em cache, sem consultar o banco (0 = desativado)
+    AUTH_USER_CACHE_TTL_SECONDS: int = 60
+    # Número máximo de hashes de senha (bcrypt) calculados ao mesmo tempo
+    PASSWORD_HASH_CONCURRENCY: int = 2
     ADMIN_TOKEN: str
     CORS_ORIGINS: str
 
+    # Número de processos usados para processar planilhas em paralelo
+    CONVERSION_WORKERS: int = 4
+    # Número máximo de arquivos convertidos ao mesmo tempo na conversão em lote
+    BATCH_CONCURRENCY: int = 4
+
+    # Controle de admissão dos endpoints pesados (conversões, comissão, lote e importação)
+    ADMISSION_ENABLED: bool = True
+    # Memória (MB) estimada que as requisições pesadas podem ocupar ao mesmo tempo
+    ADMISSION_MEMORY_BUDGET_MB: int = 2048
+    # Requisições simultâneas por endpoint pesado
+    ADMISSION_MAX_CONCURRENT: int = 2
+    # Requisições aguardando vaga por endpoint pesado (além disso, 429)
+    ADMISSION_MAX_QUEUE: int = 8
+    # Tempo máximo (segundos) de espera na fila antes de responder 429
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 30
+
+    # CSVs a partir deste tamanho (bytes) são lidos com mmap, sem carregar o arquivo inteiro na memória
+    CSV_MMAP_MIN_BYTES: int = 1024 * 1024
+    # Threads que processam uploads enquanto eles chegam (POST /calcular-comissao/stream)
+    UPLOAD_STREAM_WORKERS: int = 2
+    # Pedaços do upload que podem esperar na fila da thread antes de a leitura do corpo pausar
+    UPLOAD_STREAM_QUEUE_CHUNKS: int = 64
+
+    # Cache em disco das conversões (vazio = diretório temporário do sistema)
+    CONVERSION_CACHE_ENABLED: bool = True
+    CONVERSION_CACHE_DIR: str = ""
+    CONVERSION_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024
+
+    # Tempos por etapa das requisições (header Server-Timing e GET /metrics)
+    INSTRUMENTATION_ENABLED: bool = True
+
+    # Vendas repetidas no CSV (mesmo Nº Pedido/Nº Protocolo): "first" mantém a primeira,
+    # "last" mantém a última e "error" rejeita o arquivo
+    COMISSAO_DEDUP_POLICY: Literal["first", "last", "error"] = "first"
+
+    # Tempo máximo (segundos) até o índice de busca de agentes ser recarregado do banco
+    SEARCH_INDEX_TTL_SECONDS: int = 300
+
     # Adicione esta linha de volta, com o caminho corrigido
     model_config = SettingsConfigDict(env_file=".env", extra='ignore')
     
@@ -1,8 +1,101 @@
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence
+from sqlalchemy import delete, func, insert, tuple_, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import joinedload, selectinload
 from . import models, schemas
-from .auth import get_password_hash
+from .auth import authenticated_user_cache, get_password_hash_async
+from .search import agente_search_index
+
+# Quantidade de registros por comando nas operações em lote
+BULK_BATCH_SIZE = 1000
+
+
+def _chunks(values: Sequence, size: int = BULK_BATCH_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+async def _get_existing_keys(db: AsyncSession, column, keys: Sequence[str]) -> set:
+    """Retorna quais das chaves já existem na tabela (consultas em blocos)."""
+    existing = set()
+    for chunk in _chunks(list(keys)):
+        result = await db.execute(select(column).where(column.in_(chunk)))
+        existing.update(result.scalars().all())
+    return existing
+
+
+async def _bulk_upsert(db: AsyncSession, model, rows: List[dict], key: str, update_values: Dict[str, Callable]):
+    """INSERT ... ON DUPLICATE KEY UPDATE (ou equivalente do banco) em blocos.
+
+    ``update_values`` mapeia cada coluna atualizada em caso de conflito para uma
+    função ``(novo_valor, valor_atual) -> expressão``. Não faz commit.
+    """
+    table = model.__table__
+    dialect = db.bind.dialect.name
+    for chunk in _chunks(rows):
+        if dialect == "mysql":
+            stmt = mysql.insert(table).values(chunk)
+            stmt = stmt.on_duplicate_key_update({
+                column: build(stmt.inserted[column], table.c[column])
+                for column, build in update_values.items()
+            })
+        elif dialect in ("sqlite", "postgresql"):
+            dialect_module = sqlite if dialect == "sqlite" else postgresql
+            stmt = dialect_module.insert(table).values(chunk)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c[key]],
+                set_={
+                    column: build(stmt.excluded[column], table.c[column])
+                    for column, build in update_values.items()
+                }
+            )
+        else:
+            # Sem upsert nativo: atualiza os existentes e insere o restante
+            existing = await _get_existing_keys(db, table.c[key], [row[key] for row in chunk])
+            for row in chunk:
+                if row[key] in existing:
+                    await db.execute(
+                        table.update().where(table.c[key] == row[key]).values({
+                            column: build(row[column], table.c[column])
+                            for column, build in update_values.items()
+                        })
+                    )
+            new_rows = [row for row in chunk if row[key] not in existing]
+            if new_rows:
+                await db.execute(insert(table), new_rows)
+            continue
+        await db.execute(stmt)
+
+
+def _replace(new_value, current_value):
+    return new_value
+
+def _increment(new_value, current_value):
+    return current_value + 1
+
+
+def _replace_if_not_null(new_value, current_value):
+    return func.coalesce(new_value, current_value)
+
+# --- Versão dos dados ---
+
+# Conjunto versionado em versoes_dados: agentes e localidades (usado pelo TEC-D)
+VERSAO_AGENTES_LOCALIDADES = "agentes_localidades"
+
+async def _bump_versao(db: AsyncSession, nome: str):
+    """Incrementa o contador de alterações ``nome`` na transação corrente (não faz commit)."""
+    await _bulk_upsert(
+        db, models.VersaoDados, [{"nome": nome, "versao": 1}],
+        key="nome",
+        update_values={"versao": _increment},
+    )
+
+async def get_versao_dados(db: AsyncSession, nome: str) -> int:
+    result = await db.execute(select(models.VersaoDados.versao).where(models.VersaoDados.nome == nome))
+    return result.scalar_one_or_none() or 0
 
 # --- CRUD para Localidade ---
 
@@ -15,18 +108,58 @@ async def get_localidade_by_codigo(db: AsyncSession, codigo: str):
     result = await db.execute(q)
     return result.scalar_one_or_none()
 
-async def get_localidades(db: AsyncSession, skip: int = 0, limit: int = 100):
-    q = select(models.LocalidadeAtendimento).offset(skip).limit(limit)
+async def get_localidades(
+    db: AsyncSession,
+    after_id: Optional[int] = None,
+    limit: int = 100,
+    codigo_localidade: Optional[str] = None,
+    nome_prefix: Optional[str] = None,
+):
+    """Página de localidades ordenada por id, a partir do cursor ``after_id`` (paginação por chave)."""
+    q = select(models.LocalidadeAtendimento)
+    if after_id is not None:
+        q = q.where(models.LocalidadeAtendimento.id > after_id)
+    if codigo_localidade:
+        q = q.where(models.LocalidadeAtendimento.codigo_localidade == codigo_localidade)
+    if nome_prefix:
+        q = q.where(models.LocalidadeAtendimento.nome.startswith(nome_prefix, autoescape=True))
+    q = q.order_by(models.LocalidadeAtendimento.id).limit(limit)
     result = await db.execute(q)
     return result.scalars().all()
 
 async def create_localidade(db: AsyncSession, localidade: schemas.LocalidadeCreate):
     db_localidade = models.LocalidadeAtendimento(**localidade.model_dump())
     db.add(db_localidade)
+    await _bump_versao(db, VERSAO_AGENTES_LOCALIDADES)
     await db.commit()
     await db.refresh(db_localidade)
     return db_localidade
 
+async def get_localidade_ids_by_codigos(db: AsyncSession, codigos: Sequence[str]) -> Dict[str, int]:
+    """Retorna {codigo_localidade: id} das localidades existentes entre os códigos informados."""
+    ids = {}
+    for chunk in _chunks(list(codigos)):
+        q = select(
+            models.LocalidadeAtendimento.codigo_localidade,
+            models.LocalidadeAtendimento.id
+        ).where(models.LocalidadeAtendimento.codigo_localidade.in_(chunk))
+        result = await db.execute(q)
+        ids.update(result.all())
+    return ids
+
+async def get_existing_localidade_codigos(db: AsyncSession, codigos: Sequence[str]) -> set:
+    return await _get_existing_keys(db, models.LocalidadeAtendimento.codigo_localidade, codigos)
+
+async def upsert_localidades(db: AsyncSession, localidades: List[dict]):
+    """Insere ou atualiza (pelo código) as localidades, numa única transação."""
+    await _bulk_upsert(
+        db, models.LocalidadeAtendimento, localidades,
+        key="codigo_localidade",
+        update_values={"nome": _replace},
+    )
+    await _bump_versao(db, VERSAO_AGENTES_LOCALIDADES)
+    await db.commit()
+
 
 # --- CRUD para Agente ---
 
@@ -38,15 +171,84 @@ async def get_agente_by_cpf(db: AsyncSession, cpf: str):
 async def create_agente(db: AsyncSession, agente: schemas.AgenteCreate):
     db_agente = models.AgenteValidacao(**agente.model_dump())
     db.add(db_agente)
+    await _bump_versao(db, VERSAO_AGENTES_LOCALIDADES)
     await db.commit()
     await db.refresh(db_agente)
+    agente_search_index.upsert(db_agente.id, db_agente.nome, db_agente.cpf)
     return db_agente
 
-async def get_agentes(db: AsyncSession, skip: int = 0, limit: int = 100):
-    q = select(models.AgenteValidacao).offset(skip).limit(limit)
+async def get_agentes(
+    db: AsyncSession,
+    after_id: Optional[int] = None,
+    limit: int = 100,
+    localidade_id: Optional[int] = None,
+    codigo_localidade: Optional[str] = None,
+    nome_prefix: Optional[str] = None,
+    with_localidade: bool = False,
+):
+    """Página de agentes ordenada por id, a partir do cursor ``after_id`` (paginação por chave).
+
+    Com ``with_localidade`` a localidade de cada agente vem na mesma consulta (JOIN).
+    """
+    q = select(models.AgenteValidacao)
+    if with_localidade:
+        q = q.options(joinedload(models.AgenteValidacao.localidade))
+    if after_id is not None:
+        q = q.where(models.AgenteValidacao.id > after_id)
+    if localidade_id is not None:
+        q = q.where(models.AgenteValidacao.localidade_id == localidade_id)
+    if codigo_localidade:
+        q = q.join(
+            models.LocalidadeAtendimento,
+            models.AgenteValidacao.localidade_id == models.LocalidadeAtendimento.id
+        ).where(models.LocalidadeAtendimento.codigo_localidade == codigo_localidade)
+    if nome_prefix:
+        q = q.where(models.AgenteValidacao.nome.startswith(nome_prefix, autoescape=True))
+    q = q.order_by(models.AgenteValidacao.id).limit(limit)
     result = await db.execute(q)
     return result.scalars().all()
 
+async def get_existing_agente_cpfs(db: AsyncSession, cpfs: Sequence[str]) -> set:
+    return await _get_existing_keys(db, models.AgenteValidacao.cpf, cpfs)
+
+async def upsert_agentes(db: AsyncSession, agentes: List[dict]):
+    """Insere ou atualiza (pelo CPF) os agentes, numa única transação.
+
+    Agentes sem localidade informada mantêm a localidade já cadastrada.
+    """
+    await _bulk_upsert(
+        db, models.AgenteValidacao, agentes,
+        key="cpf",
+        update_values={"nome": _replace, "localidade_id": _replace_if_not_null},
+    )
+    await _bump_versao(db, VERSAO_AGENTES_LOCALIDADES)
+    await db.commit()
+    agente_search_index.invalidate()
+
+async def get_agentes_by_ids(db: AsyncSession, agente_ids: Sequence[int]):
+    """Agentes (com a localidade, numa única consulta) na mesma ordem dos ids informados."""
+    if not agente_ids:
+        return []
+    q = select(models.AgenteValidacao).options(
+        joinedload(models.AgenteValidacao.localidade)
+    ).where(models.AgenteValidacao.id.in_(agente_ids))
+    result = await db.execute(q)
+    agentes = {agente.id: agente for agente in result.scalars().all()}
+    return [agentes[agente_id] for agente_id in agente_ids if agente_id in agentes]
+
+async def get_agentes_localidades(db: AsyncSession):
+    """Retorna (cpf, codigo_localidade, nome_localidade) de todos os agentes em uma única consulta."""
+    q = select(
+        models.AgenteValidacao.cpf,
+        models.LocalidadeAtendimento.codigo_localidade,
+        models.LocalidadeAtendimento.nome,
+    ).outerjoin(
+        models.LocalidadeAtendimento,
+        models.AgenteValidacao.localidade_id == models.LocalidadeAtendimento.id
+    )
+    result = await db.execute(q)
+    return result.all()
+
 # Função para buscar um agente e já incluir (JOIN) os dados da localidade
 async def get_agente_with_localidade(db: AsyncSession, agente_id: int):
     q = select(models.AgenteValidacao).options(
@@ -61,15 +263,17 @@ async def update_agente_localidade(db: AsyncSession, agente_id: int, localidade_
     if agente:
         agente.localidade_id = localidade_id
         db.add(agente)
+        await _bump_versao(db, VERSAO_AGENTES_LOCALIDADES)
         await db.commit()
         await db.refresh(agente)
+        agente_search_index.upsert(agente.id, agente.nome, agente.cpf)
     return agente
 
 # --- CRUD para User ---
 
 async def create_user(db: AsyncSession, user: schemas.UserCreate):
     """Cria um novo usuário"""
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     db_user = models.User(
         username=user.username,
         email=user.email,
@@ -80,6 +284,247 @@ async def create_user(db: AsyncSession, user: schemas.UserCreate):
     await db.refresh(db_user)
     return db_user
 
+async def set_user_active(db: AsyncSession, user: models.User, is_active: bool):
+    """Ativa/desativa o usuário e remove-o do cache de usuários autenticados"""
+    user.is_active = is_active
+    db.add(user)
+    await db.commit()
+    await db.refresh(user)
+    authenticated_user_cache.invalidate(user.username)
+    return user
+
 async def get_user(db: AsyncSession, user_id: int):
     """Busca usuário por ID"""
-    return await db.get(models.User, user_id)
\ No newline at end of file
+    return await db.get(models.User, user_id)
+
+
+# --- Histórico de comissões ---
+
+async def save_comissao_historico(db: AsyncSession, historico) -> models.ComissaoExecucao:
+    """Grava um cálculo de comissão (``ComissaoHistorico`` de routers/comissao.py) numa única transação.
+
+    Vendas e totais são inseridos em blocos de ``BULK_BATCH_SIZE``. Os rollups
+    do mês são refeitos a partir deste cálculo: o último cálculo salvo de cada
+    mês substitui o anterior nas séries e rankings.
+    """
+    execucao = models.ComissaoExecucao(
+        periodo=historico.periodo,
+        data_inicio=historico.inicio,
+        data_fim=historico.fim,
+        quantidade_vendas=historico.quantidade_vendas,
+        total_vendas_centavos=historico.total_vendas_centavos,
+        total_comissao_centavos=historico.total_comissao_centavos,
+        total_comissao_renovacao_centavos=historico.total_comissao_renovacao_centavos,
+    )
+    db.add(execucao)
+    await db.flush()
+
+    venda_fields = historico.VENDA_FIELDS
+    for chunk in _chunks(historico.vendas):
+        await db.execute(
+            insert(models.ComissaoVenda),
+            [dict(zip(venda_fields, row), execucao_id=execucao.id) for row in chunk]
+        )
+
+    totais = [
+        dict(zip(historico.TOTAL_FIELDS, row), execucao_id=execucao.id, periodo=historico.periodo)
+        for row in historico.totais
+    ]
+    for chunk in _chunks(totais):
+        await db.execute(insert(models.ComissaoTotal), chunk)
+
+    # Rollups do mês
+    await db.execute(
+        delete(models.ComissaoRollupParceiro).where(models.ComissaoRollupParceiro.periodo == historico.periodo)
+    )
+    for chunk in _chunks(totais):
+        await db.execute(
+            insert(models.ComissaoRollupParceiro),
+            [{key: value for key, value in row.items() if key != "vendedor_cnpj_cpf"} for row in chunk]
+        )
+    await db.execute(
+        delete(models.ComissaoRollupPeriodo).where(models.ComissaoRollupPeriodo.periodo == historico.periodo)
+    )
+    await db.execute(insert(models.ComissaoRollupPeriodo).values(
+        periodo=historico.periodo,
+        execucao_id=execucao.id,
+        quantidade_vendas=historico.quantidade_vendas,
+        total_vendas_centavos=historico.total_vendas_centavos,
+        total_comissao_centavos=historico.total_comissao_centavos,
+        total_comissao_renovacao_centavos=historico.total_comissao_renovacao_centavos,
+    ))
+    await db.commit()
+    return execucao
+
+async def get_comissao_execucao(db: AsyncSession, execucao_id: int) -> Optional[models.ComissaoExecucao]:
+    return await db.get(models.ComissaoExecucao, execucao_id)
+
+async def get_comissao_execucao_conteudo(db: AsyncSession, execucao_id: int):
+    """Totais e vendas de um cálculo salvo, como tuplas (colunas de ``ComissaoHistorico.TOTAL_FIELDS``/``VENDA_FIELDS``)."""
+    total = models.ComissaoTotal
+    result = await db.execute(
+        select(
+            total.tipo, total.cnpj_cpf, total.nome, total.faixa_comissao, total.vendedor_cnpj_cpf,
+            total.quantidade_vendas, total.total_vendas_centavos, total.total_comissao_centavos,
+            total.total_comissao_renovacao_centavos,
+        ).where(total.execucao_id == execucao_id).order_by(total.id)
+    )
+    totais = [tuple(row) for row in result.all()]
+    venda = models.ComissaoVenda
+    result = await db.execute(
+        select(
+            venda.tipo, venda.parceiro_cnpj_cpf, venda.numero_pedido, venda.numero_protocolo, venda.valor_centavos,
+            venda.comissao_centavos, venda.comissao_renovacao_centavos, venda.is_renovacao,
+        ).where(venda.execucao_id == execucao_id).order_by(venda.id)
+    )
+    vendas = [tuple(row) for row in result.all()]
+    return totais, vendas
+
+async def get_comissao_execucoes(
+    db: AsyncSession,
+    after_id: Optional[int] = None,
+    limit: int = 100,
+    periodo: Optional[str] = None,
+):
+    """Página de cálculos salvos, do mais recente para o mais antigo (cursor ``after_id``)."""
+    q = select(models.ComissaoExecucao)
+    if after_id is not None:
+        q = q.where(models.ComissaoExecucao.id < after_id)
+    if periodo:
+        q = q.where(models.ComissaoExecucao.periodo == periodo)
+    q = q.order_by(models.ComissaoExecucao.id.desc()).limit(limit)
+    result = await db.execute(q)
+    return result.scalars().all()
+
+async def get_comissao_serie_parceiro(
+    db: AsyncSession,
+    tipo: str,
+    cnpj_cpf: str,
+    periodo_de: Optional[str] = None,
+    periodo_ate: Optional[str] = None,
+):
+    """Totais mensais de um parceiro (rollup), em ordem de mês."""
+    rollup = models.ComissaoRollupParceiro
+    q = select(rollup).where(rollup.tipo == tipo, rollup.cnpj_cpf == cnpj_cpf)
+    if periodo_de:
+        q = q.where(rollup.periodo >= periodo_de)
+    if periodo_ate:
+        q = q.where(rollup.periodo <= periodo_ate)
+    result = await db.execute(q.order_by(rollup.periodo))
+    return result.scalars().all()
+
+async def get_comissao_serie_periodos(
+    db: AsyncSession,
+    periodo_de: Optional[str] = None,
+    periodo_ate: Optional[str] = None,
+):
+    """Totais gerais mensais (rollup), em ordem de mês."""
+    rollup = models.ComissaoRollupPeriodo
+    q = select(rollup)
+    if periodo_de:
+        q = q.where(rollup.periodo >= periodo_de)
+    if periodo_ate:
+        q = q.where(rollup.periodo <= periodo_ate)
+    result = await db.execute(q.order_by(rollup.periodo))
+    return result.scalars().all()
+
+async def get_comissao_ranking(db: AsyncSession, periodo: str, tipo: str, ordem: str = "comissao", limit: int = 10):
+    """Maiores parceiros do mês (rollup), por comissão ou por vendas."""
+    rollup = models.ComissaoRollupParceiro
+    column = rollup.total_vendas_centavos if ordem == "vendas" else rollup.total_comissao_centavos
+    q = select(rollup).where(rollup.periodo == periodo, rollup.tipo == tipo)
+    q = q.order_by(column.desc(), rollup.cnpj_cpf).limit(limit)
+    result = await db.execute(q)
+    return result.scalars().all()
+
+
+
+# --- Ledger de comissões ---
+
+async def create_comissao_ledger(db: AsyncSession, data_inicio, data_fim) -> models.ComissaoLedger:
+    ledger = models.ComissaoLedger(
+        periodo=data_inicio.strftime("%Y-%m"),
+        data_inicio=data_inicio,
+        data_fim=data_fim,
+    )
+    db.add(ledger)
+    await db.commit()
+    await db.refresh(ledger)
+    return ledger
+
+async def get_comissao_ledger(db: AsyncSession, ledger_id: int) -> Optional[models.ComissaoLedger]:
+    return await db.get(models.ComissaoLedger, ledger_id)
+
+async def get_comissao_ledger_totais(db: AsyncSession, ledger_id: int):
+    q = select(models.ComissaoLedgerTotal).where(
+        models.ComissaoLedgerTotal.ledger_id == ledger_id
+    ).order_by(models.ComissaoLedgerTotal.tipo, models.ComissaoLedgerTotal.cnpj_cpf)
+    result = await db.execute(q)
+    return result.scalars().all()
+
+async def get_comissao_ledger_hashes(db: AsyncSession, ledger_id: int) -> Dict[tuple, int]:
+    """{(numero_pedido, numero_protocolo): linha_hash} das vendas já registradas no ledger."""
+    venda = models.ComissaoLedgerVenda
+    result = await db.execute(
+        select(venda.numero_pedido, venda.numero_protocolo, venda.linha_hash).where(venda.ledger_id == ledger_id)
+    )
+    return {(pedido, protocolo): linha_hash for pedido, protocolo, linha_hash in result.all()}
+
+def _ledger_vendas_keys_clause(ledger_id: int, keys: Sequence[tuple]):
+    venda = models.ComissaoLedgerVenda
+    return (venda.ledger_id == ledger_id) & tuple_(venda.numero_pedido, venda.numero_protocolo).in_(keys)
+
+async def get_comissao_ledger_vendas(db: AsyncSession, ledger_id: int, keys: Sequence[tuple]):
+    """Vendas registradas no ledger com as chaves (numero_pedido, numero_protocolo) informadas."""
+    vendas = []
+    for chunk in _chunks(list(keys)):
+        result = await db.execute(select(models.ComissaoLedgerVenda).where(_ledger_vendas_keys_clause(ledger_id, chunk)))
+        vendas.extend(result.scalars().all())
+    return vendas
+
+async def save_comissao_ledger(
+    db: AsyncSession,
+    ledger: models.ComissaoLedger,
+    versao: int,
+    parceiros_hash: str,
+    vendas: List[dict],
+    totais: List[dict],
+    recalcular: bool = False,
+) -> bool:
+    """Grava um envio ao ledger numa única transação: vendas novas/alteradas e os totais correntes.
+
+    Retorna False (sem gravar nada) se outro envio já gravou depois da versão
+    ``versao`` lida. Com ``recalcular`` as vendas anteriores são descartadas.
+    """
+    result = await db.execute(
+        update(models.ComissaoLedger)
+        .where(models.ComissaoLedger.id == ledger.id, models.ComissaoLedger.versao == versao)
+        .values(versao=versao + 1, parceiros_hash=parceiros_hash, atualizado_em=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        await db.rollback()
+        return False
+
+    venda = models.ComissaoLedgerVenda
+    if recalcular:
+        await db.execute(delete(venda).where(venda.ledger_id == ledger.id))
+    else:
+        keys = [(row["numero_pedido"], row["numero_protocolo"]) for row in vendas]
+        for chunk in _chunks(keys):
+            await db.execute(delete(venda).where(_ledger_vendas_keys_clause(ledger.id, chunk)))
+    for chunk in _chunks(vendas):
+        await db.execute(insert(venda), chunk)
+
+    await db.execute(delete(models.ComissaoLedgerTotal).where(models.ComissaoLedgerTotal.ledger_id == ledger.id))
+    for chunk in _chunks(totais):
+        await db.execute(insert(models.ComissaoLedgerTotal), chunk)
+    await db.commit()
+    await db.refresh(ledger)
+    return True
+
+async def close_comissao_ledger(db: AsyncSession, ledger: models.ComissaoLedger) -> models.ComissaoLedger:
+    ledger.aberto = False
+    await db.commit()
+    await db.refresh(ledger)
+    return ledger
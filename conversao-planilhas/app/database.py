@@ -1,14 +1,99 @@
+import time
+
+from sqlalchemy import event, exc
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
+from . import metrics
 from .config import settings
 
+# --- Métricas do pool de conexões ---
+
+pool_checkout_wait_seconds = metrics.histogram(
+    "db_pool_checkout_wait_seconds",
+    "Tempo de espera para obter uma conexão do pool",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0),
+)
+pool_checkout_timeouts = metrics.counter(
+    "db_pool_checkout_timeouts_total",
+    "Requisições que desistiram de esperar por uma conexão (pool esgotado)",
+)
+pool_connection_held_seconds = metrics.histogram(
+    "db_pool_connection_held_seconds",
+    "Tempo em que uma conexão ficou emprestada (checkout até checkin)",
+)
+pool_connection_lifetime_seconds = metrics.histogram(
+    "db_pool_connection_lifetime_seconds",
+    "Tempo de vida das conexões fechadas (inclui as recicladas e invalidadas)",
+    buckets=(1, 10, 60, 300, 900, 1800, 3600, 14400, 86400),
+)
+pool_connections = metrics.gauge(
+    "db_pool_connections",
+    "Conexões do pool por estado",
+    labelnames=("state",),
+)
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Pool padrão das conexões assíncronas, medindo a espera por uma conexão."""
+
+    def _do_get(self):
+        started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_checkout_timeouts.inc()
+            raise
+        finally:
+            pool_checkout_wait_seconds.observe(time.perf_counter() - started_at)
+
+
 # Cria o "motor" assíncrono usando a URL do .env
 engine = create_async_engine(
     settings.DATABASE_URL,
+    poolclass=InstrumentedAsyncQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
     # echo=True,
 )
 
+
+@event.listens_for(engine.sync_engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    connection_record.info["connected_at"] = time.monotonic()
+
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    connection_record.info["checked_out_at"] = time.monotonic()
+
+
+@event.listens_for(engine.sync_engine, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    checked_out_at = connection_record.info.pop("checked_out_at", None)
+    if checked_out_at is not None:
+        pool_connection_held_seconds.observe(time.monotonic() - checked_out_at)
+
+
+@event.listens_for(engine.sync_engine, "close")
+def _on_close(dbapi_connection, connection_record):
+    connected_at = connection_record.info.pop("connected_at", None)
+    if connected_at is not None:
+        pool_connection_lifetime_seconds.observe(time.monotonic() - connected_at)
+
+
+@metrics.on_collect
+def _collect_pool_state():
+    pool = engine.pool
+    pool_connections.set(pool.checkedout(), state="checked_out")
+    pool_connections.set(pool.checkedin(), state="idle")
+    pool_connections.set(max(pool.overflow(), 0), state="overflow")
+    pool_connections.set(pool.size(), state="size")
+
 # Cria uma "fábrica" de sessões assíncronas
 AsyncSessionLocal = sessionmaker(
     bind=engine,
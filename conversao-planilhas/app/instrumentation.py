@@ -0,0 +1,213 @@
+# instrumentation.py
+"""Medição por requisição: tempo de cada etapa, linhas processadas e bytes.
+
+O código marca as etapas com ``with stage("nome"):`` e conta linhas com
+``add_rows``. O middleware junta tudo por requisição e publica:
+
+- no header ``Server-Timing`` da resposta (visível no DevTools do navegador);
+- nas métricas do Prometheus (``GET /metrics``).
+
+Etapas executadas no pool de processos também são medidas: o worker devolve
+os tempos junto com o resultado (``call_with_stats``) e eles são somados aos
+da requisição. Etapas de sheets processadas em paralelo somam o tempo de cada
+processo, então podem passar do tempo total da requisição.
+
+Com ``INSTRUMENTATION_ENABLED=false`` nada é registrado: ``stage`` devolve um
+context manager vazio e o middleware repassa a requisição direto.
+"""
+import resource
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from . import metrics
+from .config import settings
+
+_NULL_STAGE = nullcontext()
+
+_current_stats: ContextVar[Optional["RequestStats"]] = ContextVar("request_stats", default=None)
+
+http_request_duration_seconds = metrics.histogram(
+    "http_request_duration_seconds",
+    "Duração das requisições HTTP (até o envio dos headers)",
+    labelnames=("method", "route", "status"),
+)
+request_stage_duration_seconds = metrics.histogram(
+    "request_stage_duration_seconds",
+    "Duração de cada etapa das requisições",
+    labelnames=("route", "stage"),
+)
+request_rows_processed_total = metrics.counter(
+    "request_rows_processed_total",
+    "Linhas de planilha/CSV processadas",
+    labelnames=("route",),
+)
+request_bytes_in_total = metrics.counter(
+    "request_bytes_in_total",
+    "Bytes recebidos no corpo das requisições",
+    labelnames=("route",),
+)
+request_bytes_out_total = metrics.counter(
+    "request_bytes_out_total",
+    "Bytes enviados no corpo das respostas (quando conhecidos)",
+    labelnames=("route",),
+)
+process_peak_rss_bytes = metrics.gauge(
+    "process_peak_rss_bytes",
+    "Pico de memória residente (RSS) do processo e dos workers do pool",
+    labelnames=("process",),
+)
+
+
+class RequestStats:
+    """Tempos (segundos) por etapa e contadores de uma requisição."""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.rows = 0
+        self.bytes_out = 0
+        # Pico de RSS informado pelos workers do pool que atenderam a requisição
+        self.worker_peak_rss = 0
+
+    def add_stage(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def as_dict(self) -> dict:
+        return {
+            "stages": self.stages,
+            "rows": self.rows,
+            "bytes_out": self.bytes_out,
+            "worker_peak_rss": self.worker_peak_rss,
+        }
+
+    def merge(self, data: dict):
+        for name, seconds in data["stages"].items():
+            self.add_stage(name, seconds)
+        self.rows += data["rows"]
+        self.bytes_out += data["bytes_out"]
+        self.worker_peak_rss = max(self.worker_peak_rss, data["worker_peak_rss"])
+
+
+@contextmanager
+def _timed_stage(stats: RequestStats, name: str):
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.add_stage(name, time.perf_counter() - started_at)
+
+
+def stage(name: str):
+    """Context manager que soma o tempo do bloco à etapa ``name`` da requisição atual."""
+    stats = _current_stats.get()
+    if stats is None:
+        return _NULL_STAGE
+    return _timed_stage(stats, name)
+
+
+def add_rows(count: int):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.rows += count
+
+
+def add_bytes_out(count: int):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.bytes_out += count
+
+
+def is_collecting() -> bool:
+    return _current_stats.get() is not None
+
+
+# --- Pool de processos ---
+
+def call_with_stats(func, *args):
+    """Executa ``func`` (num worker) medindo as etapas; retorna (resultado, medições)."""
+    stats = RequestStats()
+    token = _current_stats.set(stats)
+    try:
+        result = func(*args)
+    finally:
+        _current_stats.reset(token)
+    stats.worker_peak_rss = maxrss_bytes()
+    return result, stats.as_dict()
+
+
+def merge_stats(data: Optional[dict]):
+    global _workers_peak_rss
+    stats = _current_stats.get()
+    if stats is not None and data:
+        stats.merge(data)
+        _workers_peak_rss = max(_workers_peak_rss, data["worker_peak_rss"])
+
+
+# --- Memória ---
+
+# Maior pico de RSS já informado por um worker do pool (os workers não terminam,
+# então não aparecem em RUSAGE_CHILDREN)
+_workers_peak_rss = 0
+
+
+def maxrss_bytes(children: bool = False) -> int:
+    """Pico de RSS do processo atual (ou do maior processo filho já encerrado)."""
+    maxrss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB; macOS em bytes
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+@metrics.on_collect
+def _collect_peak_rss():
+    process_peak_rss_bytes.set(maxrss_bytes(), process="main")
+    process_peak_rss_bytes.set(_workers_peak_rss, process="workers")
+
+
+# --- Middleware ---
+
+def _server_timing(stats: RequestStats, total_seconds: float, peak_rss: int) -> str:
+    parts = [
+        f"{name.replace(' ', '_')};dur={seconds * 1000:.1f}"
+        for name, seconds in stats.stages.items()
+    ]
+    parts.append(f"total;dur={total_seconds * 1000:.1f}")
+    if stats.rows:
+        parts.append(f'rows;desc="{stats.rows}"')
+    parts.append(f'rss;desc="{peak_rss // (1024 * 1024)}MB"')
+    return ", ".join(parts)
+
+
+async def instrumentation_middleware(request, call_next):
+    if not settings.INSTRUMENTATION_ENABLED:
+        return await call_next(request)
+
+    stats = RequestStats()
+    token = _current_stats.set(stats)
+    started_at = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _current_stats.reset(token)
+    total_seconds = time.perf_counter() - started_at
+
+    route = request.scope.get("route")
+    route_path = getattr(route, "path", "desconhecida")
+    for name, seconds in stats.stages.items():
+        request_stage_duration_seconds.observe(seconds, route=route_path, stage=name)
+    http_request_duration_seconds.observe(
+        total_seconds, method=request.method, route=route_path, status=str(response.status_code)
+    )
+    if stats.rows:
+        request_rows_processed_total.inc(stats.rows, route=route_path)
+    bytes_in = int(request.headers.get("content-length") or 0)
+    if bytes_in:
+        request_bytes_in_total.inc(bytes_in, route=route_path)
+    bytes_out = int(response.headers.get("content-length") or 0) or stats.bytes_out
+    if bytes_out:
+        request_bytes_out_total.inc(bytes_out, route=route_path)
+
+    peak_rss = max(maxrss_bytes(), stats.worker_peak_rss)
+    response.headers["Server-Timing"] = _server_timing(stats, total_seconds, peak_rss)
+    return response
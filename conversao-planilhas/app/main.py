@@ -4,9 +4,10 @@ from fastapi.middleware.cors import CORSMiddleware
 from .database import engine, Base
 from . import models # Import models para que o create_all saiba das tabelas
 from .config import settings
+from .instrumentation import instrumentation_middleware
 
 # Importe os novos módulos de roteador
-from .routers import auth, agentes, localidades, remuneracao, tecd, comissao
+from .routers import auth, agentes, localidades, remuneracao, tecd, comissao, comissao_historico, comissao_ledger, comissao_diff, lote, metrics
 
 # --- Configuração ---
 app = FastAPI(
@@ -15,6 +16,9 @@ app = FastAPI(
     root_path="/api-comissao"
 )
 
+# Tempos por etapa (Server-Timing) e métricas das requisições
+app.middleware("http")(instrumentation_middleware)
+
 # Configuração CORS
 app.add_middleware(
     CORSMiddleware,
@@ -22,6 +26,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cursor da próxima página nas listagens de agentes/localidades e id do cálculo de comissão salvo
+    expose_headers=["X-Next-Cursor", "Server-Timing", "X-Comissao-Execucao", "X-Comissao-Duplicadas"],
 )
 
 # --- Inclusão dos Roteadores ---
@@ -31,6 +37,11 @@ app.include_router(localidades.router)
 app.include_router(remuneracao.router)
 app.include_router(tecd.router)
 app.include_router(comissao.router)
+app.include_router(comissao_historico.router)
+app.include_router(comissao_ledger.router)
+app.include_router(comissao_diff.router)
+app.include_router(lote.router)
+app.include_router(metrics.router)
 
 # Evento de "startup": Cria as tabelas no banco de dados
 @app.on_event("startup")
@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean
+from datetime import datetime
+
+from sqlalchemy import BigInteger, Column, DateTime, Integer, String, ForeignKey, Boolean, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 
 from .database import Base
@@ -13,6 +15,18 @@ class User(Base):
     is_active = Column(Boolean, default=True)
 
 
+class VersaoDados(Base):
+    """Contador de alterações de um conjunto de tabelas (ex: agentes/localidades).
+
+    É incrementado na mesma transação de cada escrita, então serve como carimbo
+    barato (uma consulta pela chave) para caches de todos os processos.
+    """
+    __tablename__ = "versoes_dados"
+
+    nome = Column(String(50), primary_key=True)
+    versao = Column(BigInteger, nullable=False, default=0)
+
+
 class LocalidadeAtendimento(Base):
     __tablename__ = "localidades_atendimento"
 
@@ -37,4 +51,173 @@ class AgenteValidacao(Base):
     localidade_id = Column(Integer, ForeignKey("localidades_atendimento.id"))
 
     # Define a relação inversa: Um agente pertence a uma localidade
-    localidade = relationship("LocalidadeAtendimento", back_populates="agentes")
\ No newline at end of file
+    localidade = relationship("LocalidadeAtendimento", back_populates="agentes")
+
+
+# --- Histórico de comissões ---
+# Valores em centavos (inteiros), como no cálculo
+
+class ComissaoExecucao(Base):
+    """Um cálculo de comissão salvo (POST /calcular-comissao/ com salvar=true)."""
+    __tablename__ = "comissao_execucoes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # Mês de apuração (AAAA-MM), pelo início do período calculado
+    periodo = Column(String(7), index=True, nullable=False)
+    data_inicio = Column(DateTime, nullable=False)
+    data_fim = Column(DateTime, nullable=False)
+    criado_em = Column(DateTime, nullable=False, default=datetime.utcnow)
+    quantidade_vendas = Column(Integer, nullable=False)
+    total_vendas_centavos = Column(BigInteger, nullable=False)
+    # Comissões de vendedores e contadores
+    total_comissao_centavos = Column(BigInteger, nullable=False)
+    total_comissao_renovacao_centavos = Column(BigInteger, nullable=False)
+
+
+class ComissaoVenda(Base):
+    """Venda de um cálculo salvo, como aparece para o vendedor ou o contador (tipo)."""
+    __tablename__ = "comissao_vendas"
+    __table_args__ = (
+        Index("ix_comissao_vendas_execucao_parceiro", "execucao_id", "tipo", "parceiro_cnpj_cpf"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    execucao_id = Column(Integer, ForeignKey("comissao_execucoes.id", ondelete="CASCADE"), nullable=False)
+    tipo = Column(String(10), nullable=False)
+    # CPF/CNPJ só com números
+    parceiro_cnpj_cpf = Column(String(32), nullable=False)
+    numero_pedido = Column(String(255), nullable=False)
+    numero_protocolo = Column(String(255), nullable=False)
+    valor_centavos = Column(BigInteger, nullable=False)
+    comissao_centavos = Column(BigInteger, nullable=False)
+    comissao_renovacao_centavos = Column(BigInteger, nullable=False)
+    is_renovacao = Column(Boolean, nullable=False)
+    produto = Column(String(255), nullable=False)
+    cliente = Column(String(255), nullable=False)
+    doc_cliente = Column(String(255), nullable=False)
+
+
+class ComissaoTotal(Base):
+    """Totais de cada vendedor, contador e do parceiro de renovação num cálculo salvo."""
+    __tablename__ = "comissao_totais"
+    __table_args__ = (
+        Index("ix_comissao_totais_execucao_tipo", "execucao_id", "tipo"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    execucao_id = Column(Integer, ForeignKey("comissao_execucoes.id", ondelete="CASCADE"), nullable=False)
+    periodo = Column(String(7), nullable=False)
+    tipo = Column(String(10), nullable=False)
+    cnpj_cpf = Column(String(32), nullable=False)
+    nome = Column(String(255), nullable=False)
+    faixa_comissao = Column(String(255), nullable=False)
+    # Vendedor (Gestor 01) do contador
+    vendedor_cnpj_cpf = Column(String(32))
+    quantidade_vendas = Column(Integer, nullable=False)
+    total_vendas_centavos = Column(BigInteger, nullable=False)
+    total_comissao_centavos = Column(BigInteger, nullable=False)
+    total_comissao_renovacao_centavos = Column(BigInteger, nullable=False)
+
+
+class ComissaoRollupParceiro(Base):
+    """Totais por parceiro e mês, atualizados ao salvar (último cálculo salvo de cada mês).
+
+    Séries e rankings são lidos daqui, sem recalcular nada.
+    """
+    __tablename__ = "comissao_rollup_parceiros"
+    __table_args__ = (
+        # Série de um parceiro
+        UniqueConstraint("tipo", "cnpj_cpf", "periodo", name="uq_comissao_rollup_parceiro"),
+        # Ranking de um mês
+        Index("ix_comissao_rollup_ranking", "periodo", "tipo", "total_comissao_centavos"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    periodo = Column(String(7), nullable=False)
+    tipo = Column(String(10), nullable=False)
+    cnpj_cpf = Column(String(32), nullable=False)
+    execucao_id = Column(Integer, ForeignKey("comissao_execucoes.id", ondelete="CASCADE"), nullable=False)
+    nome = Column(String(255), nullable=False)
+    faixa_comissao = Column(String(255), nullable=False)
+    quantidade_vendas = Column(Integer, nullable=False)
+    total_vendas_centavos = Column(BigInteger, nullable=False)
+    total_comissao_centavos = Column(BigInteger, nullable=False)
+    total_comissao_renovacao_centavos = Column(BigInteger, nullable=False)
+
+
+class ComissaoRollupPeriodo(Base):
+    """Totais gerais por mês (último cálculo salvo de cada mês)."""
+    __tablename__ = "comissao_rollup_periodos"
+
+    id = Column(Integer, primary_key=True)
+    periodo = Column(String(7), unique=True, index=True, nullable=False)
+    execucao_id = Column(Integer, ForeignKey("comissao_execucoes.id", ondelete="CASCADE"), nullable=False)
+    quantidade_vendas = Column(Integer, nullable=False)
+    total_vendas_centavos = Column(BigInteger, nullable=False)
+    total_comissao_centavos = Column(BigInteger, nullable=False)
+    total_comissao_renovacao_centavos = Column(BigInteger, nullable=False)
+
+
+# --- Ledger de comissões (período aberto, apurado de forma incremental) ---
+
+class ComissaoLedger(Base):
+    """Período aberto: cada envio de vendas só processa as vendas novas ou alteradas."""
+    __tablename__ = "comissao_ledgers"
+
+    id = Column(Integer, primary_key=True, index=True)
+    periodo = Column(String(7), index=True, nullable=False)
+    data_inicio = Column(DateTime, nullable=False)
+    data_fim = Column(DateTime, nullable=False)
+    aberto = Column(Boolean, nullable=False, default=True)
+    criado_em = Column(DateTime, nullable=False, default=datetime.utcnow)
+    atualizado_em = Column(DateTime)
+    # Impressão digital dos parceiros do último envio; se mudar, o período é recalculado
+    parceiros_hash = Column(String(32))
+    # Incrementada a cada envio (dois envios ao mesmo tempo: o segundo recebe 409)
+    versao = Column(Integer, nullable=False, default=0)
+
+
+class ComissaoLedgerVenda(Base):
+    """Estado de cada venda do período, pela chave (Nº Pedido, Nº Protocolo).
+
+    Vendas que não contam (status diferente de PAGO, fora do período...) também
+    ficam aqui, sem parceiros, para que uma linha igual não seja processada de novo.
+    """
+    __tablename__ = "comissao_ledger_vendas"
+    __table_args__ = (
+        UniqueConstraint("ledger_id", "numero_pedido", "numero_protocolo", name="uq_comissao_ledger_venda"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    ledger_id = Column(Integer, ForeignKey("comissao_ledgers.id", ondelete="CASCADE"), nullable=False)
+    numero_pedido = Column(String(255), nullable=False)
+    numero_protocolo = Column(String(255), nullable=False)
+    # Hash das colunas usadas da linha: se mudar (status, valor...), a venda é processada de novo
+    linha_hash = Column(BigInteger, nullable=False)
+    # Parceiros creditados (CPF/CNPJ só com números; vazio = não creditado)
+    vendedor_cnpj_cpf = Column(String(32))
+    contador_cnpj_cpf = Column(String(32))
+    valor_centavos = Column(BigInteger, nullable=False)
+    comissao_vendedor_centavos = Column(BigInteger, nullable=False)
+    comissao_contador_centavos = Column(BigInteger, nullable=False)
+    comissao_renovacao_centavos = Column(BigInteger, nullable=False)
+    is_renovacao = Column(Boolean, nullable=False)
+
+
+class ComissaoLedgerTotal(Base):
+    """Totais correntes de cada vendedor/contador no período."""
+    __tablename__ = "comissao_ledger_totais"
+    __table_args__ = (
+        UniqueConstraint("ledger_id", "tipo", "cnpj_cpf", name="uq_comissao_ledger_total"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    ledger_id = Column(Integer, ForeignKey("comissao_ledgers.id", ondelete="CASCADE"), nullable=False)
+    tipo = Column(String(10), nullable=False)
+    cnpj_cpf = Column(String(32), nullable=False)
+    nome = Column(String(255), nullable=False)
+    faixa_comissao = Column(String(255), nullable=False)
+    quantidade_vendas = Column(Integer, nullable=False)
+    total_vendas_centavos = Column(BigInteger, nullable=False)
+    total_comissao_centavos = Column(BigInteger, nullable=False)
+    total_comissao_renovacao_centavos = Column(BigInteger, nullable=False)
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException, UploadFile, File, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import Any, List, Optional, Tuple
 
 from .. import crud, models, schemas
 from ..database import get_db
 from ..auth import get_current_active_user
+from ..search import agente_search_index
+from .utils import MAX_PAGE_SIZE, set_next_cursor
+from .importacao import build_import_report, json_import_records, parse_import_upload, validate_import_rows, written_rows_results
 
 router = APIRouter(
     prefix="/agentes",
@@ -30,14 +33,51 @@ async def create_agente(
 
 @router.get("/", response_model=List[schemas.Agente])
 async def read_agentes(
-    skip: int = 0, 
-    limit: int = 100, 
+    response: Response,
+    cursor: Optional[int] = Query(None, description="Id do último agente da página anterior (header X-Next-Cursor)"),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    localidade_id: Optional[int] = None,
+    codigo_localidade: Optional[str] = None,
+    nome: Optional[str] = Query(None, description="Prefixo do nome"),
     db: AsyncSession = Depends(get_db)
 ):
-    agentes = await crud.get_agentes(db, skip=skip, limit=limit)
+    agentes = await crud.get_agentes(
+        db, after_id=cursor, limit=limit, localidade_id=localidade_id,
+        codigo_localidade=codigo_localidade, nome_prefix=nome
+    )
+    set_next_cursor(response, agentes, limit)
+    return agentes
+
+
+@router.get("/com-localidade", response_model=List[schemas.AgenteComLocalidade])
+async def read_agentes_com_localidade(
+    response: Response,
+    cursor: Optional[int] = Query(None, description="Id do último agente da página anterior (header X-Next-Cursor)"),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    localidade_id: Optional[int] = None,
+    codigo_localidade: Optional[str] = None,
+    nome: Optional[str] = Query(None, description="Prefixo do nome"),
+    db: AsyncSession = Depends(get_db)
+):
+    agentes = await crud.get_agentes(
+        db, after_id=cursor, limit=limit, localidade_id=localidade_id,
+        codigo_localidade=codigo_localidade, nome_prefix=nome, with_localidade=True
+    )
+    set_next_cursor(response, agentes, limit)
     return agentes
 
 
+@router.get("/busca", response_model=List[schemas.AgenteComLocalidade])
+async def buscar_agentes(
+    q: str = Query(..., min_length=1, description="Parte do nome (sem diferenciar acentos) ou início do CPF"),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    await agente_search_index.ensure_loaded(db)
+    agente_ids = agente_search_index.search(q, limit=limit)
+    return await crud.get_agentes_by_ids(db, agente_ids)
+
+
 @router.get("/{agente_id}/localidade", response_model=schemas.AgenteWithLocalidade)
 async def read_agente_com_localidade(
     agente_id: int, 
@@ -70,4 +110,75 @@ async def atualizar_localidade_agente(
         raise HTTPException(status_code=500, detail="Erro ao atualizar a localidade do agente")
     
     db_agente_com_localidade = await crud.get_agente_with_localidade(db, agente_id=updated_agente.id)
-    return db_agente_com_localidade
\ No newline at end of file
+    return db_agente_com_localidade
+
+
+# --- Importação em lote ---
+
+# Nomes aceitos no header do arquivo (normalizados) para cada campo
+AGENTE_IMPORT_COLUMNS = {
+    "nome": ["nome", "nome_agente", "nome_agente_validacao"],
+    "cpf": ["cpf", "cpf_agente", "cpf_agente_validacao"],
+    "localidade_codigo": ["localidade_codigo", "codigo_localidade", "localidade"],
+}
+
+
+def normalize_cpf(cpf: str) -> str:
+    """Mantém só os dígitos; completa os zeros à esquerda que o Excel remove de CPFs numéricos."""
+    digits = "".join(ch for ch in str(cpf) if ch.isdigit())
+    return digits.zfill(11) if len(digits) >= 9 else digits
+
+
+async def import_agentes(db: AsyncSession, records: List[Tuple[int, dict]]) -> schemas.ImportReport:
+    """Valida os agentes em memória e grava todos de uma vez (insere ou atualiza pelo CPF)."""
+    for _, record in records:
+        if not isinstance(record, dict):
+            continue
+        record["nome"] = str(record.get("nome") or "").strip()
+        record["cpf"] = normalize_cpf(record.get("cpf") or "")
+        record["localidade_codigo"] = str(record.get("localidade_codigo") or "").strip() or None
+
+    # Todas as localidades citadas são resolvidas numa única consulta
+    codigos = {
+        record["localidade_codigo"] for _, record in records
+        if isinstance(record, dict) and record["localidade_codigo"]
+    }
+    localidade_ids = await crud.get_localidade_ids_by_codigos(db, list(codigos))
+
+    def check(agente: schemas.AgenteImport):
+        if not agente.nome:
+            return "Nome do agente não informado."
+        if len(agente.cpf) != 11:
+            return "CPF inválido."
+        if agente.localidade_codigo and agente.localidade_codigo not in localidade_ids:
+            return f"Localidade {agente.localidade_codigo} não encontrada."
+        return None
+
+    valid, errors = validate_import_rows(records, schemas.AgenteImport, "cpf", check)
+    existing_cpfs = await crud.get_existing_agente_cpfs(db, [cpf for _, cpf, _ in valid])
+    await crud.upsert_agentes(db, [
+        {
+            "nome": agente.nome,
+            "cpf": agente.cpf,
+            "localidade_id": localidade_ids.get(agente.localidade_codigo),
+        }
+        for _, _, agente in valid
+    ])
+    return build_import_report(errors + written_rows_results(valid, existing_cpfs))
+
+
+@router.post("/importar", response_model=schemas.ImportReport)
+async def importar_agentes(
+    agentes: List[Any] = Body(..., description="Lista de agentes (nome, cpf, localidade_codigo); linhas inválidas voltam como erro no relatório"),
+    db: AsyncSession = Depends(get_db)
+):
+    return await import_agentes(db, json_import_records(agentes))
+
+
+@router.post("/importar-arquivo", response_model=schemas.ImportReport)
+async def importar_agentes_arquivo(
+    arquivo: UploadFile = File(..., description="CSV ou XLSX com as colunas nome, cpf e localidade_codigo"),
+    db: AsyncSession = Depends(get_db)
+):
+    records = await parse_import_upload(arquivo, AGENTE_IMPORT_COLUMNS, required=["nome", "cpf"])
+    return await import_agentes(db, records)
@@ -3,7 +3,7 @@ from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 
-from .. import crud, models, schemas
+from .. import crud, schemas
 from ..database import get_db
 from ..auth import (
     authenticate_user, 
@@ -59,5 +59,30 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=schemas.User)
-async def read_users_me(current_user: models.User = Depends(get_current_active_user)):
-    return current_user
\ No newline at end of file
+async def read_users_me(current_user: schemas.User = Depends(get_current_active_user)):
+    return current_user
+
+async def _set_user_active(db: AsyncSession, username: str, is_active: bool):
+    db_user = await get_user_by_username(db, username=username)
+    if db_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    return await crud.set_user_active(db, db_user, is_active)
+
+@router.post("/users/{username}/deactivate", response_model=schemas.User)
+async def deactivate_user(
+    username: str,
+    db: AsyncSession = Depends(get_db),
+    _: bool = Depends(verify_admin_token)
+):
+    return await _set_user_active(db, username, False)
+
+@router.post("/users/{username}/activate", response_model=schemas.User)
+async def activate_user(
+    username: str,
+    db: AsyncSession = Depends(get_db),
+    _: bool = Depends(verify_admin_token)
+):
+    return await _set_user_active(db, username, True)
@@ -1,28 +1,67 @@
 # routers/comissao.py
-import csv
-import io
+import math
 import re
+from array import array
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+from itertools import compress, islice
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form, Request, Response
+from pydantic import BaseModel, TypeAdapter
+from pydantic_core import to_json
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.requests import ClientDisconnect
 from unidecode import unidecode
 
+from .. import crud
+from ..admission import admission_controller, estimate_memory
 from ..auth import get_current_active_user
+from ..config import settings
+from ..database import get_db
+from ..instrumentation import add_rows, stage
 from ..schemas import SellerInfo, ContadorInfo, SaleInfo, RenewalPartnerInfo, ComissaoResponse
+from . import columnar_reader, compressed, csv_reader
+from .upload_stream import MultipartStream, StreamedPart, consume_in_thread
+from .utils import new_temp_path, remove_files, run_in_process_pool, spool_upload_to_disk_async
 
 RENEWAL_PARTNER_CPF_CNPJ = "34151313001"
 
+# Sales rows handed to the accumulators at a time while the upload streams in
+STREAM_SALES_BATCH_SIZE = 1000
+
+# Text fields accepted by POST /calcular-comissao/stream
+STREAM_FORM_FIELDS = ("data_inicio", "data_fim", "vendas_membro", "parceiros_membro", "salvar", "duplicadas")
+
+# Values of the salvar field read as true in POST /calcular-comissao/stream
+FORM_TRUE_VALUES = ("1", "true", "on", "yes", "sim")
+
+# Sales serialized per call by iter_model_json
+JSON_SALES_CHUNK_SIZE = 5000
+
+_SALES_ADAPTER = TypeAdapter(List[SaleInfo])
+
+CENT = Decimal("0.01")
+
+# What to do with sales repeated in the vendas file (same Nº Pedido / Nº Protocolo)
+DEDUP_FIRST = "first"
+DEDUP_LAST = "last"
+DEDUP_ERROR = "error"
+DEDUP_POLICIES = (DEDUP_FIRST, DEDUP_LAST, DEDUP_ERROR)
+DEDUP_POLICY_PATTERN = f"^({'|'.join(DEDUP_POLICIES)})$"
+
 router = APIRouter(
     tags=["Comissão"],
     dependencies=[Depends(get_current_active_user)]
 )
 
 
-def parse_commission_percentage(faixa_comissao: str) -> Optional[float]:
-    """Extract commission percentage from 'Faixa de Comissão' field.
+def parse_commission_bps(faixa_comissao: str) -> Optional[int]:
+    """Extract the commission rate from 'Faixa de Comissão' as integer basis points.
     
     Accepts formats like: "10%", "20%", "Faixa 20%", "30 VENDIDO 25 EMITIDO", etc.
-    Returns the percentage as a float (e.g., 0.10 for 10%), or None if invalid.
+    Returns the rate in basis points (e.g., 1000 for 10%, 2050 for "20,5%"), or None if invalid.
+    Finer rates are rounded half-up to the basis point.
     """
     if not faixa_comissao or faixa_comissao.strip() == "-":
         return None
@@ -39,12 +78,9 @@ def parse_commission_percentage(faixa_comissao: str) -> Optional[float]:
     for pattern in patterns:
         match = re.search(pattern, text)
         if match:
-            try:
-                percentage = float(match.group(1).replace(',', '.'))
-                if 0 <= percentage <= 100:
-                    return percentage / 100.0
-            except ValueError:
-                continue
+            percentage = Decimal(match.group(1).replace(',', '.'))
+            if 0 <= percentage <= 100:
+                return int((percentage * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
     
     return None
 
@@ -71,17 +107,61 @@ def parse_date(date_str: str) -> Optional[datetime]:
     return None
 
 
-def parse_float(value: str) -> float:
-    """Parse float value, handling Brazilian format (comma as decimal separator)."""
-    if not value or value.strip() == "":
-        return 0.0
+def parse_cents(value) -> int:
+    """Parse a sale amount into integer cents.
+    
+    Strings use the Brazilian format ("1.234,56": dots are thousands separators,
+    the comma is the decimal separator) and are read digit by digit, without going
+    through float. Typed amounts from Parquet/Arrow come in as float. Amounts with
+    more than two decimals are rounded half-up to the cent; invalid values give 0.
+    """
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return 0
+        cents = round(value * 100)
+        if abs(value * 100 - cents) < 1e-6:
+            return cents
+        return int(Decimal(repr(value)).quantize(CENT, rounding=ROUND_HALF_UP).scaleb(2))
+    if not value:
+        return 0
     
-    # Replace comma with dot and remove spaces
-    value = value.strip().replace(".", "").replace(",", ".")
+    text = value.strip().replace(".", "")
+    integer, comma, fraction = text.partition(",")
+    if integer.isdecimal() and (not comma or (fraction.isdecimal() and len(fraction) <= 2)):
+        return int(integer) * 100 + (int(fraction.ljust(2, "0")) if comma else 0)
+    
+    # Signs, extra decimals, exponents...: same reading as before, rounded to the cent
     try:
-        return float(value)
-    except ValueError:
-        return 0.0
+        amount = Decimal(text.replace(",", "."))
+    except InvalidOperation:
+        return 0
+    if not amount.is_finite():
+        return 0
+    return int(amount.quantize(CENT, rounding=ROUND_HALF_UP).scaleb(2))
+
+
+def apply_rate(cents: int, rate_bps: int) -> int:
+    """Commission in cents for ``cents`` at ``rate_bps`` basis points.
+    
+    This is the engine's only rounding step: each sale's commission is rounded
+    half-up (away from zero) to the cent; totals are exact sums of those values.
+    """
+    product = cents * rate_bps
+    if product >= 0:
+        return (product + 5000) // 10000
+    return -((5000 - product) // 10000)
+
+
+def to_cents(amount: float) -> int:
+    """Cents of an amount produced by the engine (cents / 100), recovered exactly."""
+    return round(amount * 100)
+
+
+def format_cents(cents: int) -> str:
+    """Exact decimal text of an amount in cents (e.g., 123456 -> "1234.56")."""
+    sign = "-" if cents < 0 else ""
+    whole, part = divmod(abs(cents), 100)
+    return f"{sign}{whole}.{part:02d}"
 
 
 def normalize_cpf_cnpj(doc: str) -> str:
@@ -91,36 +171,48 @@ def normalize_cpf_cnpj(doc: str) -> str:
     return doc.strip().replace(".", "").replace("-", "").replace("/", "").replace(" ", "")
 
 
-def parse_csv_file(file: UploadFile) -> Tuple[List[Dict[str, str]], Dict[str, str]]:
-    """Parse CSV file with semicolon delimiter and return rows and header map.
-    
+def read_csv_header(lines: Iterator[bytes]) -> Tuple[List[str], Dict[str, str]]:
+    """Read the header of a semicolon-delimited CSV from its lines (see csv_reader).
+
+    The remaining lines of the iterator are the data rows.
+
     Returns:
-        - rows: List of dictionaries where keys are the original header names
+        - header: the original header names, in file order
         - header_map: Dictionary mapping normalized header names to original header names
     """
-    content = file.file.read()
-    if isinstance(content, bytes):
-        content = content.decode('utf-8-sig')  # Handle BOM
-    
-    csv_reader = csv.DictReader(io.StringIO(content), delimiter=';')
-    
-    # Get headers
-    headers = csv_reader.fieldnames
-    if not headers:
+    header = csv_reader.read_header(lines)
+    if not header:
         raise HTTPException(status_code=400, detail="CSV file has no headers")
-    
-    # Create header map (normalized -> original)
+    return header, build_header_map(header)
+
+
+def build_header_map(header: List[str]) -> Dict[str, str]:
+    """Map normalized header names to original header names."""
     header_map = {}
-    for header in headers:
-        normalized = unidecode(header.strip().lower())
-        header_map[normalized] = header
-    
-    # Read all rows
-    rows = []
-    for row in csv_reader:
-        rows.append(row)
-    
-    return rows, header_map
+    for name in header:
+        normalized = unidecode(name.strip().lower())
+        header_map[normalized] = name
+    return header_map
+
+
+def column_indices(header: List[str], column_names: Sequence[Optional[str]]) -> List[Optional[int]]:
+    """Resolve header names into column positions (None for missing columns)."""
+    # Like DictReader, a repeated header name refers to its last column
+    positions = {name: index for index, name in enumerate(header)}
+    return [positions.get(name) if name is not None else None for name in column_names]
+
+
+def project_rows(
+    lines: Iterator[bytes],
+    header: List[str],
+    column_names: Sequence[Optional[str]]
+) -> List[Tuple[str, ...]]:
+    """Keep only the given columns of each row, as tuples of stripped strings.
+
+    The column indices are resolved from the header once, so the rows never
+    carry the other columns of the export (see csv_reader.iter_projected_rows).
+    """
+    return list(csv_reader.iter_projected_rows(lines, column_indices(header, column_names)))
 
 
 def get_header_name(headers_map: Dict[str, str], header_name: str) -> Optional[str]:
@@ -176,18 +268,39 @@ def get_parceiros_column_names(headers_map: Dict[str, str]) -> Dict[str, str]:
     }
 
 
-def validate_columns(vendas_cols: Dict[str, Optional[str]], parceiros_cols: Dict[str, Optional[str]]):
-    """Validate that all required columns are present."""
+# Fields kept from each CSV row (see project_rows), in tuple order
+VENDAS_FIELDS = (
+    'numero_pedido', 'numero_protocolo', 'data_venda', 'valor_venda', 'status_financeiro',
+    'doc_vendedor', 'usuario_criacao_pedido', 'produto', 'cliente', 'doc_cliente',
+)
+PARCEIROS_FIELDS = ('tipo_parceiro', 'faixa_comissao', 'cnpj_cpf', 'nome_razao', 'gestor_01')
+
+# How each field is read from Parquet/Arrow inputs (CSV fields are always strings)
+VENDAS_KINDS = tuple(
+    columnar_reader.DATETIME if field == 'data_venda'
+    else columnar_reader.FLOAT if field == 'valor_venda'
+    else columnar_reader.TEXT
+    for field in VENDAS_FIELDS
+)
+PARCEIROS_KINDS = (columnar_reader.TEXT,) * len(PARCEIROS_FIELDS)
+
+
+def validate_vendas_columns(vendas_cols: Dict[str, Optional[str]]):
+    """Validate that all required vendas columns are present."""
     # usuario_criacao_pedido is optional (used for renewal detection)
     optional_vendas = {'usuario_criacao_pedido', 'produto', 'cliente', 'doc_cliente'}
     missing_vendas = [k for k, v in vendas_cols.items() if v is None and k not in optional_vendas]
-    missing_parceiros = [k for k, v in parceiros_cols.items() if v is None]
     
     if missing_vendas:
         raise HTTPException(
             status_code=400,
             detail=f"Colunas faltando no CSV de vendas: {', '.join(missing_vendas)}"
         )
+
+
+def validate_parceiros_columns(parceiros_cols: Dict[str, Optional[str]]):
+    """Validate that all required parceiros columns are present."""
+    missing_parceiros = [k for k, v in parceiros_cols.items() if v is None]
     
     if missing_parceiros:
         raise HTTPException(
@@ -196,32 +309,76 @@ def validate_columns(vendas_cols: Dict[str, Optional[str]], parceiros_cols: Dict
         )
 
 
+def validate_columns(vendas_cols: Dict[str, Optional[str]], parceiros_cols: Dict[str, Optional[str]]):
+    """Validate that all required columns are present."""
+    validate_vendas_columns(vendas_cols)
+    validate_parceiros_columns(parceiros_cols)
+
+
+class PartnerTotals:
+    """Running totals of every seller/contador, in integer cents.
+    
+    Each partner gets a slot in the int64 arrays (array('q')) when the partners
+    are built; its rate is parsed once, in basis points (None when the 'Faixa de
+    Comissão' is invalid). The response models only receive the totals at the
+    end (settle), as floats plus exact strings.
+    """
+
+    def __init__(self):
+        self.partners: List[BaseModel] = []
+        self.rates_bps: List[Optional[int]] = []
+        self.vendas = array("q")
+        self.comissao = array("q")
+        self.comissao_renovacao = array("q")
+
+    def add_partner(self, partner: BaseModel, rate_bps: Optional[int]) -> int:
+        """Register a seller/contador and return its slot."""
+        self.partners.append(partner)
+        self.rates_bps.append(rate_bps)
+        self.vendas.append(0)
+        self.comissao.append(0)
+        self.comissao_renovacao.append(0)
+        return len(self.partners) - 1
+
+    def settle(self):
+        """Copy the totals into the partners' response fields."""
+        for slot, partner in enumerate(self.partners):
+            set_totals(partner, self.vendas[slot], self.comissao[slot], self.comissao_renovacao[slot])
+
+
+def set_totals(partner: BaseModel, vendas_cents: int, comissao_cents: int, comissao_renovacao_cents: int):
+    """Fill a seller/contador's totals: float fields (as before) and exact strings."""
+    partner.total_vendas = vendas_cents / 100
+    partner.total_comissao = comissao_cents / 100
+    partner.total_comissao_renovacao = comissao_renovacao_cents / 100
+    partner.total_vendas_exato = format_cents(vendas_cents)
+    partner.total_comissao_exato = format_cents(comissao_cents)
+    partner.total_comissao_renovacao_exato = format_cents(comissao_renovacao_cents)
+
+
 def build_sellers_and_contadores(
-    parceiros_rows: List[Dict[str, str]],
-    parceiros_cols: Dict[str, str]
+    parceiros_rows: List[Tuple[str, ...]],
+    totals: PartnerTotals
 ) -> Tuple[Dict[str, SellerInfo], Dict[str, ContadorInfo], Dict[str, str], Dict[str, str]]:
-    """Build dictionaries of sellers and contadores from parceiros CSV.
+    """Build dictionaries of sellers and contadores from parceiros CSV rows (PARCEIROS_FIELDS order).
+    
+    Every seller/contador gets a slot in ``totals``; the dictionaries map to that slot.
     
     Returns:
-        - sellers_dict: Dict keyed by normalized CPF/CNPJ
-        - contadores_dict: Dict keyed by normalized CPF/CNPJ
+        - sellers_dict: (slot, SellerInfo) keyed by normalized CPF/CNPJ
+        - contadores_dict: (slot, ContadorInfo) keyed by normalized CPF/CNPJ
         - contador_to_seller: Maps contador CPF/CNPJ to seller CPF/CNPJ
         - seller_name_to_cpf: Maps seller name to CPF/CNPJ (for Gestor 01 lookup)
     """
-    sellers_dict: Dict[str, SellerInfo] = {}  # Key: normalized CPF/CNPJ
-    contadores_dict: Dict[str, ContadorInfo] = {}  # Key: normalized CPF/CNPJ
+    sellers_dict: Dict[str, Tuple[int, SellerInfo]] = {}  # Key: normalized CPF/CNPJ
+    contadores_dict: Dict[str, Tuple[int, ContadorInfo]] = {}  # Key: normalized CPF/CNPJ
     contador_cpf_cnpj_to_gestor_name: Dict[str, str] = {}  # Maps contador CPF/CNPJ to gestor name
     contador_to_seller: Dict[str, str] = {}  # Maps contador CPF/CNPJ to seller CPF/CNPJ
     seller_name_to_cpf: Dict[str, str] = {}  # Maps seller name to CPF/CNPJ
 
     
     # First pass: collect all sellers and contadores
-    for row in parceiros_rows:
-        tipo = row.get(parceiros_cols['tipo_parceiro'], "").strip() if parceiros_cols['tipo_parceiro'] else ""
-        faixa = row.get(parceiros_cols['faixa_comissao'], "").strip() if parceiros_cols['faixa_comissao'] else ""
-        cnpj_cpf_raw = row.get(parceiros_cols['cnpj_cpf'], "").strip() if parceiros_cols['cnpj_cpf'] else ""
-        nome = row.get(parceiros_cols['nome_razao'], "").strip() if parceiros_cols['nome_razao'] else ""
-        gestor_01 = row.get(parceiros_cols['gestor_01'], "").strip() if parceiros_cols['gestor_01'] else ""
+    for tipo, faixa, cnpj_cpf_raw, nome, gestor_01 in parceiros_rows:
 
         nome = nome.split(" - ")[0].strip()
         
@@ -230,12 +387,12 @@ def build_sellers_and_contadores(
         if not cnpj_cpf_normalized:
             continue  # Skip if no CPF/CNPJ
         
-        # Extract commission percentage
-        commission_pct = parse_commission_percentage(faixa)
+        # Extract commission rate
+        commission_bps = parse_commission_bps(faixa)
         
         if tipo.lower() == "contador":
             # This is a contador
-            if commission_pct is None:
+            if commission_bps is None:
                 continue  # Skip if invalid commission format
             
             contador = ContadorInfo(
@@ -246,7 +403,7 @@ def build_sellers_and_contadores(
                 total_comissao=0.0,
                 vendas=[]
             )
-            contadores_dict[cnpj_cpf_normalized] = contador
+            contadores_dict[cnpj_cpf_normalized] = (totals.add_partner(contador, commission_bps), contador)
             
             # Link contador to seller via Gestor 01 (store gestor name for now)
             if gestor_01:
@@ -255,10 +412,7 @@ def build_sellers_and_contadores(
         else:
             # This might be a seller (or vendedor)
 
-            if commission_pct is None:
-                commission_pct = 0.0
-                # print(f"commission_pct does not follow the expected format: {faixa}")
-            
+            # A seller with an invalid commission format is listed, but its sales are skipped
             seller = SellerInfo(
                 nome=nome,
                 cnpj_cpf=cnpj_cpf_raw,
@@ -268,7 +422,7 @@ def build_sellers_and_contadores(
                 contadores=[],
                 vendas=[]
             )
-            sellers_dict[cnpj_cpf_normalized] = seller
+            sellers_dict[cnpj_cpf_normalized] = (totals.add_partner(seller, commission_bps), seller)
             seller_name_to_cpf[nome] = cnpj_cpf_normalized
     
     # Link contadores to sellers 
@@ -276,26 +430,22 @@ def build_sellers_and_contadores(
         seller_cpf = seller_name_to_cpf.get(gestor_name)
         if seller_cpf:
             contador_to_seller[contador_cpf_cnpj] = seller_cpf
-            sellers_dict[seller_cpf].contadores.append(contadores_dict[contador_cpf_cnpj])
+            sellers_dict[seller_cpf][1].contadores.append(contadores_dict[contador_cpf_cnpj][1])
     
     return sellers_dict, contadores_dict, contador_to_seller, seller_name_to_cpf
 
 
 def find_renewal_partner_info(
-    parceiros_rows: List[Dict[str, str]],
-    parceiros_cols: Dict[str, str]
+    parceiros_rows: List[Tuple[str, ...]]
 ) -> Optional[Tuple[str, str, str]]:
     """Find renewal partner info from parceiros CSV.
     
     Returns: (name, cpf_cnpj_raw, faixa_comissao) or None if not found.
     """
-    for row in parceiros_rows:
-        cnpj_cpf_raw = row.get(parceiros_cols['cnpj_cpf'], "").strip() if parceiros_cols['cnpj_cpf'] else ""
+    for _, faixa, cnpj_cpf_raw, nome, _ in parceiros_rows:
         cnpj_cpf_normalized = normalize_cpf_cnpj(cnpj_cpf_raw)
         if cnpj_cpf_normalized == RENEWAL_PARTNER_CPF_CNPJ:
-            nome = row.get(parceiros_cols['nome_razao'], "").strip() if parceiros_cols['nome_razao'] else ""
             nome = nome.split(" - ")[0].strip()
-            faixa = row.get(parceiros_cols['faixa_comissao'], "").strip() if parceiros_cols['faixa_comissao'] else ""
             return nome, cnpj_cpf_raw, faixa
     return None
 
@@ -312,8 +462,11 @@ def is_renewal_sale(
     return normalized_name in normalized_usuario
 
 
-def find_seller(doc_vendedor: str, sellers_dict: Dict[str, SellerInfo]) -> Optional[SellerInfo]:
-    """Find seller by CPF/CNPJ (normalized)."""
+def find_seller(
+    doc_vendedor: str,
+    sellers_dict: Dict[str, Tuple[int, SellerInfo]]
+) -> Optional[Tuple[int, SellerInfo]]:
+    """Find seller (slot, info) by CPF/CNPJ (normalized)."""
     doc_normalized = normalize_cpf_cnpj(doc_vendedor)
     if not doc_normalized:
         return None
@@ -322,204 +475,187 @@ def find_seller(doc_vendedor: str, sellers_dict: Dict[str, SellerInfo]) -> Optio
 
 def find_contador(
     doc_vendedor: str,
-    contadores_dict: Dict[str, ContadorInfo]
-) -> Optional[ContadorInfo]:
-    """Find contador by CPF/CNPJ (normalized)."""
+    contadores_dict: Dict[str, Tuple[int, ContadorInfo]]
+) -> Optional[Tuple[int, ContadorInfo]]:
+    """Find contador (slot, info) by CPF/CNPJ (normalized)."""
     doc_normalized = normalize_cpf_cnpj(doc_vendedor)
     if not doc_normalized:
         return None
     return contadores_dict.get(doc_normalized)
 
 
-def process_sale(
-    row: Dict[str, str],
-    vendas_cols: Dict[str, str],
+def evaluate_sale(
+    row: Tuple[str, ...],
     inicio: datetime,
     fim: datetime,
-    sellers_dict: Dict[str, SellerInfo],
-    contadores_dict: Dict[str, ContadorInfo],
+    sellers_dict: Dict[str, Tuple[int, SellerInfo]],
+    contadores_dict: Dict[str, Tuple[int, ContadorInfo]],
     contador_to_seller: Dict[str, str],
+    totals: PartnerTotals,
     renewal_partner_name: Optional[str] = None,
-    renewal_commission_pct: Optional[float] = None
-):
-    """Process a single sale and update seller/contador totals.
+    renewal_commission_bps: Optional[int] = None
+) -> Optional[Tuple]:
+    """Work out what a single sale (VENDAS_FIELDS order, VENDAS_KINDS types) adds to the totals.
     
     Logic:
     - If 'Doc. Vendedor' matches a contador CPF/CNPJ, the sale has both a contador and a seller (via Gestor 01)
     - If 'Doc. Vendedor' matches a seller CPF/CNPJ, the sale only has a seller (no contador)
     - If 'Usuário de Criação do pedido' contains the renewal partner's name, the sale is a renewal
+    
+    Amounts are handled in integer cents (see apply_rate for the rounding rule).
+    Returns None when the sale counts for nobody, else the contribution
+    (valor_cents, is_renovacao, renovacao_cents, contador_slot, contador_commission_cents,
+    seller_slot, seller_commission_cents); contador_slot/seller_slot are None when
+    that partner is not credited.
     """
     # Get field values
-    status_financeiro = row.get(vendas_cols['status_financeiro'], "").strip() if vendas_cols['status_financeiro'] else ""
-    data_venda_str = row.get(vendas_cols['data_venda'], "").strip() if vendas_cols['data_venda'] else ""
-    doc_vendedor = row.get(vendas_cols['doc_vendedor'], "").strip() if vendas_cols['doc_vendedor'] else ""
-    numero_pedido = row.get(vendas_cols['numero_pedido'], "").strip() if vendas_cols['numero_pedido'] else ""
-    numero_protocolo = row.get(vendas_cols['numero_protocolo'], "").strip() if vendas_cols['numero_protocolo'] else ""
-    valor_venda_str = row.get(vendas_cols['valor_venda'], "").strip() if vendas_cols['valor_venda'] else ""
-    usuario_criacao_pedido = ""
-    if vendas_cols.get('usuario_criacao_pedido'):
-        usuario_criacao_pedido = row.get(vendas_cols['usuario_criacao_pedido'], "").strip()
-    produto = ""
-    if vendas_cols.get('produto'):
-        produto = row.get(vendas_cols['produto'], "").strip()
-    cliente = ""
-    if vendas_cols.get('cliente'):
-        cliente = row.get(vendas_cols['cliente'], "").strip()
-    doc_cliente = ""
-    if vendas_cols.get('doc_cliente'):
-        doc_cliente = row.get(vendas_cols['doc_cliente'], "").strip()
+    # data_venda/valor_venda are strings from CSVs, or already typed from Parquet/Arrow (columnar_reader)
+    (numero_pedido, numero_protocolo, data_venda_value, valor_venda_value, status_financeiro,
+     doc_vendedor, usuario_criacao_pedido, produto, cliente, doc_cliente) = row
     
     # Filter by Status Financeiro
     if status_financeiro.upper() != "PAGO":
-        return
+        return None
     
     # Filter by date
-    data_venda = parse_date(data_venda_str)
+    data_venda = data_venda_value if isinstance(data_venda_value, datetime) else parse_date(data_venda_value)
     if not data_venda or data_venda < inicio or data_venda > fim:
-        return
+        return None
     
-    valor_venda = parse_float(valor_venda_str)
-    if valor_venda <= 0:
-        return
+    valor_cents = parse_cents(valor_venda_value)
+    if valor_cents <= 0:
+        return None
     
     if not doc_vendedor:
-        return  # No document, skip
+        return None  # No document, skip
     
     # Determine if this is a renewal sale
     # Do not consider as renewal when the seller is the renewal partner
     sale_is_renovacao = False
-    sale_comissao_renovacao = 0.0
+    renovacao_cents = 0
     doc_vendedor_normalized = normalize_cpf_cnpj(doc_vendedor)
     seller_is_renewal_partner = doc_vendedor_normalized == RENEWAL_PARTNER_CPF_CNPJ
-    if renewal_partner_name and renewal_commission_pct is not None and not seller_is_renewal_partner:
+    if renewal_partner_name and renewal_commission_bps is not None and not seller_is_renewal_partner:
         sale_is_renovacao = is_renewal_sale(usuario_criacao_pedido, renewal_partner_name)
         if sale_is_renovacao:
-            sale_comissao_renovacao = valor_venda * renewal_commission_pct
+            renovacao_cents = apply_rate(valor_cents, renewal_commission_bps)
     
     # Check if vendedor is a contador first (by CPF/CNPJ)
-    contador = find_contador(doc_vendedor, contadores_dict)
+    contador_entry = find_contador(doc_vendedor, contadores_dict)
+    contador_slot = None
+    contador_commission_cents = 0
     
-    if contador:
+    if contador_entry:
         # Vendedor is a contador - sale has both contador and seller
+        contador_slot = contador_entry[0]
+        
         # Find the seller associated with this contador via Gestor 01
         seller_cpf = contador_to_seller.get(doc_vendedor_normalized)
         if not seller_cpf:
-            return  # Contador has no associated seller, skip
+            return None  # Contador has no associated seller, skip
         
         # Find the seller
-        seller = sellers_dict.get(seller_cpf)
-        if not seller:
-            return  # Seller not found, skip
+        seller_entry = sellers_dict.get(seller_cpf)
+        if not seller_entry:
+            return None  # Seller not found, skip
         
         # Calculate contador commission
-        contador_commission_pct = parse_commission_percentage(contador.faixa_comissao)
-        if contador_commission_pct is None:
-            return
-        
-        contador_commission = valor_venda * contador_commission_pct
-        
-        # Create sale info for contador
-        contador_sale_info = SaleInfo(
-            numero_pedido=numero_pedido,
-            numero_protocolo=numero_protocolo,
-            valor_venda=valor_venda,
-            comissao=contador_commission,
-            is_renovacao=sale_is_renovacao,
-            comissao_renovacao=sale_comissao_renovacao,
-            produto=produto,
-            cliente=cliente,
-            doc_cliente=doc_cliente
-        )
-        
-        contador.vendas.append(contador_sale_info)
-        contador.total_vendas += valor_venda
-        contador.total_comissao += contador_commission
-        if sale_is_renovacao:
-            contador.total_comissao_renovacao += sale_comissao_renovacao
-        
-        # Calculate seller commission
-        seller_commission_pct = parse_commission_percentage(seller.faixa_comissao)
-        if seller_commission_pct is None:
-            return
-        
-        seller_commission = valor_venda * seller_commission_pct
-        
-        # Create sale info for seller
-        seller_sale_info = SaleInfo(
-            numero_pedido=numero_pedido,
-            numero_protocolo=numero_protocolo,
-            valor_venda=valor_venda,
-            comissao=seller_commission,
-            is_renovacao=sale_is_renovacao,
-            comissao_renovacao=sale_comissao_renovacao,
-            produto=produto,
-            cliente=cliente,
-            doc_cliente=doc_cliente
-        )
-        
-        seller.vendas.append(seller_sale_info)
-        seller.total_vendas += valor_venda
-        seller.total_comissao += seller_commission
-        if sale_is_renovacao:
-            seller.total_comissao_renovacao += sale_comissao_renovacao
+        contador_commission_bps = totals.rates_bps[contador_slot]
+        if contador_commission_bps is None:
+            return None
+        contador_commission_cents = apply_rate(valor_cents, contador_commission_bps)
         
     else:
         # Vendedor is a seller - sale only has seller (no contador)
-        seller = find_seller(doc_vendedor, sellers_dict)
-        if not seller:
-            return  # Seller not found, skip
-        
-        # Calculate seller commission
-        seller_commission_pct = parse_commission_percentage(seller.faixa_comissao)
-        if seller_commission_pct is None:
-            return
-        
-        seller_commission = valor_venda * seller_commission_pct
-        
-        # Create sale info
+        seller_entry = find_seller(doc_vendedor, sellers_dict)
+        if not seller_entry:
+            return None  # Seller not found, skip
+    
+    # Calculate seller commission (a seller without a valid rate is not credited)
+    seller_slot = seller_entry[0]
+    seller_commission_bps = totals.rates_bps[seller_slot]
+    if seller_commission_bps is None:
+        if contador_slot is None:
+            return None
+        seller_slot = None
+        seller_commission_cents = 0
+    else:
+        seller_commission_cents = apply_rate(valor_cents, seller_commission_bps)
+    
+    return (
+        valor_cents, sale_is_renovacao, renovacao_cents,
+        contador_slot, contador_commission_cents, seller_slot, seller_commission_cents,
+    )
+
+
+def process_sale(
+    row: Tuple[str, ...],
+    inicio: datetime,
+    fim: datetime,
+    sellers_dict: Dict[str, Tuple[int, SellerInfo]],
+    contadores_dict: Dict[str, Tuple[int, ContadorInfo]],
+    contador_to_seller: Dict[str, str],
+    totals: PartnerTotals,
+    renewal_partner_name: Optional[str] = None,
+    renewal_commission_bps: Optional[int] = None
+):
+    """Process a single sale (see evaluate_sale) and update seller/contador totals and sales lists."""
+    contribution = evaluate_sale(
+        row, inicio, fim,
+        sellers_dict, contadores_dict, contador_to_seller, totals,
+        renewal_partner_name, renewal_commission_bps
+    )
+    if contribution is None:
+        return
+    (valor_cents, sale_is_renovacao, renovacao_cents,
+     contador_slot, contador_commission_cents, seller_slot, seller_commission_cents) = contribution
+    numero_pedido, numero_protocolo, _, _, _, _, _, produto, cliente, doc_cliente = row
+    valor_venda = valor_cents / 100
+    sale_comissao_renovacao = renovacao_cents / 100
+    
+    for slot, commission_cents in ((contador_slot, contador_commission_cents), (seller_slot, seller_commission_cents)):
+        if slot is None:
+            continue
         sale_info = SaleInfo(
             numero_pedido=numero_pedido,
             numero_protocolo=numero_protocolo,
             valor_venda=valor_venda,
-            comissao=seller_commission,
+            comissao=commission_cents / 100,
             is_renovacao=sale_is_renovacao,
             comissao_renovacao=sale_comissao_renovacao,
             produto=produto,
             cliente=cliente,
             doc_cliente=doc_cliente
         )
-        
-        # Add to seller
-        seller.vendas.append(sale_info)
-        seller.total_vendas += valor_venda
-        seller.total_comissao += seller_commission
-        if sale_is_renovacao:
-            seller.total_comissao_renovacao += sale_comissao_renovacao
+        totals.partners[slot].vendas.append(sale_info)
+        totals.vendas[slot] += valor_cents
+        totals.comissao[slot] += commission_cents
+        totals.comissao_renovacao[slot] += renovacao_cents
 
 
 def process_sales(
-    vendas_rows: List[Dict[str, str]],
-    vendas_cols: Dict[str, str],
+    vendas_rows: Iterable[Tuple[str, ...]],
     inicio: datetime,
     fim: datetime,
-    sellers_dict: Dict[str, SellerInfo],
-    contadores_dict: Dict[str, ContadorInfo],
+    sellers_dict: Dict[str, Tuple[int, SellerInfo]],
+    contadores_dict: Dict[str, Tuple[int, ContadorInfo]],
     contador_to_seller: Dict[str, str],
+    totals: PartnerTotals,
     renewal_partner_name: Optional[str] = None,
-    renewal_commission_pct: Optional[float] = None
+    renewal_commission_bps: Optional[int] = None
 ):
     """Process all sales and update seller/contador totals."""
     for row in vendas_rows:
         process_sale(
-            row, vendas_cols, inicio, fim,
-            sellers_dict, contadores_dict, contador_to_seller,
-            renewal_partner_name, renewal_commission_pct
+            row, inicio, fim,
+            sellers_dict, contadores_dict, contador_to_seller, totals,
+            renewal_partner_name, renewal_commission_bps
         )
 
 
-def filter_and_format_results(sellers_dict: Dict[str, SellerInfo]) -> List[SellerInfo]:
-    """Filter out sellers/contadores with no sales and return formatted results."""
-    result = list[SellerInfo](sellers_dict.values())
+def filter_and_format_results(sellers_dict: Dict[str, Tuple[int, SellerInfo]]) -> List[SellerInfo]:
+    """Filter out sellers/contadores with no sales and return formatted results (totals already settled)."""
+    result = [seller for _, seller in sellers_dict.values()]
     
     # Filter out sellers with no sales
     result = [s for s in result if s.total_vendas > 0]
@@ -531,6 +667,15 @@ def filter_and_format_results(sellers_dict: Dict[str, SellerInfo]) -> List[Selle
     return result
 
 
+def sum_cents(vendas: List[SaleInfo]) -> Tuple[int, int, int]:
+    """Exact (valor_venda, comissao, comissao_renovacao) sums of sales, in cents."""
+    return (
+        sum(to_cents(v.valor_venda) for v in vendas),
+        sum(to_cents(v.comissao) for v in vendas),
+        sum(to_cents(v.comissao_renovacao) for v in vendas),
+    )
+
+
 def build_renewal_partner_node(
     sellers: List[SellerInfo],
     renewal_partner_name: str,
@@ -542,8 +687,8 @@ def build_renewal_partner_node(
     Replicates the seller/contador tree but only including renewal sales.
     """
     renewal_sellers: List[SellerInfo] = []
-    partner_total_vendas = 0.0
-    partner_total_comissao = 0.0
+    partner_total_vendas = 0
+    partner_total_comissao = 0
     
     for seller in sellers:
         # Filter renewal sales for this seller
@@ -554,42 +699,42 @@ def build_renewal_partner_node(
         for contador in seller.contadores:
             renewal_contador_vendas = [v for v in contador.vendas if v.is_renovacao]
             if renewal_contador_vendas:
-                renewal_contadores.append(ContadorInfo(
+                renewal_contador = ContadorInfo(
                     nome=contador.nome,
                     cnpj_cpf=contador.cnpj_cpf,
                     faixa_comissao=contador.faixa_comissao,
-                    total_vendas=sum(v.valor_venda for v in renewal_contador_vendas),
-                    total_comissao=sum(v.comissao for v in renewal_contador_vendas),
-                    total_comissao_renovacao=sum(v.comissao_renovacao for v in renewal_contador_vendas),
+                    total_vendas=0.0,
+                    total_comissao=0.0,
                     vendas=renewal_contador_vendas
-                ))
+                )
+                contador_vendas, contador_comissao, contador_comissao_renovacao = sum_cents(renewal_contador_vendas)
+                set_totals(renewal_contador, contador_vendas, contador_comissao, contador_comissao_renovacao)
+                renewal_contadores.append(renewal_contador)
+                
+                # Accumulate partner totals (contador sales)
+                partner_total_vendas += contador_vendas
+                partner_total_comissao += contador_comissao_renovacao
         
         # Only include seller if it has renewal sales (direct or via contadores)
         if not renewal_vendas and not renewal_contadores:
             continue
         
-        seller_renewal_total_vendas = sum(v.valor_venda for v in renewal_vendas)
-        seller_renewal_total_comissao = sum(v.comissao for v in renewal_vendas)
-        seller_renewal_total_comissao_renovacao = sum(v.comissao_renovacao for v in renewal_vendas)
-        
         renewal_seller = SellerInfo(
             nome=seller.nome,
             cnpj_cpf=seller.cnpj_cpf,
             faixa_comissao=seller.faixa_comissao,
-            total_vendas=seller_renewal_total_vendas,
-            total_comissao=seller_renewal_total_comissao,
-            total_comissao_renovacao=seller_renewal_total_comissao_renovacao,
+            total_vendas=0.0,
+            total_comissao=0.0,
             contadores=renewal_contadores,
             vendas=renewal_vendas
         )
+        seller_vendas, seller_comissao, seller_comissao_renovacao = sum_cents(renewal_vendas)
+        set_totals(renewal_seller, seller_vendas, seller_comissao, seller_comissao_renovacao)
         renewal_sellers.append(renewal_seller)
         
-        # Accumulate partner totals (from direct sales + contador sales)
-        partner_total_vendas += seller_renewal_total_vendas
-        partner_total_comissao += seller_renewal_total_comissao_renovacao
-        for rc in renewal_contadores:
-            partner_total_vendas += rc.total_vendas
-            partner_total_comissao += rc.total_comissao_renovacao
+        # Accumulate partner totals (direct sales)
+        partner_total_vendas += seller_vendas
+        partner_total_comissao += seller_comissao_renovacao
     
     if not renewal_sellers:
         return None
@@ -598,80 +743,577 @@ def build_renewal_partner_node(
         nome=renewal_partner_name,
         cnpj_cpf=renewal_partner_cpf_cnpj,
         faixa_comissao=renewal_partner_faixa,
-        total_vendas=partner_total_vendas,
-        total_comissao=partner_total_comissao,
+        total_vendas=partner_total_vendas / 100,
+        total_comissao=partner_total_comissao / 100,
+        total_vendas_exato=format_cents(partner_total_vendas),
+        total_comissao_exato=format_cents(partner_total_comissao),
         sellers=renewal_sellers
     )
 
 
+def parse_comissao_csvs(
+    vendas_lines: Iterator[bytes],
+    parceiros_lines: Iterator[bytes]
+) -> Tuple[List[Tuple[str, ...]], List[Tuple[str, ...]]]:
+    """Read both CSVs, validate their columns and keep only the fields used in the calculation.
+
+    The lines come from csv_reader (open_csv_lines, open_chunk_lines).
+    Returns the vendas rows (VENDAS_FIELDS order) and parceiros rows (PARCEIROS_FIELDS order).
+    """
+    vendas_header, vendas_headers = read_csv_header(vendas_lines)
+    parceiros_header, parceiros_headers = read_csv_header(parceiros_lines)
+    
+    # Get column names
+    vendas_cols = get_vendas_column_names(vendas_headers)
+    parceiros_cols = get_parceiros_column_names(parceiros_headers)
+    
+    # Validate required columns (before reading the rows)
+    validate_columns(vendas_cols, parceiros_cols)
+    
+    vendas_rows = project_rows(vendas_lines, vendas_header, [vendas_cols[field] for field in VENDAS_FIELDS])
+    parceiros_rows = project_rows(
+        parceiros_lines, parceiros_header, [parceiros_cols[field] for field in PARCEIROS_FIELDS]
+    )
+    return vendas_rows, parceiros_rows
+
+
+def input_size(path: str, member: Optional[str] = None) -> int:
+    """Size of the input data once decompressed (used by the admission estimate)."""
+    columnar_format = columnar_reader.detect_file_columnar_format(path)
+    if columnar_format is not None:
+        return columnar_reader.expanded_size(path, columnar_format)
+    return compressed.expanded_size(path, member)
+
+
+@contextmanager
+def open_comissao_input(path: str, member: Optional[str] = None):
+    """Header and row reader of an input file saved on disk.
+
+    Accepts CSV (optionally gzip/zip/zstd, see csv_reader.open_csv_lines) and
+    Parquet/Arrow IPC (see columnar_reader). Yields (header, read_rows), where
+    read_rows(column_names, kinds) iterates over the projected row tuples.
+    """
+    columnar_format = columnar_reader.detect_file_columnar_format(path)
+    if columnar_format is not None:
+        header = columnar_reader.read_columnar_header(path, columnar_format)
+        if not header:
+            raise HTTPException(status_code=400, detail="Input file has no columns")
+        yield header, lambda column_names, kinds: columnar_reader.iter_columnar_rows(
+            path, columnar_format, column_names, kinds
+        )
+        return
+    with csv_reader.open_csv_lines(path, member) as lines:
+        header, _ = read_csv_header(lines)
+        yield header, lambda column_names, kinds: csv_reader.iter_projected_rows(
+            lines, column_indices(header, column_names)
+        )
+
+
+@contextmanager
+def open_streamed_input(part: StreamedPart, member: Optional[str] = None):
+    """Like open_comissao_input, for a multipart part that is still arriving.
+
+    CSVs are read as they arrive; Parquet/Arrow need the whole file (the
+    footer holds the schema), so they are written to disk first.
+    """
+    if columnar_reader.detect_columnar_format(part.head(8)) is None:
+        with csv_reader.open_chunk_lines(part.chunks(), member) as lines:
+            header, _ = read_csv_header(lines)
+            yield header, lambda column_names, kinds: csv_reader.iter_projected_rows(
+                lines, column_indices(header, column_names)
+            )
+        return
+    path = new_temp_path()
+    try:
+        with open(path, "wb") as f:
+            for chunk in part.chunks():
+                f.write(chunk)
+        with open_comissao_input(path) as opened:
+            yield opened
+    finally:
+        remove_files([path])
+
+
+def iter_model_json(value) -> Iterator[str]:
+    """Same JSON as model_dump_json(), produced in pieces.
+
+    A single model_dump_json() call over a million sales holds the GIL for
+    seconds; in the upload-stream thread that would stall the event loop.
+    Here sales lists are serialized a chunk at a time, so other threads run
+    between pieces.
+    """
+    if isinstance(value, BaseModel):
+        yield "{"
+        for position, name in enumerate(type(value).model_fields):
+            yield f'{"," if position else ""}"{name}":'
+            yield from iter_model_json(getattr(value, name))
+        yield "}"
+    elif isinstance(value, list) and value and isinstance(value[0], SaleInfo):
+        yield "["
+        for start in range(0, len(value), JSON_SALES_CHUNK_SIZE):
+            chunk = _SALES_ADAPTER.dump_json(value[start:start + JSON_SALES_CHUNK_SIZE])
+            yield ("," if start else "") + chunk[1:-1].decode()
+        yield "]"
+    elif isinstance(value, list):
+        yield "["
+        for position, item in enumerate(value):
+            if position:
+                yield ","
+            yield from iter_model_json(item)
+        yield "]"
+    else:
+        yield to_json(value).decode()
+
+
+def sale_key(row: Tuple) -> Optional[Tuple[str, str]]:
+    """The sale's normalized (Nº Pedido, Nº Protocolo); None when both are empty."""
+    numero_pedido = row[0].strip().upper()
+    numero_protocolo = row[1].strip().upper()
+    if not numero_pedido and not numero_protocolo:
+        return None
+    return numero_pedido, numero_protocolo
+
+
+class SaleDeduplicator:
+    """Collapses sales repeated in the vendas file (re-exports, merged exports...).
+
+    The set holds the normalized keys themselves, so a hash hit is always
+    confirmed by comparing the strings: two distinct sales are never merged and
+    the result does not depend on PYTHONHASHSEED. DEDUP_FIRST and DEDUP_ERROR
+    filter rows as they go by; DEDUP_LAST needs every row before it can tell
+    which copy is the last one (see dedupe_last).
+    """
+
+    def __init__(self, policy: str):
+        self.policy = policy
+        self.seen: Set[Tuple[str, str]] = set()
+        # Copies dropped so far
+        self.duplicates = 0
+
+    def filter(self, rows: Iterable[Tuple]) -> Iterator[Tuple]:
+        """Rows whose key was not seen before (DEDUP_FIRST / DEDUP_ERROR)."""
+        seen = self.seen
+        for row in rows:
+            key = sale_key(row)
+            if key is not None:
+                if key in seen:
+                    if self.policy == DEDUP_ERROR:
+                        raise HTTPException(
+                            status_code=400,
+                            detail=f"Venda repetida no arquivo de vendas: Nº Pedido '{row[0]}', Nº Protocolo '{row[1]}'"
+                        )
+                    self.duplicates += 1
+                    continue
+                seen.add(key)
+            yield row
+
+    def dedupe_last(self, rows: List[Tuple]) -> List[Tuple]:
+        """Rows keeping the last copy of each key, in file order (DEDUP_LAST)."""
+        seen = self.seen
+        keep = bytearray(len(rows))
+        # Walking backwards, the first copy met is the last one in the file
+        for index in range(len(rows) - 1, -1, -1):
+            key = sale_key(rows[index])
+            if key is None:
+                keep[index] = 1
+            elif key in seen:
+                self.duplicates += 1
+            else:
+                seen.add(key)
+                keep[index] = 1
+        return list(compress(rows, keep))
+
+
+class ComissaoCalculation:
+    """Commission accumulators: built from the partners, then fed with sales (all at once or in batches)."""
+
+    def __init__(
+        self,
+        parceiros_rows: List[Tuple[str, ...]],
+        inicio: datetime,
+        fim: datetime,
+        dedup_policy: str = DEDUP_FIRST
+    ):
+        self.inicio = inicio
+        self.fim = fim
+        self.dedup = SaleDeduplicator(dedup_policy)
+        # DEDUP_LAST: sales wait here until the whole file has arrived
+        self.held_sales: List[Tuple[str, ...]] = []
+        
+        # Build sellers and contadores dictionaries
+        with stage("build_partners"):
+            self.totals = PartnerTotals()
+            self.sellers_dict, self.contadores_dict, self.contador_to_seller, _ = build_sellers_and_contadores(
+                parceiros_rows, self.totals
+            )
+        
+        # Find renewal partner info
+        self.renewal_partner_name = None
+        self.renewal_partner_cpf_cnpj = ""
+        self.renewal_partner_faixa = ""
+        self.renewal_commission_bps = None
+        
+        renewal_info = find_renewal_partner_info(parceiros_rows)
+        if renewal_info:
+            self.renewal_partner_name, self.renewal_partner_cpf_cnpj, self.renewal_partner_faixa = renewal_info
+            self.renewal_commission_bps = parse_commission_bps(self.renewal_partner_faixa)
+
+    def dedupe(self, vendas_rows: Iterable[Tuple[str, ...]]) -> List[Tuple[str, ...]]:
+        """All the sales of a file without the repeated ones (see SaleDeduplicator)."""
+        with stage("dedup"):
+            if self.dedup.policy == DEDUP_LAST:
+                return self.dedup.dedupe_last(list(vendas_rows))
+            return list(self.dedup.filter(vendas_rows))
+
+    def add_sales(self, vendas_rows: Iterable[Tuple[str, ...]]):
+        if self.dedup.policy == DEDUP_LAST:
+            self.held_sales.extend(vendas_rows)
+            return
+        with stage("process_sales"):
+            process_sales(
+                self.dedup.filter(vendas_rows), self.inicio, self.fim,
+                self.sellers_dict, self.contadores_dict, self.contador_to_seller, self.totals,
+                self.renewal_partner_name, self.renewal_commission_bps
+            )
+
+    def evaluate(self, row: Tuple) -> Optional[Tuple]:
+        """Contribution of one sale, without touching the totals (see evaluate_sale)."""
+        return evaluate_sale(
+            row, self.inicio, self.fim,
+            self.sellers_dict, self.contadores_dict, self.contador_to_seller, self.totals,
+            self.renewal_partner_name, self.renewal_commission_bps
+        )
+
+    def flush(self):
+        """Process the held sales (DEDUP_LAST), once every row has arrived."""
+        if not self.held_sales:
+            return
+        vendas_rows = self.dedupe(self.held_sales)
+        self.held_sales = []
+        with stage("process_sales"):
+            process_sales(
+                vendas_rows, self.inicio, self.fim,
+                self.sellers_dict, self.contadores_dict, self.contador_to_seller, self.totals,
+                self.renewal_partner_name, self.renewal_commission_bps
+            )
+
+    def result(self) -> ComissaoResponse:
+        self.flush()
+        # Filter and format results (own stage, so process_sales is only the sale loop)
+        with stage("settle"):
+            self.totals.settle()
+            sellers = filter_and_format_results(self.sellers_dict)
+        
+        # Build renewal partner node
+        parceiro_renovacao = None
+        if self.renewal_partner_name and self.renewal_commission_bps is not None:
+            with stage("renewal_tree"):
+                parceiro_renovacao = build_renewal_partner_node(
+                    sellers,
+                    self.renewal_partner_name,
+                    self.renewal_partner_cpf_cnpj,
+                    self.renewal_partner_faixa
+                )
+        return ComissaoResponse(sellers=sellers, parceiro_renovacao=parceiro_renovacao)
+
+    def finish(self, salvar: bool = False) -> Tuple[str, Optional["ComissaoHistorico"], int]:
+        """Response JSON, what gets persisted when ``salvar`` is set and the number of repeated sales dropped."""
+        response = self.result()
+        historico = None
+        if salvar:
+            with stage("history"):
+                historico = build_historico(response, self.inicio, self.fim)
+        
+        # Serialize here (instead of through response_model) so the time is measured
+        with stage("serialize"):
+            return "".join(iter_model_json(response)), historico, self.dedup.duplicates
+
+
+HISTORICO_VENDEDOR = "vendedor"
+HISTORICO_CONTADOR = "contador"
+HISTORICO_RENOVACAO = "renovacao"
+
+
+class ComissaoHistorico:
+    """A calculation to be persisted (POST /calcular-comissao/ with salvar=true).
+
+    Built in the worker from the response, as compact tuples in integer cents
+    (VENDA_FIELDS / TOTAL_FIELDS order); crud.save_comissao_historico writes it.
+    """
+
+    VENDA_FIELDS = (
+        "tipo", "parceiro_cnpj_cpf", "numero_pedido", "numero_protocolo", "valor_centavos",
+        "comissao_centavos", "comissao_renovacao_centavos", "is_renovacao", "produto", "cliente", "doc_cliente",
+    )
+    TOTAL_FIELDS = (
+        "tipo", "cnpj_cpf", "nome", "faixa_comissao", "vendedor_cnpj_cpf", "quantidade_vendas",
+        "total_vendas_centavos", "total_comissao_centavos", "total_comissao_renovacao_centavos",
+    )
+
+    def __init__(self, inicio: Optional[datetime], fim: Optional[datetime]):
+        self.inicio = inicio
+        self.fim = fim
+        # Month the run is filed under (series and rankings); None when only the rows matter (diffs)
+        self.periodo = inicio.strftime("%Y-%m") if inicio else None
+        self.vendas: List[Tuple] = []
+        self.totais: List[Tuple] = []
+        self.quantidade_vendas = 0
+        self.total_vendas_centavos = 0
+        self.total_comissao_centavos = 0
+        self.total_comissao_renovacao_centavos = 0
+
+    def add_partner(self, tipo: str, partner: BaseModel, vendedor_cnpj_cpf: Optional[str] = None) -> str:
+        """Add a seller/contador (totals and sales); returns its normalized CPF/CNPJ."""
+        cnpj_cpf = normalize_cpf_cnpj(partner.cnpj_cpf)
+        vendas = partner.vendas
+        total_vendas, total_comissao, total_comissao_renovacao = sum_cents(vendas)
+        self.totais.append((
+            tipo, cnpj_cpf, partner.nome, partner.faixa_comissao, vendedor_cnpj_cpf, len(vendas),
+            total_vendas, total_comissao, total_comissao_renovacao,
+        ))
+        # Every sale is in its seller's list (contador sales too), so the run's sales come from the sellers
+        if tipo == HISTORICO_VENDEDOR:
+            self.quantidade_vendas += len(vendas)
+            self.total_vendas_centavos += total_vendas
+        self.total_comissao_centavos += total_comissao
+        self.vendas.extend(
+            (
+                tipo, cnpj_cpf, v.numero_pedido, v.numero_protocolo, to_cents(v.valor_venda),
+                to_cents(v.comissao), to_cents(v.comissao_renovacao), v.is_renovacao,
+                v.produto, v.cliente, v.doc_cliente,
+            )
+            for v in vendas
+        )
+        return cnpj_cpf
+
+
+def build_historico(
+    response: ComissaoResponse, inicio: Optional[datetime] = None, fim: Optional[datetime] = None
+) -> ComissaoHistorico:
+    """Sales and per-partner totals of a calculation, for the history tables.
+
+    Sales are stored once per seller and once per contador (as in the response);
+    the renewal partner only gets its totals, since its sales are already there.
+    """
+    historico = ComissaoHistorico(inicio, fim)
+    for seller in response.sellers:
+        seller_cnpj_cpf = historico.add_partner(HISTORICO_VENDEDOR, seller)
+        for contador in seller.contadores:
+            historico.add_partner(HISTORICO_CONTADOR, contador, seller_cnpj_cpf)
+    
+    partner = response.parceiro_renovacao
+    if partner is not None:
+        # Counted like the node's total_vendas; all of its commission is renewal commission
+        quantidade = sum(len(s.vendas) + sum(len(c.vendas) for c in s.contadores) for s in partner.sellers)
+        vendas, comissao = to_cents(partner.total_vendas), to_cents(partner.total_comissao)
+        historico.totais.append((
+            HISTORICO_RENOVACAO, normalize_cpf_cnpj(partner.cnpj_cpf), partner.nome, partner.faixa_comissao,
+            None, quantidade, vendas, comissao, comissao,
+        ))
+        historico.total_comissao_renovacao_centavos = comissao
+    return historico
+
+
+def comissao_response(content: str, duplicates: int) -> Response:
+    """JSON response with the number of repeated sales dropped in the X-Comissao-Duplicadas header."""
+    response = Response(content=content, media_type="application/json")
+    response.headers["X-Comissao-Duplicadas"] = str(duplicates)
+    return response
+
+
+async def save_historico(db: AsyncSession, historico: Optional[ComissaoHistorico], response: Response):
+    """Persist the calculation (when requested) and return its id in the X-Comissao-Execucao header."""
+    if historico is None:
+        return
+    with stage("persist"):
+        execucao = await crud.save_comissao_historico(db, historico)
+    response.headers["X-Comissao-Execucao"] = str(execucao.id)
+
+
+def read_comissao_inputs(
+    vendas_path: str,
+    parceiros_path: str,
+    vendas_member: Optional[str] = None,
+    parceiros_member: Optional[str] = None
+) -> Tuple[List[Tuple], List[Tuple]]:
+    """Vendas (VENDAS_FIELDS) and parceiros (PARCEIROS_FIELDS) rows of the files saved on disk."""
+    # Parse input files (CSV or Parquet/Arrow)
+    with stage("parse_csv"):
+        with open_comissao_input(vendas_path, vendas_member) as (vendas_header, read_vendas), \
+                open_comissao_input(parceiros_path, parceiros_member) as (parceiros_header, read_parceiros):
+            vendas_cols = get_vendas_column_names(build_header_map(vendas_header))
+            parceiros_cols = get_parceiros_column_names(build_header_map(parceiros_header))
+            
+            # Validate required columns (before reading the rows)
+            validate_columns(vendas_cols, parceiros_cols)
+            
+            vendas_rows = list(read_vendas([vendas_cols[field] for field in VENDAS_FIELDS], VENDAS_KINDS))
+            parceiros_rows = list(
+                read_parceiros([parceiros_cols[field] for field in PARCEIROS_FIELDS], PARCEIROS_KINDS)
+            )
+    add_rows(len(vendas_rows) + len(parceiros_rows))
+    return vendas_rows, parceiros_rows
+
+
+def calcular_comissao_arquivos(
+    vendas_path: str,
+    parceiros_path: str,
+    inicio: datetime,
+    fim: datetime,
+    vendas_member: Optional[str] = None,
+    parceiros_member: Optional[str] = None,
+    salvar: bool = False,
+    dedup_policy: str = DEDUP_FIRST
+) -> Tuple[str, Optional[ComissaoHistorico], int]:
+    """Compute the commissions from the CSV files saved on disk and return the response JSON.
+    
+    With ``salvar`` the calculation to persist comes along (ComissaoHistorico), else None;
+    last comes the number of repeated sales dropped under ``dedup_policy``.
+
+    Runs in the process pool, so a large upload does not block the event loop
+    (and the light CRUD/auth endpoints) while it is parsed and processed.
+    Compressed files (gzip, zip, zstd) are decompressed while they are parsed;
+    Parquet/Arrow files are read column by column (see open_comissao_input).
+    """
+    vendas_rows, parceiros_rows = read_comissao_inputs(vendas_path, parceiros_path, vendas_member, parceiros_member)
+    
+    calculation = ComissaoCalculation(parceiros_rows, inicio, fim, dedup_policy)
+    calculation.add_sales(vendas_rows)
+    return calculation.finish(salvar)
+
+
+def stream_dedup_policy(fields: Dict[str, str]) -> str:
+    policy = fields.get("duplicadas", "").strip().lower() or settings.COMISSAO_DEDUP_POLICY
+    if policy not in DEDUP_POLICIES:
+        raise HTTPException(status_code=400, detail=f"duplicadas deve ser {', '.join(DEDUP_POLICIES)}")
+    return policy
+
+
+def calcular_comissao_stream(stream: MultipartStream) -> Tuple[str, Optional[ComissaoHistorico], int]:
+    """Compute the commissions while the multipart body is still arriving (see upload_stream).
+
+    Runs in an upload-stream thread. Parts are consumed in body order:
+    data_inicio, data_fim and parceiros_file should come before vendas_file,
+    so each batch of sales goes straight into the accumulators. Sales that
+    arrive earlier are kept as projected rows until the calculation can start.
+    Compressed files are decompressed as they arrive (csv_reader.open_chunk_lines);
+    vendas_membro/parceiros_membro must come before their zip file. Parquet/Arrow
+    files are accepted too (see open_streamed_input). Returns what
+    calcular_comissao_arquivos returns; salvar may come anywhere in the body,
+    duplicadas must come before the calculation starts. With duplicadas=last the
+    sales are held until the file ends (the last copy of a sale is only known then).
+    """
+    fields: Dict[str, str] = {}
+    parceiros_rows: Optional[List[Tuple[str, ...]]] = None
+    pending_sales: List[Tuple[str, ...]] = []
+    vendas_received = False
+    calculation: Optional[ComissaoCalculation] = None
+
+    def start_calculation() -> Optional[ComissaoCalculation]:
+        if parceiros_rows is None or "data_inicio" not in fields or "data_fim" not in fields:
+            return None
+        inicio, fim = validate_dates(fields["data_inicio"], fields["data_fim"])
+        started = ComissaoCalculation(parceiros_rows, inicio, fim, stream_dedup_policy(fields))
+        if pending_sales:
+            started.add_sales(pending_sales)
+            pending_sales.clear()
+        return started
+
+    for part in stream.parts():
+        if part.name == "parceiros_file" and part.filename is not None:
+            with open_streamed_input(part, fields.get("parceiros_membro")) as (header, read_rows):
+                parceiros_cols = get_parceiros_column_names(build_header_map(header))
+                validate_parceiros_columns(parceiros_cols)
+                parceiros_rows = list(read_rows([parceiros_cols[field] for field in PARCEIROS_FIELDS], PARCEIROS_KINDS))
+            add_rows(len(parceiros_rows))
+        elif part.name == "vendas_file" and part.filename is not None:
+            with open_streamed_input(part, fields.get("vendas_membro")) as (header, read_rows):
+                vendas_cols = get_vendas_column_names(build_header_map(header))
+                validate_vendas_columns(vendas_cols)
+                rows = read_rows([vendas_cols[field] for field in VENDAS_FIELDS], VENDAS_KINDS)
+                while True:
+                    batch = list(islice(rows, STREAM_SALES_BATCH_SIZE))
+                    if not batch:
+                        break
+                    add_rows(len(batch))
+                    if calculation is not None:
+                        calculation.add_sales(batch)
+                    else:
+                        pending_sales.extend(batch)
+            vendas_received = True
+        elif part.name in STREAM_FORM_FIELDS and part.filename is None:
+            if part.name == "duplicadas" and calculation is not None:
+                raise HTTPException(
+                    status_code=400, detail="Envie duplicadas antes de data_inicio, data_fim e parceiros_file"
+                )
+            fields[part.name] = part.text()
+        else:
+            # Unknown parts are skipped (drained by stream.parts())
+            continue
+        if calculation is None:
+            calculation = start_calculation()
+
+    missing = [
+        name for name, present in (
+            ("vendas_file", vendas_received),
+            ("parceiros_file", parceiros_rows is not None),
+            ("data_inicio", "data_inicio" in fields),
+            ("data_fim", "data_fim" in fields),
+        ) if not present
+    ]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Campos faltando no formulário: {', '.join(missing)}")
+    return calculation.finish(fields.get("salvar", "").strip().lower() in FORM_TRUE_VALUES)
+
+
 @router.post(
     "/calcular-comissao/",
     summary="Calcula comissão de vendedores e contadores",
     description="Recebe dois arquivos CSV (vendas e parceiros) e calcula as comissões "
-                "para vendedores e contadores no período especificado.",
+                "para vendedores e contadores no período especificado. Os CSVs podem vir "
+                "compactados (gzip, zip ou zstd); vendas e parceiros também são aceitos "
+                "em Parquet ou Arrow IPC. Com salvar=true o cálculo fica no histórico "
+                "(/comissao/historico) e o id vem no header X-Comissao-Execucao. Vendas repetidas "
+                "(mesmo Nº Pedido/Nº Protocolo) seguem a política duplicadas; as descartadas são "
+                "contadas no header X-Comissao-Duplicadas.",
     response_model=ComissaoResponse
 )
 async def calcular_comissao(
-    vendas_file: UploadFile = File(..., description="CSV de vendas"),
-    parceiros_file: UploadFile = File(..., description="CSV de parceiros"),
+    vendas_file: UploadFile = File(..., description="CSV de vendas (pode ser .csv.gz, .zip, .zst, Parquet ou Arrow)"),
+    parceiros_file: UploadFile = File(..., description="CSV de parceiros (pode ser .csv.gz, .zip, .zst, Parquet ou Arrow)"),
     data_inicio: str = Form(..., description="Data de início (DD/MM/YYYY)"),
-    data_fim: str = Form(..., description="Data de fim (DD/MM/YYYY)")
+    data_fim: str = Form(..., description="Data de fim (DD/MM/YYYY)"),
+    vendas_membro: Optional[str] = Form(None, description="Arquivo dentro do zip de vendas (padrão: o primeiro)"),
+    parceiros_membro: Optional[str] = Form(None, description="Arquivo dentro do zip de parceiros (padrão: o primeiro)"),
+    salvar: bool = Form(False, description="Salva o cálculo no histórico de comissões"),
+    duplicadas: Optional[str] = Form(
+        None, pattern=DEDUP_POLICY_PATTERN,
+        description="Vendas repetidas: first (mantém a primeira), last (a última) ou error (rejeita o arquivo)"
+    ),
+    db: AsyncSession = Depends(get_db)
 ):
+    paths = []
     try:
         # Validate and parse dates
         inicio, fim = validate_dates(data_inicio, data_fim)
         
-        # Parse CSV files
-        vendas_rows, vendas_headers = parse_csv_file(vendas_file)
-        parceiros_rows, parceiros_headers = parse_csv_file(parceiros_file)
-        
-        # Get column names
-        vendas_cols = get_vendas_column_names(vendas_headers)
-        parceiros_cols = get_parceiros_column_names(parceiros_headers)
-        
-        # Validate required columns
-        validate_columns(vendas_cols, parceiros_cols)
-        
-        # Build sellers and contadores dictionaries
-        sellers_dict, contadores_dict, contador_to_seller, _ = build_sellers_and_contadores(
-            parceiros_rows, parceiros_cols
-        )
-        
-        # Find renewal partner info
-        renewal_partner_name = None
-        renewal_partner_cpf_cnpj = ""
-        renewal_partner_faixa = ""
-        renewal_commission_pct = None
-        
-        renewal_info = find_renewal_partner_info(parceiros_rows, parceiros_cols)
-        if renewal_info:
-            renewal_partner_name, renewal_partner_cpf_cnpj, renewal_partner_faixa = renewal_info
-            renewal_commission_pct = parse_commission_percentage(renewal_partner_faixa)
-        
-        # Process all sales
-        process_sales(
-            vendas_rows, vendas_cols, inicio, fim,
-            sellers_dict, contadores_dict, contador_to_seller,
-            renewal_partner_name, renewal_commission_pct
-        )
-        
-        # Filter and format results
-        sellers = filter_and_format_results(sellers_dict)
-        
-        # Build renewal partner node
-        parceiro_renovacao = None
-        if renewal_partner_name and renewal_commission_pct is not None:
-            parceiro_renovacao = build_renewal_partner_node(
-                sellers,
-                renewal_partner_name,
-                renewal_partner_cpf_cnpj,
-                renewal_partner_faixa
+        # Parsing and processing run in the process pool (see calcular_comissao_arquivos)
+        with stage("spool"):
+            paths.append(await spool_upload_to_disk_async(vendas_file, suffix=".csv"))
+            paths.append(await spool_upload_to_disk_async(parceiros_file, suffix=".csv"))
+        # Compressed uploads are estimated by their decompressed size
+        memory = estimate_memory("comissao", [
+            input_size(paths[0], vendas_membro),
+            input_size(paths[1], parceiros_membro),
+        ])
+        async with admission_controller.admit("comissao", memory):
+            content, historico, duplicates = await run_in_process_pool(
+                calcular_comissao_arquivos, paths[0], paths[1], inicio, fim, vendas_membro, parceiros_membro, salvar,
+                duplicadas or settings.COMISSAO_DEDUP_POLICY
             )
-        
-        return ComissaoResponse(
-            sellers=sellers,
-            parceiro_renovacao=parceiro_renovacao
-        )
+            response = comissao_response(content, duplicates)
+            await save_historico(db, historico, response)
+        return response
     
     except HTTPException:
         raise
@@ -683,4 +1325,49 @@ async def calcular_comissao(
             status_code=500,
             detail=f"Ocorreu um erro inesperado ao processar os arquivos: {str(e)}"
         )
+    finally:
+        remove_files(paths)
+
 
+@router.post(
+    "/calcular-comissao/stream",
+    summary="Calcula comissão de vendedores e contadores (upload processado enquanto chega)",
+    description="Mesmos campos de /calcular-comissao/, mas os CSVs são processados enquanto "
+                "o upload ainda está chegando. Envie data_inicio, data_fim e parceiros_file "
+                "antes de vendas_file (e vendas_membro/parceiros_membro antes dos zips; "
+                "duplicadas antes de parceiros_file). O cálculo roda no processo da API, "
+                "uma requisição por vez; para arquivos grandes em lote prefira /calcular-comissao/.",
+    response_model=ComissaoResponse
+)
+async def calcular_comissao_streaming(request: Request, db: AsyncSession = Depends(get_db)):
+    # Unlike /calcular-comissao/, the CSV parsing and the sale loop run in a thread of
+    # the API process, not in the process pool: they hold the GIL while the upload is
+    # being received, slowing down every other request served by this process. That is
+    # the price of overlapping the processing with the network, so the lane admits one
+    # request at a time (LANE_MAX_CONCURRENT) and large batch jobs should keep using
+    # the regular endpoint.
+    stream = MultipartStream(request.headers.get("content-type"))
+    # The files have not arrived yet: estimate from the whole body. A chunked upload
+    # (no Content-Length) can be any size, so it reserves the whole memory budget.
+    content_length = request.headers.get("content-length")
+    if content_length is None:
+        memory = admission_controller.memory_budget
+    else:
+        memory = estimate_memory("comissao_stream", [int(content_length)])
+    try:
+        async with admission_controller.admit("comissao_stream", memory):
+            content, historico, duplicates = await consume_in_thread(stream, request.stream(), calcular_comissao_stream)
+            response = comissao_response(content, duplicates)
+            await save_historico(db, historico, response)
+        return response
+    
+    except (HTTPException, ClientDisconnect):
+        raise
+    except Exception as e:
+        print(f"Ocorreu um erro inesperado: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ocorreu um erro inesperado ao processar os arquivos: {str(e)}"
+        )
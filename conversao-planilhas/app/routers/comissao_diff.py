@@ -0,0 +1,237 @@
+# routers/comissao_diff.py
+"""Comparação entre dois cálculos de comissão.
+
+Quando o CSV de vendas é reexportado ou as faixas dos parceiros mudam, o que
+interessa é o que mudou entre dois resultados, não os dois JSONs inteiros.
+Cada lado da comparação é um cálculo salvo (id do histórico) ou o JSON de
+resposta de /calcular-comissao/ enviado como arquivo.
+
+Os dois lados são montados como índices por hash: parceiros por (tipo,
+CPF/CNPJ) e, dentro de cada parceiro, vendas por (Nº Pedido, Nº Protocolo).
+A comparação percorre cada índice uma vez (tempo linear) e só devolve os
+parceiros que mudaram: vendas adicionadas, removidas e alteradas, faixa
+antes/depois e a diferença dos totais, incluindo o parceiro de renovação.
+"""
+from typing import Dict, List, Optional, Tuple, Union
+
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Response, UploadFile
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import crud, schemas
+from ..admission import admission_controller, estimate_memory
+from ..auth import get_current_active_user
+from ..database import get_db
+from ..instrumentation import add_rows, stage
+from ..schemas import ComissaoResponse
+from .comissao import HISTORICO_RENOVACAO, HISTORICO_VENDEDOR, build_historico, format_cents
+from .compressed import detect_file_compression, expanded_size, open_decompressed
+from .utils import remove_files, run_in_process_pool, spool_upload_to_disk_async
+
+router = APIRouter(
+    prefix="/comissao/diff",
+    tags=["Comissão"],
+    dependencies=[Depends(get_current_active_user)]
+)
+
+# Tamanho aproximado de uma venda no JSON do resultado (estimativa de memória dos cálculos salvos)
+BYTES_POR_VENDA = 400
+
+# Um lado da comparação: caminho do JSON enviado ou (totais, vendas) de um cálculo salvo
+Fonte = Union[str, Tuple[List[Tuple], List[Tuple]]]
+
+
+class ComissaoSnapshot:
+    """Um resultado indexado para a comparação.
+
+    ``totais`` e ``vendas`` seguem a ordem de ``ComissaoHistorico.TOTAL_FIELDS``
+    e ``VENDA_FIELDS`` (vendas só até ``is_renovacao``).
+    """
+
+    def __init__(self, totais: List[Tuple], vendas: List[Tuple]):
+        # {(tipo, cnpj_cpf): linha de totais}
+        self.parceiros: Dict[Tuple[str, str], Tuple] = {(total[0], total[1]): total for total in totais}
+        # {(tipo, cnpj_cpf): {(numero_pedido, numero_protocolo, ocorrência): (valor, comissão, renovação, is_renovacao)}}
+        self.vendas: Dict[Tuple[str, str], Dict[Tuple[str, str, int], Tuple]] = {}
+        for venda in vendas:
+            parceiro = self.vendas.setdefault((venda[0], venda[1]), {})
+            key = (venda[2], venda[3], 0)
+            # A mesma venda repetida no arquivo conta mais de uma vez: cada cópia é comparada com a do outro lado
+            while key in parceiro:
+                key = (key[0], key[1], key[2] + 1)
+            parceiro[key] = tuple(venda[4:8])
+
+
+def carregar_snapshot(fonte: Fonte) -> ComissaoSnapshot:
+    if not isinstance(fonte, str):
+        return ComissaoSnapshot(*fonte)
+    compression = detect_file_compression(fonte)
+    if compression is None:
+        with open(fonte, "rb") as f:
+            content = f.read()
+    else:
+        with open_decompressed(fonte, compression) as blocks:
+            content = b"".join(blocks)
+    try:
+        response = ComissaoResponse.model_validate_json(content)
+    except ValidationError:
+        raise HTTPException(status_code=400, detail="O arquivo não é um resultado de comissão válido (JSON)")
+    historico = build_historico(response)
+    return ComissaoSnapshot(historico.totais, historico.vendas)
+
+
+def venda_diff(key: Tuple[str, str, int], antes: Optional[Tuple], depois: Optional[Tuple]) -> schemas.ComissaoDiffVenda:
+    fields = {"numero_pedido": key[0], "numero_protocolo": key[1]}
+    for lado, valores in (("antes", antes), ("depois", depois)):
+        if valores is None:
+            continue
+        valor, comissao, comissao_renovacao, is_renovacao = valores
+        fields[f"valor_{lado}"] = format_cents(valor)
+        fields[f"comissao_{lado}"] = format_cents(comissao)
+        fields[f"comissao_renovacao_{lado}"] = format_cents(comissao_renovacao)
+        fields[f"is_renovacao_{lado}"] = is_renovacao
+    return schemas.ComissaoDiffVenda(**fields)
+
+
+def diff_snapshots(base: ComissaoSnapshot, nova: ComissaoSnapshot) -> schemas.ComissaoDiff:
+    """Diferença de ``base`` para ``nova``, só com os parceiros que mudaram."""
+    parceiros = []
+    adicionadas = removidas = alteradas = faixas_alteradas = 0
+    total_vendas = total_comissao = total_renovacao = 0
+    vazio = (0, 0, 0, 0)
+
+    keys = list(base.parceiros)
+    keys.extend(key for key in nova.parceiros if key not in base.parceiros)
+    for key in keys:
+        antes = base.parceiros.get(key)
+        depois = nova.parceiros.get(key)
+        vendas_antes = base.vendas.get(key, {})
+        vendas_depois = nova.vendas.get(key, {})
+
+        vendas_adicionadas = [
+            venda_diff(venda, None, valores) for venda, valores in vendas_depois.items() if venda not in vendas_antes
+        ]
+        vendas_removidas = []
+        vendas_alteradas = []
+        for venda, valores in vendas_antes.items():
+            valores_depois = vendas_depois.get(venda)
+            if valores_depois is None:
+                vendas_removidas.append(venda_diff(venda, valores, None))
+            elif valores_depois != valores:
+                vendas_alteradas.append(venda_diff(venda, valores, valores_depois))
+
+        quantidade_antes, vendas_antes_c, comissao_antes, renovacao_antes = antes[5:9] if antes else vazio
+        quantidade_depois, vendas_depois_c, comissao_depois, renovacao_depois = depois[5:9] if depois else vazio
+        faixa_alterada = antes is not None and depois is not None and antes[3] != depois[3]
+        deltas = (
+            quantidade_depois - quantidade_antes,
+            vendas_depois_c - vendas_antes_c,
+            comissao_depois - comissao_antes,
+            renovacao_depois - renovacao_antes,
+        )
+        if (antes is not None and depois is not None and not faixa_alterada and not any(deltas)
+                and not (vendas_adicionadas or vendas_removidas or vendas_alteradas)):
+            continue
+
+        tipo, cnpj_cpf = key
+        # As vendas dos contadores também estão na lista do vendedor: contadas uma vez só
+        if tipo == HISTORICO_VENDEDOR:
+            adicionadas += len(vendas_adicionadas)
+            removidas += len(vendas_removidas)
+            alteradas += len(vendas_alteradas)
+            total_vendas += deltas[1]
+        if tipo == HISTORICO_RENOVACAO:
+            total_renovacao += deltas[2]
+        else:
+            total_comissao += deltas[2]
+        faixas_alteradas += faixa_alterada
+
+        parceiros.append(schemas.ComissaoDiffParceiro(
+            tipo=tipo,
+            cnpj_cpf=cnpj_cpf,
+            nome=(depois or antes)[2],
+            situacao="adicionado" if antes is None else "removido" if depois is None else "alterado",
+            faixa_antes=antes[3] if antes else None,
+            faixa_depois=depois[3] if depois else None,
+            quantidade_vendas_delta=deltas[0],
+            total_vendas_delta=format_cents(deltas[1]),
+            total_comissao_delta=format_cents(deltas[2]),
+            total_comissao_renovacao_delta=format_cents(deltas[3]),
+            vendas_adicionadas=vendas_adicionadas,
+            vendas_removidas=vendas_removidas,
+            vendas_alteradas=vendas_alteradas,
+        ))
+
+    return schemas.ComissaoDiff(
+        vendas_adicionadas=adicionadas,
+        vendas_removidas=removidas,
+        vendas_alteradas=alteradas,
+        faixas_alteradas=faixas_alteradas,
+        total_vendas_delta=format_cents(total_vendas),
+        total_comissao_delta=format_cents(total_comissao),
+        total_comissao_renovacao_delta=format_cents(total_renovacao),
+        parceiros=parceiros,
+    )
+
+
+def calcular_diff(base: Fonte, nova: Fonte) -> str:
+    """JSON da comparação entre os dois lados. Executado no pool de processos."""
+    with stage("diff_load"):
+        snapshots = [carregar_snapshot(fonte) for fonte in (base, nova)]
+    add_rows(sum(len(vendas) for snapshot in snapshots for vendas in snapshot.vendas.values()))
+    with stage("diff"):
+        diff = diff_snapshots(*snapshots)
+    with stage("serialize"):
+        return diff.model_dump_json()
+
+
+async def fonte_execucao(db: AsyncSession, execucao_id: int) -> Tuple[Fonte, int]:
+    """(totais, vendas) de um cálculo salvo e o tamanho estimado para a admissão."""
+    execucao = await crud.get_comissao_execucao(db, execucao_id)
+    if execucao is None:
+        raise HTTPException(status_code=404, detail=f"Cálculo de comissão {execucao_id} não encontrado")
+    with stage("diff_query"):
+        fonte = await crud.get_comissao_execucao_conteudo(db, execucao_id)
+    return fonte, execucao.quantidade_vendas * BYTES_POR_VENDA
+
+
+@router.post(
+    "/",
+    response_model=schemas.ComissaoDiff,
+    summary="Compara dois cálculos de comissão",
+    description="Cada lado é um cálculo salvo (base_execucao/nova_execucao, ids de "
+                "/comissao/historico/execucoes) ou o JSON de /calcular-comissao/ enviado como "
+                "arquivo (base_file/nova_file, pode vir compactado). Só os parceiros que mudaram "
+                "são listados; valores em texto decimal exato.",
+)
+async def comparar_comissoes(
+    base_execucao: Optional[int] = Form(None, description="Id do cálculo salvo usado como base"),
+    nova_execucao: Optional[int] = Form(None, description="Id do cálculo salvo comparado com a base"),
+    base_file: Optional[UploadFile] = File(None, description="JSON do resultado usado como base"),
+    nova_file: Optional[UploadFile] = File(None, description="JSON do resultado comparado com a base"),
+    db: AsyncSession = Depends(get_db)
+):
+    for lado, execucao_id, upload in (("base", base_execucao, base_file), ("nova", nova_execucao, nova_file)):
+        if (execucao_id is None) == (upload is None):
+            raise HTTPException(status_code=400, detail=f"Informe {lado}_execucao ou {lado}_file (um dos dois)")
+
+    paths = []
+    try:
+        fontes = []
+        sizes = []
+        for execucao_id, upload in ((base_execucao, base_file), (nova_execucao, nova_file)):
+            if upload is not None:
+                with stage("spool"):
+                    path = await spool_upload_to_disk_async(upload, suffix=".json")
+                paths.append(path)
+                fontes.append(path)
+                sizes.append(expanded_size(path))
+            else:
+                fonte, size = await fonte_execucao(db, execucao_id)
+                fontes.append(fonte)
+                sizes.append(size)
+        async with admission_controller.admit("comissao", estimate_memory("comissao", sizes)):
+            content = await run_in_process_pool(calcular_diff, *fontes)
+        return Response(content=content, media_type="application/json")
+    finally:
+        remove_files(paths)
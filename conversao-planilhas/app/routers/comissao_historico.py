@@ -0,0 +1,113 @@
+# routers/comissao_historico.py
+"""Consultas ao histórico de comissões.
+
+Os cálculos salvos (POST /calcular-comissao/ com ``salvar=true``) ficam nas
+tabelas de execuções, vendas e totais; ao salvar, os rollups do mês (por
+parceiro e geral) são refeitos. As séries e rankings daqui só leem os rollups,
+sem recalcular nada. Um mês é o do início do período calculado (AAAA-MM) e
+vale o último cálculo salvo dele.
+"""
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import crud, schemas
+from ..auth import get_current_active_user
+from ..database import get_db
+from .comissao import HISTORICO_CONTADOR, HISTORICO_RENOVACAO, HISTORICO_VENDEDOR, format_cents, normalize_cpf_cnpj
+from .utils import MAX_PAGE_SIZE, set_next_cursor
+
+router = APIRouter(
+    prefix="/comissao/historico",
+    tags=["Comissão"],
+    dependencies=[Depends(get_current_active_user)]
+)
+
+PERIODO_PATTERN = r"^\d{4}-(0[1-9]|1[0-2])$"
+TIPO_PATTERN = f"^({HISTORICO_VENDEDOR}|{HISTORICO_CONTADOR}|{HISTORICO_RENOVACAO})$"
+
+
+def totais_fields(row) -> dict:
+    """Campos de ``ComissaoTotais`` a partir dos centavos gravados."""
+    return {
+        "quantidade_vendas": row.quantidade_vendas,
+        "total_vendas": row.total_vendas_centavos / 100,
+        "total_comissao": row.total_comissao_centavos / 100,
+        "total_comissao_renovacao": row.total_comissao_renovacao_centavos / 100,
+        "total_vendas_exato": format_cents(row.total_vendas_centavos),
+        "total_comissao_exato": format_cents(row.total_comissao_centavos),
+        "total_comissao_renovacao_exato": format_cents(row.total_comissao_renovacao_centavos),
+    }
+
+
+@router.get("/execucoes", response_model=List[schemas.ComissaoExecucaoInfo])
+async def listar_execucoes(
+    response: Response,
+    cursor: Optional[int] = Query(None, description="Id do último cálculo da página anterior (header X-Next-Cursor)"),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    periodo: Optional[str] = Query(None, pattern=PERIODO_PATTERN, description="Mês (AAAA-MM)"),
+    db: AsyncSession = Depends(get_db)
+):
+    execucoes = await crud.get_comissao_execucoes(db, after_id=cursor, limit=limit, periodo=periodo)
+    set_next_cursor(response, execucoes, limit)
+    return [
+        schemas.ComissaoExecucaoInfo(
+            id=execucao.id,
+            periodo=execucao.periodo,
+            data_inicio=execucao.data_inicio,
+            data_fim=execucao.data_fim,
+            criado_em=execucao.criado_em,
+            **totais_fields(execucao),
+        )
+        for execucao in execucoes
+    ]
+
+
+@router.get(
+    "/serie",
+    response_model=List[schemas.ComissaoSeriePonto],
+    summary="Série mensal de comissões",
+    description="Totais por mês de um parceiro (cnpj_cpf e tipo) ou, sem cnpj_cpf, os totais gerais.",
+)
+async def serie_comissoes(
+    cnpj_cpf: Optional[str] = Query(None, description="CPF/CNPJ do parceiro (com ou sem pontuação)"),
+    tipo: str = Query(HISTORICO_VENDEDOR, pattern=TIPO_PATTERN),
+    de: Optional[str] = Query(None, pattern=PERIODO_PATTERN, description="Primeiro mês (AAAA-MM)"),
+    ate: Optional[str] = Query(None, pattern=PERIODO_PATTERN, description="Último mês (AAAA-MM)"),
+    db: AsyncSession = Depends(get_db)
+):
+    if cnpj_cpf:
+        rows = await crud.get_comissao_serie_parceiro(db, tipo, normalize_cpf_cnpj(cnpj_cpf), de, ate)
+    else:
+        rows = await crud.get_comissao_serie_periodos(db, de, ate)
+    return [
+        schemas.ComissaoSeriePonto(periodo=row.periodo, execucao_id=row.execucao_id, **totais_fields(row))
+        for row in rows
+    ]
+
+
+@router.get(
+    "/ranking",
+    response_model=List[schemas.ComissaoRankingItem],
+    summary="Ranking de parceiros no mês",
+)
+async def ranking_comissoes(
+    periodo: str = Query(..., pattern=PERIODO_PATTERN, description="Mês (AAAA-MM)"),
+    tipo: str = Query(HISTORICO_VENDEDOR, pattern=TIPO_PATTERN),
+    ordem: str = Query("comissao", pattern="^(comissao|vendas)$"),
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    rows = await crud.get_comissao_ranking(db, periodo, tipo, ordem, limit)
+    return [
+        schemas.ComissaoRankingItem(
+            posicao=posicao,
+            cnpj_cpf=row.cnpj_cpf,
+            nome=row.nome,
+            faixa_comissao=row.faixa_comissao,
+            execucao_id=row.execucao_id,
+            **totais_fields(row),
+        )
+        for posicao, row in enumerate(rows, start=1)
+    ]
@@ -0,0 +1,328 @@
+# routers/comissao_ledger.py
+"""Ledger de comissões: apuração incremental de um período aberto.
+
+Durante o mês o CSV de vendas só cresce, e recalcular o mês inteiro a cada
+novo envio refaz o trabalho dos dias anteriores. Aqui o período fica salvo
+(tabelas ``comissao_ledger_*``) com o estado de cada venda, identificada por
+(Nº Pedido, Nº Protocolo) normalizados como na deduplicação, e os totais
+correntes de cada vendedor/contador.
+
+A cada envio, cada linha do CSV é resumida num hash das colunas usadas. Linhas
+com o hash já registrado são ignoradas; só as vendas novas ou alteradas (valor,
+data, status indo para PAGO ou deixando de ser PAGO...) são calculadas, e os
+totais recebem a diferença entre a contribuição nova e a registrada. Vendas que
+deixam de aparecer no arquivo continuam no período. Vendas repetidas no mesmo
+envio seguem a política de duplicadas do cálculo (``SaleDeduplicator``).
+
+Se o CSV de parceiros mudar (faixas, gestores...), as contribuições registradas
+deixam de valer: o período é recalculado a partir do envio atual.
+"""
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import crud, models, schemas
+from ..admission import admission_controller, estimate_memory
+from ..auth import get_current_active_user
+from ..config import settings
+from ..database import get_db
+from ..instrumentation import stage
+from ..schemas import ContadorInfo
+from .comissao import (
+    DEDUP_POLICY_PATTERN,
+    HISTORICO_CONTADOR,
+    HISTORICO_VENDEDOR,
+    ComissaoCalculation,
+    input_size,
+    normalize_cpf_cnpj,
+    read_comissao_inputs,
+    sale_key,
+    validate_dates,
+)
+from .comissao_historico import totais_fields
+from .utils import remove_files, run_in_process_pool, spool_upload_to_disk_async
+
+router = APIRouter(
+    prefix="/comissao/ledger",
+    tags=["Comissão"],
+    dependencies=[Depends(get_current_active_user)]
+)
+
+# Ordem das contribuições calculadas no pool de processos (colunas de ComissaoLedgerVenda)
+LEDGER_VENDA_FIELDS = (
+    "linha_hash", "vendedor_cnpj_cpf", "contador_cnpj_cpf", "valor_centavos", "comissao_vendedor_centavos",
+    "comissao_contador_centavos", "comissao_renovacao_centavos", "is_renovacao",
+)
+
+# Nº Protocolo sintético das vendas sem Nº Pedido e sem Nº Protocolo, seguido da ordem da venda
+# entre elas no arquivo (em minúsculas: não coincide com uma chave real, que é normalizada em maiúsculas)
+PROTOCOLO_SEM_CHAVE = "#sem-chave-"
+
+
+def linha_hash(row: Tuple) -> int:
+    """Hash (64 bits, com sinal, para caber num BIGINT) das colunas usadas de uma venda."""
+    digest = hashlib.blake2b(repr(row).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def parceiros_fingerprint(parceiros_rows: List[Tuple]) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for row in parceiros_rows:
+        digest.update(repr(row).encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+class LedgerEnvio:
+    """Resultado do cálculo de um envio (no pool de processos), ainda sem gravar nada."""
+
+    def __init__(self, parceiros_hash: str, recalcular: bool):
+        self.parceiros_hash = parceiros_hash
+        self.recalcular = recalcular
+        self.lidas = 0
+        self.inalteradas = 0
+        # Linhas repetidas (mesmo Nº Pedido/Nº Protocolo) descartadas pela política de duplicadas
+        self.duplicadas = 0
+        # Vendas novas ou alteradas: {(numero_pedido, numero_protocolo): LEDGER_VENDA_FIELDS}
+        self.vendas: Dict[Tuple[str, str], Tuple] = {}
+        # Nome e faixa de cada parceiro: {(tipo, cnpj_cpf): (nome, faixa_comissao)}
+        self.parceiros: Dict[Tuple[str, str], Tuple[str, str]] = {}
+
+
+def calcular_envio_ledger(
+    vendas_path: str,
+    parceiros_path: str,
+    inicio,
+    fim,
+    vendas_member: Optional[str],
+    parceiros_member: Optional[str],
+    conhecidas: Dict[Tuple[str, str], int],
+    parceiros_hash: Optional[str],
+    dedup_policy: str,
+) -> LedgerEnvio:
+    """Calcula só as vendas novas ou alteradas em relação a ``conhecidas`` (hash de cada chave).
+
+    Executado no pool de processos. Vendas repetidas no arquivo são descartadas
+    antes, conforme ``dedup_policy``.
+    """
+    vendas_rows, parceiros_rows = read_comissao_inputs(vendas_path, parceiros_path, vendas_member, parceiros_member)
+    fingerprint = parceiros_fingerprint(parceiros_rows)
+    envio = LedgerEnvio(fingerprint, recalcular=fingerprint != parceiros_hash)
+    if envio.recalcular:
+        conhecidas = {}
+
+    calculation = ComissaoCalculation(parceiros_rows, inicio, fim, dedup_policy)
+    envio.lidas = len(vendas_rows)
+    vendas_rows = calculation.dedupe(vendas_rows)
+    envio.duplicadas = calculation.dedup.duplicates
+    slots = []
+    for partner in calculation.totals.partners:
+        tipo = HISTORICO_CONTADOR if isinstance(partner, ContadorInfo) else HISTORICO_VENDEDOR
+        key = (tipo, normalize_cpf_cnpj(partner.cnpj_cpf))
+        slots.append(key[1])
+        envio.parceiros[key] = (partner.nome, partner.faixa_comissao)
+
+    sem_chave = 0
+    with stage("process_sales"):
+        for row in vendas_rows:
+            # Mesma chave normalizada da deduplicação; as vendas sem chave (que o cálculo completo
+            # conta uma a uma) ficam com uma chave própria, pela ordem no arquivo, que só cresce
+            key = sale_key(row)
+            if key is None:
+                sem_chave += 1
+                key = ("", f"{PROTOCOLO_SEM_CHAVE}{sem_chave}")
+            row_hash = linha_hash(row)
+            if conhecidas.get(key) == row_hash:
+                envio.inalteradas += 1
+                envio.vendas.pop(key, None)
+                continue
+            contribution = calculation.evaluate(row)
+            if contribution is None:
+                envio.vendas[key] = (row_hash, None, None, 0, 0, 0, 0, False)
+                continue
+            (valor_cents, is_renovacao, renovacao_cents,
+             contador_slot, contador_commission_cents, seller_slot, seller_commission_cents) = contribution
+            envio.vendas[key] = (
+                row_hash,
+                slots[seller_slot] if seller_slot is not None else None,
+                slots[contador_slot] if contador_slot is not None else None,
+                valor_cents, seller_commission_cents, contador_commission_cents, renovacao_cents, is_renovacao,
+            )
+    return envio
+
+
+def creditos(venda) -> List[Tuple[Tuple[str, str], int, int, int]]:
+    """((tipo, cnpj_cpf), valor, comissão, comissão de renovação) de cada parceiro creditado na venda."""
+    result = []
+    if venda["vendedor_cnpj_cpf"]:
+        result.append((
+            (HISTORICO_VENDEDOR, venda["vendedor_cnpj_cpf"]),
+            venda["valor_centavos"], venda["comissao_vendedor_centavos"], venda["comissao_renovacao_centavos"],
+        ))
+    if venda["contador_cnpj_cpf"]:
+        result.append((
+            (HISTORICO_CONTADOR, venda["contador_cnpj_cpf"]),
+            venda["valor_centavos"], venda["comissao_contador_centavos"], venda["comissao_renovacao_centavos"],
+        ))
+    return result
+
+
+def aplicar_creditos(totais: Dict[Tuple[str, str], List[int]], venda, sinal: int):
+    for key, valor, comissao, renovacao in creditos(venda):
+        total = totais.setdefault(key, [0, 0, 0, 0])
+        total[0] += sinal
+        total[1] += sinal * valor
+        total[2] += sinal * comissao
+        total[3] += sinal * renovacao
+
+
+def ledger_detalhe(ledger: models.ComissaoLedger, totais) -> schemas.ComissaoLedgerDetalhe:
+    return schemas.ComissaoLedgerDetalhe(
+        id=ledger.id,
+        periodo=ledger.periodo,
+        data_inicio=ledger.data_inicio,
+        data_fim=ledger.data_fim,
+        aberto=ledger.aberto,
+        criado_em=ledger.criado_em,
+        atualizado_em=ledger.atualizado_em,
+        totais=[
+            schemas.ComissaoLedgerTotalInfo(
+                tipo=total.tipo,
+                cnpj_cpf=total.cnpj_cpf,
+                nome=total.nome,
+                faixa_comissao=total.faixa_comissao,
+                **totais_fields(total),
+            )
+            for total in totais
+        ],
+    )
+
+
+async def get_ledger_or_404(db: AsyncSession, ledger_id: int) -> models.ComissaoLedger:
+    ledger = await crud.get_comissao_ledger(db, ledger_id)
+    if ledger is None:
+        raise HTTPException(status_code=404, detail="Ledger não encontrado")
+    return ledger
+
+
+@router.post("/", response_model=schemas.ComissaoLedgerInfo, status_code=201, summary="Abre um período incremental")
+async def criar_ledger(ledger: schemas.ComissaoLedgerCreate, db: AsyncSession = Depends(get_db)):
+    inicio, fim = validate_dates(ledger.data_inicio, ledger.data_fim)
+    return await crud.create_comissao_ledger(db, inicio, fim)
+
+
+@router.get("/{ledger_id}", response_model=schemas.ComissaoLedgerDetalhe)
+async def ler_ledger(ledger_id: int, db: AsyncSession = Depends(get_db)):
+    ledger = await get_ledger_or_404(db, ledger_id)
+    return ledger_detalhe(ledger, await crud.get_comissao_ledger_totais(db, ledger.id))
+
+
+@router.post("/{ledger_id}/fechar", response_model=schemas.ComissaoLedgerInfo, summary="Fecha o período (não aceita mais envios)")
+async def fechar_ledger(ledger_id: int, db: AsyncSession = Depends(get_db)):
+    ledger = await get_ledger_or_404(db, ledger_id)
+    return await crud.close_comissao_ledger(db, ledger)
+
+
+@router.post(
+    "/{ledger_id}/vendas",
+    response_model=schemas.ComissaoLedgerAtualizacao,
+    summary="Envia o CSV de vendas do período (só as vendas novas ou alteradas são processadas)",
+    description="Mesmos arquivos de /calcular-comissao/. As vendas são identificadas por "
+                "(Nº Pedido, Nº Protocolo); se o CSV de parceiros mudar, o período é recalculado. "
+                "Vendas repetidas no arquivo seguem a política duplicadas.",
+)
+async def enviar_vendas(
+    ledger_id: int,
+    vendas_file: UploadFile = File(..., description="CSV de vendas (pode ser .csv.gz, .zip, .zst, Parquet ou Arrow)"),
+    parceiros_file: UploadFile = File(..., description="CSV de parceiros (pode ser .csv.gz, .zip, .zst, Parquet ou Arrow)"),
+    vendas_membro: Optional[str] = Form(None, description="Arquivo dentro do zip de vendas (padrão: o primeiro)"),
+    parceiros_membro: Optional[str] = Form(None, description="Arquivo dentro do zip de parceiros (padrão: o primeiro)"),
+    duplicadas: Optional[str] = Form(
+        None, pattern=DEDUP_POLICY_PATTERN,
+        description="Vendas repetidas: first (mantém a primeira), last (a última) ou error (rejeita o arquivo)"
+    ),
+    db: AsyncSession = Depends(get_db)
+):
+    ledger = await get_ledger_or_404(db, ledger_id)
+    if not ledger.aberto:
+        raise HTTPException(status_code=409, detail="O período deste ledger está fechado")
+    versao = ledger.versao
+
+    with stage("ledger_load"):
+        conhecidas = await crud.get_comissao_ledger_hashes(db, ledger.id) if ledger.parceiros_hash else {}
+
+    paths = []
+    try:
+        with stage("spool"):
+            paths.append(await spool_upload_to_disk_async(vendas_file, suffix=".csv"))
+            paths.append(await spool_upload_to_disk_async(parceiros_file, suffix=".csv"))
+        memory = estimate_memory("comissao", [
+            input_size(paths[0], vendas_membro),
+            input_size(paths[1], parceiros_membro),
+        ])
+        async with admission_controller.admit("comissao", memory):
+            envio = await run_in_process_pool(
+                calcular_envio_ledger, paths[0], paths[1], ledger.data_inicio, ledger.data_fim,
+                vendas_membro, parceiros_membro, conhecidas, ledger.parceiros_hash,
+                duplicadas or settings.COMISSAO_DEDUP_POLICY
+            )
+    finally:
+        remove_files(paths)
+
+    with stage("ledger_write"):
+        # Totais correntes: tira a contribuição registrada das vendas alteradas e soma a nova
+        totais: Dict[Tuple[str, str], List[int]] = {}
+        nomes = {}
+        if not envio.recalcular:
+            for total in await crud.get_comissao_ledger_totais(db, ledger.id):
+                key = (total.tipo, total.cnpj_cpf)
+                totais[key] = [
+                    total.quantidade_vendas, total.total_vendas_centavos,
+                    total.total_comissao_centavos, total.total_comissao_renovacao_centavos,
+                ]
+                nomes[key] = (total.nome, total.faixa_comissao)
+            alteradas = [key for key in envio.vendas if key in conhecidas]
+            for venda in await crud.get_comissao_ledger_vendas(db, ledger.id, alteradas):
+                aplicar_creditos(totais, vars(venda), -1)
+        nomes.update(envio.parceiros)
+
+        vendas = []
+        for (numero_pedido, numero_protocolo), values in envio.vendas.items():
+            venda = dict(zip(LEDGER_VENDA_FIELDS, values))
+            aplicar_creditos(totais, venda, 1)
+            venda.update(ledger_id=ledger.id, numero_pedido=numero_pedido, numero_protocolo=numero_protocolo)
+            vendas.append(venda)
+
+        linhas_totais = [
+            {
+                "ledger_id": ledger.id,
+                "tipo": tipo,
+                "cnpj_cpf": cnpj_cpf,
+                "nome": nomes.get((tipo, cnpj_cpf), ("", ""))[0],
+                "faixa_comissao": nomes.get((tipo, cnpj_cpf), ("", ""))[1],
+                "quantidade_vendas": quantidade,
+                "total_vendas_centavos": total_vendas,
+                "total_comissao_centavos": total_comissao,
+                "total_comissao_renovacao_centavos": total_renovacao,
+            }
+            for (tipo, cnpj_cpf), (quantidade, total_vendas, total_comissao, total_renovacao) in sorted(totais.items())
+            if quantidade
+        ]
+        saved = await crud.save_comissao_ledger(
+            db, ledger, versao, envio.parceiros_hash, vendas, linhas_totais, recalcular=envio.recalcular
+        )
+    if not saved:
+        raise HTTPException(status_code=409, detail="O ledger foi atualizado por outro envio; envie novamente")
+
+    novas = sum(1 for key in envio.vendas if key not in conhecidas) if not envio.recalcular else len(envio.vendas)
+    return schemas.ComissaoLedgerAtualizacao(
+        ledger=ledger_detalhe(ledger, await crud.get_comissao_ledger_totais(db, ledger.id)),
+        lidas=envio.lidas,
+        novas=novas,
+        alteradas=len(envio.vendas) - novas,
+        inalteradas=envio.inalteradas,
+        duplicadas=envio.duplicadas,
+        recalculado=envio.recalcular,
+    )
@@ -0,0 +1,212 @@
+# routers/compressed.py
+"""Uploads compactados: gzip (``.csv.gz``), zip e zstd.
+
+O formato é detectado pelos primeiros bytes do arquivo (não pela extensão) e
+o conteúdo é descompactado em streaming, um bloco por vez: o arquivo
+descompactado nunca fica inteiro na memória.
+
+- CSVs (comissão): os blocos descompactados vão direto para o leitor de linhas
+  (``csv_reader.iter_chunk_lines``).
+- Planilhas (conversores): o leitor de XLSX precisa de acesso aleatório ao
+  zip, então a planilha é descompactada em streaming para um arquivo
+  temporário no disco.
+
+No zip é usado o membro pedido pelo nome ou, sem nome, o primeiro arquivo. Um
+``.xlsx`` também é um zip; ele só é tratado como compactado quando não é uma
+planilha (sem ``[Content_Types].xml``).
+
+O suporte a zstd depende do pacote ``zstandard``; sem ele, uploads zstd
+recebem 415.
+"""
+import os
+import struct
+import zipfile
+import zlib
+from contextlib import contextmanager
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+from fastapi import HTTPException
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependência opcional
+    zstandard = None
+
+from .utils import new_temp_path, remove_files
+
+GZIP = "gzip"
+ZIP = "zip"
+ZSTD = "zstd"
+
+# Tamanho dos blocos lidos do arquivo compactado
+DECOMPRESS_BLOCK_SIZE = 1024 * 1024
+
+_MAGIC_NUMBERS = (
+    (b"\x1f\x8b", GZIP),
+    (b"\x28\xb5\x2f\xfd", ZSTD),
+    (b"PK\x03\x04", ZIP),
+    (b"PK\x05\x06", ZIP),  # zip vazio
+)
+
+# Quanto os arquivos costumam crescer ao descompactar, quando o tamanho real não está no arquivo
+DEFAULT_EXPANSION_FACTOR = 10
+
+
+def detect_compression(head: bytes) -> Optional[str]:
+    """Formato de compactação pelo início do arquivo (None se não for compactado)."""
+    for magic, name in _MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def detect_file_compression(path: str) -> Optional[str]:
+    with open(path, "rb") as f:
+        return detect_compression(f.read(4))
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise HTTPException(status_code=415, detail="Arquivos zstd não são suportados neste servidor")
+
+
+def _is_xlsx(archive: zipfile.ZipFile) -> bool:
+    return "[Content_Types].xml" in archive.NameToInfo
+
+
+def _zip_member(archive: zipfile.ZipFile, member: Optional[str]) -> zipfile.ZipInfo:
+    """Membro pedido pelo nome ou o primeiro arquivo do zip."""
+    if member:
+        try:
+            return archive.getinfo(member)
+        except KeyError:
+            raise HTTPException(status_code=400, detail=f"Arquivo '{member}' não encontrado no zip")
+    for info in archive.infolist():
+        if not info.is_dir():
+            return info
+    raise HTTPException(status_code=400, detail="O arquivo zip está vazio")
+
+
+def _open_zip(path: str) -> zipfile.ZipFile:
+    try:
+        return zipfile.ZipFile(path)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Arquivo zip inválido")
+
+
+# --- Descompactação de pedaços (upload chegando ou arquivo em disco) ---
+
+def _gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    decompressor = zlib.decompressobj(wbits=31)
+    for chunk in chunks:
+        while chunk:
+            # gzip pode ter vários membros concatenados (ex: arquivos juntados com cat)
+            if decompressor.eof:
+                decompressor = zlib.decompressobj(wbits=31)
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+            chunk = decompressor.unused_data if decompressor.eof else b""
+    if not decompressor.eof:
+        raise zlib.error("arquivo gzip incompleto")
+
+
+def _zstd_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    _require_zstandard()
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+    for chunk in chunks:
+        while chunk:
+            # Um frame por vez, como no gzip (zstd -c a b > c gera vários frames)
+            if decompressor.eof:
+                decompressor = zstandard.ZstdDecompressor().decompressobj()
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+            chunk = decompressor.unused_data if decompressor.eof else b""
+    if not decompressor.eof:
+        raise zstandard.ZstdError("arquivo zstd incompleto")
+
+
+def iter_decompressed(chunks: Iterable[bytes], compression: str) -> Iterator[bytes]:
+    """Descompacta gzip ou zstd pedaço por pedaço (zip precisa do arquivo inteiro: ``open_decompressed``)."""
+    decompress = _gzip_chunks if compression == GZIP else _zstd_chunks
+    try:
+        yield from decompress(chunks)
+    except zlib.error:
+        raise HTTPException(status_code=400, detail="Arquivo gzip inválido ou incompleto")
+    except Exception as e:
+        if zstandard is not None and isinstance(e, zstandard.ZstdError):
+            raise HTTPException(status_code=400, detail="Arquivo zstd inválido ou incompleto")
+        raise
+
+
+def _read_blocks(f: BinaryIO) -> Iterator[bytes]:
+    while block := f.read(DECOMPRESS_BLOCK_SIZE):
+        yield block
+
+
+@contextmanager
+def open_decompressed(path: str, compression: str, member: Optional[str] = None):
+    """Blocos descompactados do arquivo salvo em disco (gzip, zstd ou membro do zip)."""
+    if compression == ZIP:
+        with _open_zip(path) as archive, archive.open(_zip_member(archive, member)) as f:
+            yield _read_blocks(f)
+        return
+    with open(path, "rb") as f:
+        yield iter_decompressed(_read_blocks(f), compression)
+
+
+# --- Tamanho descompactado (para a estimativa de memória da admissão) ---
+
+def expanded_size(path: str, member: Optional[str] = None) -> int:
+    """Tamanho do arquivo depois de descompactado (estimado quando o formato não informa)."""
+    size = os.path.getsize(path)
+    compression = detect_file_compression(path)
+    if compression == ZIP:
+        with _open_zip(path) as archive:
+            if _is_xlsx(archive):
+                return size
+            return _zip_member(archive, member).file_size
+    if compression == GZIP and size >= 18:
+        # ISIZE: tamanho descompactado (módulo 4 GB) do último membro
+        with open(path, "rb") as f:
+            f.seek(-4, os.SEEK_END)
+            isize = struct.unpack("<I", f.read(4))[0]
+        return max(isize, size)
+    if compression == ZSTD and zstandard is not None:
+        with open(path, "rb") as f:
+            try:
+                content_size = zstandard.frame_content_size(f.read(18))
+            except zstandard.ZstdError:
+                content_size = -1
+        # Só o primeiro frame informa o tamanho; em arquivos com vários frames é uma estimativa
+        if content_size > 0:
+            return max(content_size, size)
+    if compression is not None:
+        return size * DEFAULT_EXPANSION_FACTOR
+    return size
+
+
+# --- Planilhas ---
+
+def decompress_to_file(path: str, member: Optional[str] = None, suffix: str = ".xlsx") -> Optional[str]:
+    """Descompacta o upload para um arquivo temporário; retorna None se ele não estiver compactado.
+
+    Executado no pool de processos. O chamador remove o arquivo gerado.
+    """
+    compression = detect_file_compression(path)
+    if compression is None:
+        return None
+    if compression == ZIP:
+        with _open_zip(path) as archive:
+            if _is_xlsx(archive):
+                return None
+    output_path = new_temp_path(suffix=suffix)
+    try:
+        with open_decompressed(path, compression, member) as blocks, open(output_path, "wb") as output:
+            for block in blocks:
+                output.write(block)
+    except BaseException:
+        remove_files([output_path])
+        raise
+    return output_path
@@ -0,0 +1,138 @@
+# routers/conversion_cache.py
+"""Cache em disco dos arquivos convertidos.
+
+A chave é o SHA-256 do arquivo enviado somado ao tipo de conversão, ao formato
+de saída, ao mtime do template e, no TEC-D, a uma versão da tabela de
+agentes/localidades. Assim o mesmo upload (ex: depois de um download que falhou
+no navegador) é servido direto do disco.
+
+O tamanho total é limitado: quando passa do limite, os arquivos usados há mais
+tempo são removidos (o mtime é atualizado a cada acerto). Um acerto já abre o
+arquivo: se outra requisição removê-lo logo depois, o envio continua pelo
+arquivo aberto.
+"""
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, List, Optional
+
+from starlette.background import BackgroundTask
+from starlette.responses import StreamingResponse
+
+from ..config import settings
+
+
+class ConversionCache:
+    def __init__(self, directory: str, max_bytes: int, enabled: bool = True):
+        self.directory = Path(directory or os.path.join(tempfile.gettempdir(), "conversao-planilhas-cache"))
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha256("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        """Abre o arquivo em cache (e marca como usado) ou retorna None."""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(f.fileno())
+        except OSError:
+            pass
+        return f
+
+    def put_bytes(self, key: str, content: bytes) -> Optional[str]:
+        return self._put(key, lambda output: output.write(content))
+
+    def put_files(self, key: str, paths: List[str]) -> Optional[str]:
+        """Guarda a concatenação dos arquivos (ex: partes de um CSV) sob a chave."""
+        def write(output):
+            for path in paths:
+                with open(path, "rb") as f:
+                    while chunk := f.read(64 * 1024):
+                        output.write(chunk)
+        return self._put(key, write)
+
+    def _put(self, key: str, write) -> Optional[str]:
+        if not self.enabled:
+            return None
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as output:
+                    write(output)
+                # Troca atômica: outros workers nunca leem um arquivo pela metade
+                os.replace(tmp_path, self._path(key))
+            except Exception:
+                os.remove(tmp_path)
+                raise
+            self._evict(keep=key)
+        except OSError as e:
+            print(f"Não foi possível gravar no cache de conversões: {e}")
+            return None
+        return str(self._path(key))
+
+    def _evict(self, keep: str):
+        """Remove os arquivos usados há mais tempo até caber no limite."""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or entry.name.endswith(".tmp"):
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.name))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            try:
+                os.remove(self._path(name))
+                total -= size
+            except FileNotFoundError:
+                pass
+
+
+conversion_cache = ConversionCache(
+    settings.CONVERSION_CACHE_DIR,
+    settings.CONVERSION_CACHE_MAX_BYTES,
+    enabled=settings.CONVERSION_CACHE_ENABLED
+)
+
+
+# Tamanho dos blocos enviados de um arquivo em cache
+CACHE_CHUNK_SIZE = 64 * 1024
+
+
+def _iter_open_file(f: BinaryIO):
+    with f:
+        while chunk := f.read(CACHE_CHUNK_SIZE):
+            yield chunk
+
+
+def cached_file_response(f: BinaryIO, media_type: str, filename: str, hit: bool) -> StreamingResponse:
+    """Envia um arquivo do cache já aberto (``ConversionCache.open``) e fecha-o ao final."""
+    return StreamingResponse(
+        _iter_open_file(f),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Content-Length": str(os.fstat(f.fileno()).st_size),
+            "X-Cache": "HIT" if hit else "MISS",
+        },
+        background=BackgroundTask(f.close)
+    )
@@ -0,0 +1,175 @@
+# routers/csv_reader.py
+"""Leitor de CSV direto dos bytes do arquivo (mmap), sem carregar o texto inteiro.
+
+Ler um CSV com ``f.read()`` + ``decode`` + ``io.StringIO`` mantém três cópias do
+arquivo na memória ao mesmo tempo. Aqui o arquivo salvo em disco é mapeado
+(``mmap``) a partir de ``CSV_MMAP_MIN_BYTES`` e percorrido em blocos de
+``CSV_BLOCK_SIZE`` bytes: cada linha é decodificada sozinha e só as colunas
+pedidas (até a última delas) são separadas e guardadas.
+
+O leitor trabalha sobre um iterador de linhas, então também serve para dados
+que ainda estão chegando (``iter_chunk_lines`` com os pedaços do upload) e para
+arquivos compactados, descompactados em streaming (``open_csv_lines``).
+
+Linhas com aspas (campos com ``;`` ou quebras de linha dentro) são entregues ao
+módulo ``csv``, que pede as linhas seguintes quando o campo continua; o
+resultado é o mesmo do ``csv.reader`` com o arquivo inteiro.
+"""
+import csv
+import mmap
+import os
+from contextlib import contextmanager
+from itertools import chain
+from operator import itemgetter
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from ..config import settings
+from . import compressed
+from .utils import new_temp_path, remove_files
+
+# Tamanho dos blocos copiados do mmap de cada vez
+CSV_BLOCK_SIZE = 4 * 1024 * 1024
+
+UTF8_BOM = b"\xef\xbb\xbf"
+
+
+@contextmanager
+def open_csv_buffer(path: str):
+    """Conteúdo do arquivo como buffer de bytes: ``mmap`` se for grande, ``bytes`` se for pequeno.
+
+    As strings devolvidas pelo leitor são cópias, então continuam válidas depois
+    que o buffer é fechado.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < max(1, settings.CSV_MMAP_MIN_BYTES):
+            yield f.read()
+            return
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield buffer
+        finally:
+            buffer.close()
+
+
+@contextmanager
+def open_csv_lines(path: str, member: Optional[str] = None):
+    """Linhas do CSV salvo em disco; gzip, zip (``member`` ou o primeiro) e zstd são descompactados em streaming."""
+    compression = compressed.detect_file_compression(path)
+    if compression is None:
+        with open_csv_buffer(path) as buffer:
+            yield iter_lines(buffer)
+        return
+    with compressed.open_decompressed(path, compression, member) as blocks:
+        yield iter_chunk_lines(blocks)
+
+
+@contextmanager
+def open_chunk_lines(chunks: Iterable[bytes], member: Optional[str] = None):
+    """Como ``open_csv_lines``, para pedaços que ainda estão chegando (upload em streaming).
+
+    gzip e zstd são descompactados conforme chegam; um zip precisa do índice
+    do fim do arquivo, então é gravado em disco antes de ser lido.
+    """
+    chunks = iter(chunks)
+    head = b""
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= 4:
+            break
+    data = chain([head], chunks)
+    compression = compressed.detect_compression(head)
+    if compression is None:
+        yield iter_chunk_lines(data)
+    elif compression == compressed.ZIP:
+        path = new_temp_path(suffix=".zip")
+        try:
+            with open(path, "wb") as f:
+                for chunk in data:
+                    f.write(chunk)
+            with open_csv_lines(path, member) as lines:
+                yield lines
+        finally:
+            remove_files([path])
+    else:
+        yield iter_chunk_lines(compressed.iter_decompressed(data, compression))
+
+
+def iter_chunk_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Linhas (sem o ``\\n``/``\\r\\n``) de uma sequência de pedaços de bytes (blocos do mmap, upload...)."""
+    carry = b""
+    for chunk in chunks:
+        if not chunk:
+            continue
+        lines = (carry + chunk).split(b"\n")
+        # A última linha do pedaço pode continuar no próximo
+        carry = lines.pop()
+        for line in lines:
+            yield line[:-1] if line.endswith(b"\r") else line
+    if carry:
+        yield carry[:-1] if carry.endswith(b"\r") else carry
+
+
+def iter_lines(buffer, start: int = 0) -> Iterator[bytes]:
+    """Linhas do buffer (bytes ou mmap) a partir da posição ``start``, copiando um bloco por vez."""
+    return iter_chunk_lines(
+        buffer[position:position + CSV_BLOCK_SIZE] for position in range(start, len(buffer), CSV_BLOCK_SIZE)
+    )
+
+
+def _quoted_row(line: bytes, lines: Iterator[bytes], delimiter: str, encoding: str) -> List[str]:
+    """Lê com o módulo csv o registro que começa em ``line`` (pode consumir as linhas seguintes)."""
+    text_lines = (item.decode(encoding) + "\n" for item in chain([line], lines))
+    return next(csv.reader(text_lines, delimiter=delimiter), [])
+
+
+def read_header(lines: Iterator[bytes], delimiter: str = ";", encoding: str = "utf-8") -> List[str]:
+    """Lê o header (primeiro registro) das linhas; as próximas do iterador são os dados."""
+    line = next(lines, None)
+    if line is None:
+        return []
+    if line.startswith(UTF8_BOM):
+        line = line[len(UTF8_BOM):]
+    if b'"' in line:
+        return _quoted_row(line, lines, delimiter, encoding)
+    text = line.decode(encoding)
+    return text.split(delimiter) if text else []
+
+
+def iter_projected_rows(
+    lines: Iterator[bytes],
+    indices: Sequence[Optional[int]],
+    delimiter: str = ";",
+    encoding: str = "utf-8",
+) -> Iterator[Tuple[str, ...]]:
+    """Só as colunas ``indices`` de cada linha, como tuplas de strings sem espaços nas pontas.
+
+    Colunas ausentes (None) e células além do fim de linhas curtas viram "".
+    Linhas vazias são ignoradas, como no ``csv.DictReader``.
+    """
+    present = [index for index in indices if index is not None]
+    width = max(present) + 1 if present else 0
+    fast = len(present) == len(indices) and len(indices) > 1
+    getter = itemgetter(*indices) if fast else None
+    strip = str.strip
+
+    def slow_path(values: List[str]) -> Tuple[str, ...]:
+        return tuple(
+            strip(values[index]) if index is not None and index < len(values) else ""
+            for index in indices
+        )
+
+    for line in lines:
+        if not line:
+            continue
+        if b'"' in line:
+            values = _quoted_row(line, lines, delimiter, encoding)
+            if not values:
+                continue
+        else:
+            # Separa só até a última coluna usada; o resto da linha fica num pedaço só
+            values = line.decode(encoding).split(delimiter, width)
+        if fast and len(values) >= width:
+            yield tuple(map(strip, getter(values)))
+        else:
+            yield slow_path(values)
@@ -0,0 +1,191 @@
+# routers/importacao.py
+"""Leitura e validação das importações em lote (agentes e localidades).
+
+As linhas vêm de um JSON ou de um arquivo CSV/XLSX e são validadas em memória;
+cada linha recebe um resultado no relatório (inserido, atualizado ou erro).
+"""
+import csv
+import io
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from pydantic import BaseModel, ValidationError
+from unidecode import unidecode
+
+from .. import schemas
+from ..admission import admit_uploads
+from .utils import remove_files, run_in_process_pool, spool_upload_to_disk_async
+from .xlsx_reader import open_sheet_reader, read_header
+
+IMPORT_FILE_SUFFIXES = (".csv", ".xlsx")
+
+STATUS_INSERIDO = "inserido"
+STATUS_ATUALIZADO = "atualizado"
+STATUS_ERRO = "erro"
+
+
+def normalize_import_header(value) -> str:
+    return unidecode(str(value)).lower().strip().replace(" ", "_")
+
+
+def format_import_value(value) -> str:
+    """Valor da célula como texto (o Excel guarda CPFs e códigos numéricos como número)."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def map_import_header(header_values, columns: Dict[str, List[str]]) -> Dict[str, int]:
+    """Mapeia cada campo para a posição (a partir de 0) da coluna correspondente no arquivo.
+
+    ``columns`` lista, para cada campo, os nomes aceitos no header (já normalizados).
+    Campos sem coluna no arquivo ficam de fora do mapeamento.
+    """
+    positions = {normalize_import_header(value): index for index, value in enumerate(header_values) if value}
+    field_positions = {}
+    for field, names in columns.items():
+        for name in names:
+            if name in positions:
+                field_positions[field] = positions[name]
+                break
+    return field_positions
+
+
+def _rows_to_records(rows, field_positions: Dict[str, int]) -> List[Tuple[int, dict]]:
+    records = []
+    for line_number, values in rows:
+        if all(format_import_value(value) == "" for value in values):
+            continue
+        record = {
+            field: format_import_value(values[position]) if position < len(values) else ""
+            for field, position in field_positions.items()
+        }
+        records.append((line_number, record))
+    return records
+
+
+def _check_required_columns(field_positions: Dict[str, int], required: List[str]):
+    missing = [field for field in required if field not in field_positions]
+    if missing:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Colunas obrigatórias não encontradas no arquivo: {', '.join(missing)}"
+        )
+
+
+def read_import_file(path: str, suffix: str, columns: Dict[str, List[str]], required: List[str]) -> List[Tuple[int, dict]]:
+    """Lê o arquivo de importação e retorna [(número da linha, {campo: valor})]."""
+    if suffix == ".xlsx":
+        reader = open_sheet_reader(path)
+        try:
+            title = reader.active_title
+            field_positions = map_import_header(read_header(reader, title), columns)
+            _check_required_columns(field_positions, required)
+            rows = enumerate(reader.iter_rows(title, min_row=2), start=2)
+            return _rows_to_records(rows, field_positions)
+        finally:
+            reader.close()
+
+    with open(path, "rb") as f:
+        content = f.read()
+    try:
+        text = content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = content.decode("latin-1")
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=";,")
+        delimiter = dialect.delimiter
+    except csv.Error:
+        delimiter = ";"
+    csv_rows = csv.reader(io.StringIO(text), delimiter=delimiter)
+    header_values = next(csv_rows, [])
+    field_positions = map_import_header(header_values, columns)
+    _check_required_columns(field_positions, required)
+    return _rows_to_records(enumerate(csv_rows, start=2), field_positions)
+
+
+async def parse_import_upload(upload: UploadFile, columns: Dict[str, List[str]], required: List[str]) -> List[Tuple[int, dict]]:
+    suffix = os.path.splitext(upload.filename or "")[1].lower()
+    if suffix not in IMPORT_FILE_SUFFIXES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Formato de arquivo não suportado. Use: {', '.join(IMPORT_FILE_SUFFIXES)}"
+        )
+    path = await spool_upload_to_disk_async(upload, suffix=suffix)
+    try:
+        async with admit_uploads("importacao", upload):
+            return await run_in_process_pool(read_import_file, path, suffix, columns, required)
+    finally:
+        remove_files([path])
+
+
+def validate_import_rows(
+    records: List[Tuple[int, dict]],
+    schema: type,
+    key_field: str,
+    check: Optional[Callable[[BaseModel], Optional[str]]] = None,
+) -> Tuple[List[Tuple[int, str, BaseModel]], List[schemas.ImportRowResult]]:
+    """Valida as linhas com o schema e descarta chaves repetidas dentro da importação.
+
+    ``check`` pode retornar uma mensagem de erro adicional para a linha.
+    Retorna as linhas válidas como (linha, chave, item) e os erros encontrados.
+    """
+    valid = []
+    errors = []
+    seen: Dict[str, int] = {}
+    for line_number, record in records:
+        # No JSON uma linha pode nem ser um objeto: o schema aponta o erro só nela
+        key = str(record.get(key_field) or "") if isinstance(record, dict) else ""
+        try:
+            item = schema.model_validate(record)
+        except ValidationError as e:
+            detail = "; ".join(
+                f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" if error["loc"] else error["msg"]
+                for error in e.errors()
+            )
+            errors.append(schemas.ImportRowResult(linha=line_number, chave=key, status=STATUS_ERRO, detalhe=detail))
+            continue
+
+        key = getattr(item, key_field)
+        detail = check(item) if check else None
+        if detail is None and key in seen:
+            detail = f"Registro repetido na importação (linha {seen[key]})."
+        if detail:
+            errors.append(schemas.ImportRowResult(linha=line_number, chave=key, status=STATUS_ERRO, detalhe=detail))
+            continue
+        seen[key] = line_number
+        valid.append((line_number, key, item))
+    return valid, errors
+
+
+def json_import_records(items: List[Any]) -> List[Tuple[int, Any]]:
+    """Numera as linhas recebidas no JSON; cada uma é validada à parte em ``validate_import_rows``."""
+    return list(enumerate(items, start=1))
+
+
+def build_import_report(results: List[schemas.ImportRowResult]) -> schemas.ImportReport:
+    results = sorted(results, key=lambda result: result.linha)
+    counts = {STATUS_INSERIDO: 0, STATUS_ATUALIZADO: 0, STATUS_ERRO: 0}
+    for result in results:
+        counts[result.status] += 1
+    return schemas.ImportReport(
+        total=len(results),
+        inseridos=counts[STATUS_INSERIDO],
+        atualizados=counts[STATUS_ATUALIZADO],
+        erros=counts[STATUS_ERRO],
+        linhas=results,
+    )
+
+
+def written_rows_results(valid: List[Tuple[int, str, BaseModel]], existing_keys: set) -> List[schemas.ImportRowResult]:
+    return [
+        schemas.ImportRowResult(
+            linha=line_number,
+            chave=key,
+            status=STATUS_ATUALIZADO if key in existing_keys else STATUS_INSERIDO,
+        )
+        for line_number, key, _ in valid
+    ]
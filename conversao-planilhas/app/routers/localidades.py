@@ -1,11 +1,13 @@
 # routers/localidades.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException, UploadFile, File, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import Any, List, Optional, Tuple
 
 from .. import crud, models, schemas
 from ..database import get_db
 from ..auth import get_current_active_user
+from .utils import MAX_PAGE_SIZE, set_next_cursor
+from .importacao import build_import_report, json_import_records, parse_import_upload, validate_import_rows, written_rows_results
 
 router = APIRouter(
     prefix="/localidades",
@@ -26,9 +28,64 @@ async def create_localidade(
 
 @router.get("/", response_model=List[schemas.Localidade])
 async def read_localidades(
-    skip: int = 0, 
-    limit: int = 100, 
+    response: Response,
+    cursor: Optional[int] = Query(None, description="Id da última localidade da página anterior (header X-Next-Cursor)"),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    codigo_localidade: Optional[str] = None,
+    nome: Optional[str] = Query(None, description="Prefixo do nome"),
     db: AsyncSession = Depends(get_db)
 ):
-    localidades = await crud.get_localidades(db, skip=skip, limit=limit)
-    return localidades
\ No newline at end of file
+    localidades = await crud.get_localidades(
+        db, after_id=cursor, limit=limit, codigo_localidade=codigo_localidade, nome_prefix=nome
+    )
+    set_next_cursor(response, localidades, limit)
+    return localidades
+
+
+# --- Importação em lote ---
+
+# Nomes aceitos no header do arquivo (normalizados) para cada campo
+LOCALIDADE_IMPORT_COLUMNS = {
+    "codigo_localidade": ["codigo_localidade", "codigo", "localidade_codigo"],
+    "nome": ["nome", "nome_localidade", "localidade_atendimento"],
+}
+
+
+async def import_localidades(db: AsyncSession, records: List[Tuple[int, dict]]) -> schemas.ImportReport:
+    """Valida as localidades em memória e grava todas de uma vez (insere ou atualiza pelo código)."""
+    for _, record in records:
+        if not isinstance(record, dict):
+            continue
+        record["codigo_localidade"] = str(record.get("codigo_localidade") or "").strip()
+        record["nome"] = str(record.get("nome") or "").strip()
+
+    def check(localidade: schemas.LocalidadeCreate):
+        if not localidade.codigo_localidade:
+            return "Código da localidade não informado."
+        if len(localidade.codigo_localidade) > 50:
+            return "Código da localidade com mais de 50 caracteres."
+        if not localidade.nome:
+            return "Nome da localidade não informado."
+        return None
+
+    valid, errors = validate_import_rows(records, schemas.LocalidadeCreate, "codigo_localidade", check)
+    existing_codigos = await crud.get_existing_localidade_codigos(db, [codigo for _, codigo, _ in valid])
+    await crud.upsert_localidades(db, [localidade.model_dump() for _, _, localidade in valid])
+    return build_import_report(errors + written_rows_results(valid, existing_codigos))
+
+
+@router.post("/importar", response_model=schemas.ImportReport)
+async def importar_localidades(
+    localidades: List[Any] = Body(..., description="Lista de localidades (codigo_localidade, nome); linhas inválidas voltam como erro no relatório"),
+    db: AsyncSession = Depends(get_db)
+):
+    return await import_localidades(db, json_import_records(localidades))
+
+
+@router.post("/importar-arquivo", response_model=schemas.ImportReport)
+async def importar_localidades_arquivo(
+    arquivo: UploadFile = File(..., description="CSV ou XLSX com as colunas codigo_localidade e nome"),
+    db: AsyncSession = Depends(get_db)
+):
+    records = await parse_import_upload(arquivo, LOCALIDADE_IMPORT_COLUMNS, required=["codigo_localidade", "nome"])
+    return await import_localidades(db, records)
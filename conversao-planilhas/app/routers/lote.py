@@ -0,0 +1,191 @@
+# routers/lote.py
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
+from starlette.background import BackgroundTask
+from starlette.responses import FileResponse
+
+from ..admission import admission_controller, estimate_memory, upload_size
+from ..auth import get_current_active_user
+from ..config import settings
+from .pipeline import convert_to_xlsx_file
+from .remuneracao import remuneracao_pipeline
+from .tecd import tecd_pipeline
+
+router = APIRouter(
+    tags=["Conversores"],
+    dependencies=[Depends(get_current_active_user)]
+)
+
+PIPELINES = {
+    "remuneracao": remuneracao_pipeline,
+    "tecd": tecd_pipeline,
+}
+
+
+def is_zip_upload(arquivo: UploadFile) -> bool:
+    return (arquivo.filename or "").lower().endswith(".zip")
+
+
+def is_planilha_member(member: zipfile.ZipInfo) -> bool:
+    return member.filename.lower().endswith(".xlsx") and not member.filename.startswith("__MACOSX")
+
+
+def open_upload_zip(arquivo: UploadFile) -> zipfile.ZipFile:
+    try:
+        return zipfile.ZipFile(arquivo.file)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail=f"Arquivo '{Path(arquivo.filename).name}' não é um zip válido.")
+
+
+def upload_sizes(arquivos: List[UploadFile]) -> List[int]:
+    """Tamanho de cada planilha enviada, sem extrair nada (nos zips, pelo diretório do zip)."""
+    sizes = []
+    for arquivo in arquivos:
+        if is_zip_upload(arquivo):
+            with open_upload_zip(arquivo) as zf:
+                sizes.extend(member.file_size for member in zf.infolist() if is_planilha_member(member))
+        else:
+            sizes.append(upload_size(arquivo))
+    return sizes
+
+
+def expand_uploads(arquivos: List[UploadFile], tmp_dir: str) -> List[Tuple[str, Optional[str]]]:
+    """Salva os arquivos enviados em disco, extraindo as planilhas de arquivos .zip.
+
+    Retorna uma lista de (nome, caminho em disco) na ordem recebida; nos zips o
+    nome é o caminho dentro do zip. Arquivos do zip que não são planilhas .xlsx
+    entram com caminho None (ignorados, mas listados no manifesto).
+    """
+    entradas = []
+    for arquivo in arquivos:
+        if is_zip_upload(arquivo):
+            with open_upload_zip(arquivo) as zf:
+                for member in zf.infolist():
+                    if member.is_dir():
+                        continue
+                    if not is_planilha_member(member):
+                        entradas.append((member.filename, None))
+                        continue
+                    path = os.path.join(tmp_dir, f"{len(entradas)}.xlsx")
+                    with zf.open(member) as src, open(path, "wb") as dst:
+                        shutil.copyfileobj(src, dst)
+                    entradas.append((member.filename, path))
+        else:
+            path = os.path.join(tmp_dir, f"{len(entradas)}.xlsx")
+            arquivo.file.seek(0)
+            with open(path, "wb") as dst:
+                shutil.copyfileobj(arquivo.file, dst)
+            entradas.append((Path(arquivo.filename or "planilha.xlsx").name, path))
+    return entradas
+
+
+def output_name(nome: str, usados: set) -> str:
+    """Gera um nome único para o arquivo convertido dentro do zip."""
+    base = f"{Path(nome).stem}-Convertido"
+    candidato = f"{base}.xlsx"
+    contador = 2
+    while candidato in usados:
+        candidato = f"{base}-{contador}.xlsx"
+        contador += 1
+    usados.add(candidato)
+    return candidato
+
+
+def write_output_zip(output_path: str, entradas: List[Tuple[str, Optional[str]]], resultados: list):
+    """Monta o zip de saída com os arquivos convertidos (já em disco) e o manifesto."""
+    manifesto = []
+    usados = set()
+    resultados = iter(resultados)
+    with zipfile.ZipFile(output_path, "w") as zf:
+        for nome, path in entradas:
+            if path is None:
+                manifesto.append({"arquivo": nome, "status": "ignorado", "detalhe": "Não é uma planilha .xlsx."})
+                continue
+            resultado = next(resultados)
+            if isinstance(resultado, HTTPException):
+                manifesto.append({"arquivo": nome, "status": "erro", "detalhe": resultado.detail})
+            elif isinstance(resultado, Exception):
+                print(f"Ocorreu um erro inesperado ao converter {nome}: {resultado}")
+                manifesto.append({"arquivo": nome, "status": "erro", "detalhe": str(resultado)})
+            else:
+                saida = output_name(nome, usados)
+                zf.write(resultado, saida)
+                manifesto.append({"arquivo": nome, "status": "ok", "saida": saida})
+        zf.writestr(
+            "manifesto.json",
+            json.dumps(manifesto, ensure_ascii=False, indent=2),
+            compress_type=zipfile.ZIP_DEFLATED
+        )
+
+
+@router.post(
+    "/converter-lote/",
+    summary="Converte várias planilhas de uma vez",
+    description="Recebe um ou mais arquivos (planilhas .xlsx ou .zip com planilhas) e converte todos "
+                "com o conversor escolhido (remuneracao ou tecd). Retorna um zip com os arquivos "
+                "convertidos e um manifesto.json com o status de cada arquivo."
+)
+async def converter_lote(
+    tipo: str = Form(..., description="Tipo de conversão: remuneracao ou tecd"),
+    arquivos: List[UploadFile] = File(..., description="Planilhas (.xlsx) ou arquivos .zip com planilhas")
+):
+    pipeline = PIPELINES.get(tipo)
+    if pipeline is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tipo de conversão inválido. Use: {', '.join(PIPELINES)}"
+        )
+
+    tmp_dir = tempfile.mkdtemp(prefix="lote-")
+    try:
+        # O custo vem do diretório dos zips; a extração já conta como parte da requisição admitida
+        memory = estimate_memory("lote", await asyncio.to_thread(upload_sizes, arquivos))
+        async with admission_controller.admit("lote", memory):
+            entradas = await asyncio.to_thread(expand_uploads, arquivos, tmp_dir)
+            planilhas = [(indice, path) for indice, (_, path) in enumerate(entradas) if path is not None]
+            if not planilhas:
+                raise HTTPException(status_code=400, detail="Nenhuma planilha .xlsx encontrada nos arquivos enviados.")
+
+            # As consultas (ex: agentes do TEC-D) são compartilhadas por todo o lote
+            lookups = pipeline.create_lookups()
+            semaphore = asyncio.Semaphore(settings.BATCH_CONCURRENCY)
+
+            async def converter(indice: int, path: str) -> str:
+                # Cada resultado vai direto para o disco: o lote nunca fica inteiro na memória
+                output_path = os.path.join(tmp_dir, f"{indice}-convertido.xlsx")
+                async with semaphore:
+                    await convert_to_xlsx_file(pipeline, path, output_path, lookups)
+                return output_path
+
+            resultados = await asyncio.gather(
+                *[converter(indice, path) for indice, path in planilhas],
+                return_exceptions=True
+            )
+
+        output_path = os.path.join(tmp_dir, "convertidos.zip")
+        await asyncio.to_thread(write_output_zip, output_path, entradas, resultados)
+
+        return FileResponse(
+            output_path,
+            media_type="application/zip",
+            filename="Planilhas-Convertidas.zip",
+            background=BackgroundTask(shutil.rmtree, tmp_dir, ignore_errors=True)
+        )
+
+    except HTTPException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    except Exception as e:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        print(f"Ocorreu um erro inesperado: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ocorreu um erro inesperado ao processar os arquivos: {str(e)}"
+        )
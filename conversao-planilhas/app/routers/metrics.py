@@ -0,0 +1,23 @@
+# routers/metrics.py
+from fastapi import APIRouter, Depends
+from starlette.responses import PlainTextResponse
+
+from ..auth import verify_admin_token
+from ..metrics import render_metrics
+
+# As métricas expõem o tráfego por rota, tamanhos de upload e memória do processo:
+# só com o header X-Admin-Token, como os endpoints administrativos de /auth
+router = APIRouter(
+    tags=["Monitoramento"],
+    dependencies=[Depends(verify_admin_token)]
+)
+
+
+@router.get(
+    "/metrics",
+    summary="Métricas no formato do Prometheus",
+    description="Requer o header X-Admin-Token (configure-o no scrape do Prometheus).",
+    response_class=PlainTextResponse
+)
+async def read_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,436 @@
+# routers/pipeline.py
+"""Motor de conversão de planilhas em etapas encadeadas (geradores).
+
+Todo conversor segue as mesmas etapas:
+
+1. leitura (``open_sheet_reader``) das sheets escolhidas pelo ``select_sheets``;
+2. mapeamento de colunas, compilado uma vez por sheet a partir do header;
+3. cadeia de transformações aplicadas em lotes de linhas (``Transform``),
+   que podem usar dados de consultas carregadas antes (``Lookup``);
+4. escrita (xlsx no template ou CSV).
+
+As etapas são geradores ligados entre si, então cada sheet é processada em
+streaming dentro de um processo do pool. Um conversor novo é só um
+``ConverterPipeline`` configurado com algumas transformações.
+"""
+import asyncio
+import io
+import os
+import pickle
+from abc import ABC, abstractmethod
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from fastapi import UploadFile
+from starlette.responses import StreamingResponse
+
+from ..admission import admission_controller, estimate_memory
+from ..instrumentation import add_bytes_out, add_rows, stage
+from . import compressed
+from .conversion_cache import cached_file_response, conversion_cache
+from .utils import (
+    MEDIA_TYPES,
+    XLSX_MEDIA_TYPE,
+    csv_file_response,
+    load_clean_template,
+    new_temp_path,
+    remove_files,
+    run_in_process_pool,
+    spool_upload_with_hash_async,
+    validate_output_format,
+    write_csv_rows,
+    write_rows_to_template,
+)
+from .xlsx_reader import open_sheet_reader, read_header
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+# --- Consultas e transformações ---
+
+class Lookup(ABC):
+    """Consulta assíncrona (ex: banco de dados) feita uma vez, antes de processar as linhas.
+
+    O resultado de ``load`` é enviado aos processos do pool junto com o contexto,
+    então deve ser serializável (dict, tuplas...). Uma mesma instância pode ser
+    compartilhada entre várias conversões (ex: conversão em lote).
+    """
+    name = ""
+
+    @abstractmethod
+    async def load(self):
+        """Carrega os dados usados pelas transformações."""
+
+    async def version(self) -> str:
+        """Carimbo de versão dos dados (entra na chave do cache de conversões)."""
+        return ""
+
+
+class Transform(ABC):
+    """Transformação aplicada a um lote de linhas (listas, na ordem das colunas de saída)."""
+
+    @abstractmethod
+    def bind(self, output_header: List[str]) -> Callable[[List[list], dict], None]:
+        """Resolve nomes de colunas em índices e retorna a função que altera o lote."""
+
+
+class ConstantColumn(Transform):
+    """Preenche uma coluna com um valor fixo (ex: VOUCHER vazio, preço fixo do TEC-D)."""
+
+    def __init__(self, column: str, value):
+        self.column = column
+        self.value = value
+
+    def bind(self, output_header):
+        index = output_header.index(self.column)
+        value = self.value
+
+        def apply(batch, context):
+            for row in batch:
+                row[index] = value
+        return apply
+
+
+class RowTransform(Transform):
+    """Aplica ``func(row, context)`` a cada linha do lote."""
+
+    def __init__(self, func: Callable[[list, dict], None]):
+        self.func = func
+
+    def bind(self, output_header):
+        func = self.func
+
+        def apply(batch, context):
+            for row in batch:
+                func(row, context)
+        return apply
+
+
+# --- Definição do conversor ---
+
+class ConverterPipeline:
+    """Configuração de um conversor de planilhas.
+
+    - ``select_sheets(reader)``: nomes das sheets de entrada, na ordem de saída;
+    - ``map_columns(header_values, output_header)``: para cada coluna de saída,
+      o índice (a partir de 1) da coluna na sheet de dados, ou None quando a
+      coluna é preenchida por uma transformação;
+    - ``output_header(template_header)``: colunas de saída (padrão: header do template).
+
+    As funções precisam estar no nível do módulo (sem lambdas), pois a definição
+    é enviada para os processos do pool.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        template_path: str,
+        select_sheets: Callable,
+        map_columns: Callable,
+        output_header: Optional[Callable] = None,
+        transforms: Sequence[Transform] = (),
+        lookups: Sequence[type] = (),
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ):
+        self.name = name
+        self.template_path = template_path
+        self.select_sheets = select_sheets
+        self.map_columns = map_columns
+        self.output_header = output_header
+        self.transforms = list(transforms)
+        self.lookups = list(lookups)
+        self.batch_size = batch_size
+
+    def get_output_header(self, template_header: list) -> List[str]:
+        if self.output_header is not None:
+            return self.output_header(template_header)
+        return [value for value in template_header if value]
+
+    def create_lookups(self) -> Dict[str, Lookup]:
+        return {lookup_class.name: lookup_class() for lookup_class in self.lookups}
+
+
+class CompiledMapping:
+    """Mapeamento de colunas compilado para uma sheet específica."""
+
+    def __init__(self, source_columns: List[Optional[int]]):
+        self.width = max([column for column in source_columns if column] or [0])
+        # Colunas sem origem apontam para uma posição extra sempre None
+        indexes = [column - 1 if column else self.width for column in source_columns]
+        self._padding = (None,) * (self.width + 1)
+        # Com dois ou mais índices o itemgetter já retorna uma tupla
+        self._getter = itemgetter(*indexes, self.width) if len(indexes) == 1 else itemgetter(*indexes)
+        self._single = len(indexes) == 1
+        self.read_columns = {column for column in source_columns if column}
+
+    def __call__(self, data_row: tuple) -> list:
+        if len(data_row) <= self.width:
+            data_row = data_row + self._padding[len(data_row):]
+        else:
+            data_row = data_row[:self.width] + (None,)
+        values = list(self._getter(data_row))
+        return values[:1] if self._single else values
+
+
+# --- Etapas (geradores) ---
+
+def source_rows(reader, sheet_title: str, columns) -> Iterator[tuple]:
+    """Linhas de dados não vazias da sheet (a partir da linha 2)."""
+    for data_row in reader.iter_rows(sheet_title, min_row=2, columns=columns):
+        if all(value is None for value in data_row):
+            continue
+        yield data_row
+
+
+def mapped_batches(rows: Iterable[tuple], mapping: CompiledMapping, batch_size: int) -> Iterator[List[list]]:
+    batch = []
+    for data_row in rows:
+        batch.append(mapping(data_row))
+        if len(batch) >= batch_size:
+            add_rows(len(batch))
+            yield batch
+            batch = []
+    if batch:
+        add_rows(len(batch))
+        yield batch
+
+
+def transformed_batches(batches, transforms, context: dict) -> Iterator[List[list]]:
+    for batch in batches:
+        for transform in transforms:
+            transform(batch, context)
+        yield batch
+
+
+def flatten(batches) -> Iterator[list]:
+    for batch in batches:
+        yield from batch
+
+
+def stream_sheet_batches(pipeline: ConverterPipeline, reader, sheet_title: str, output_header: List[str], context: dict):
+    """Liga as etapas de leitura, mapeamento e transformação de uma sheet (lotes de linhas)."""
+    with stage("header_map"):
+        header_values = read_header(reader, sheet_title)
+        mapping = CompiledMapping(pipeline.map_columns(header_values, output_header))
+        transforms = [transform.bind(output_header) for transform in pipeline.transforms]
+    rows = source_rows(reader, sheet_title, mapping.read_columns)
+    batches = mapped_batches(rows, mapping, pipeline.batch_size)
+    return transformed_batches(batches, transforms, context)
+
+
+def stream_sheet(pipeline: ConverterPipeline, reader, sheet_title: str, output_header: List[str], context: dict):
+    return flatten(stream_sheet_batches(pipeline, reader, sheet_title, output_header, context))
+
+
+# --- Execução nos processos do pool ---
+
+def list_sheets(pipeline: ConverterPipeline, data_path: str) -> List[str]:
+    reader = open_sheet_reader(data_path)
+    try:
+        return pipeline.select_sheets(reader)
+    finally:
+        reader.close()
+
+
+def sheet_to_spool(pipeline, data_path: str, sheet_title: str, output_header, context: dict, output_path: str):
+    """Grava os lotes de linhas da sheet (pickle, um após o outro) para o escritor ler em streaming."""
+    reader = open_sheet_reader(data_path)
+    try:
+        with open(output_path, "wb") as output:
+            for batch in stream_sheet_batches(pipeline, reader, sheet_title, output_header, context):
+                pickle.dump(batch, output, protocol=pickle.HIGHEST_PROTOCOL)
+    finally:
+        reader.close()
+
+
+def read_spooled_rows(paths: List[str]) -> Iterator[list]:
+    """Linhas gravadas por ``sheet_to_spool``, um lote por vez, na ordem dos arquivos."""
+    for path in paths:
+        with open(path, "rb") as f:
+            while True:
+                try:
+                    batch = pickle.load(f)
+                except EOFError:
+                    break
+                yield from batch
+
+
+def spooled_sheets_to_xlsx(template_content: bytes, paths: List[str], output_path: Optional[str] = None) -> Optional[bytes]:
+    return write_rows_to_template(template_content, read_spooled_rows(paths), output_path)
+
+
+def sheets_to_xlsx(
+    pipeline, data_path: str, sheet_titles, output_header, context: dict, template_content: bytes,
+    output_path: Optional[str] = None
+) -> Optional[bytes]:
+    """Lê as sheets em sequência e grava direto no template, sem lista intermediária."""
+    reader = open_sheet_reader(data_path)
+    try:
+        rows = (
+            row
+            for sheet_title in sheet_titles
+            for row in stream_sheet(pipeline, reader, sheet_title, output_header, context)
+        )
+        return write_rows_to_template(template_content, rows, output_path)
+    finally:
+        reader.close()
+
+
+def sheet_to_csv(pipeline, data_path: str, sheet_title: str, output_header, context: dict, output_path: str):
+    reader = open_sheet_reader(data_path)
+    try:
+        write_csv_rows(output_path, stream_sheet(pipeline, reader, sheet_title, output_header, context))
+    finally:
+        reader.close()
+
+
+# --- Conversão ---
+
+async def load_context(lookups: Dict[str, Lookup]) -> dict:
+    names = list(lookups)
+    with stage("db_lookups"):
+        values = await asyncio.gather(*[lookups[name].load() for name in names])
+    return dict(zip(names, values))
+
+
+async def _convert_xlsx(
+    pipeline: ConverterPipeline,
+    data_path: str,
+    lookups: Optional[Dict[str, Lookup]],
+    output_path: Optional[str]
+) -> Optional[bytes]:
+    """Com uma sheet, tudo roda em streaming em um único processo; com várias,
+    cada sheet é lida em paralelo para um arquivo temporário (lotes em pickle)
+    e o escritor lê esses arquivos em streaming, na ordem original: nenhuma
+    sheet fica inteira na memória nem passa pelo processo principal.
+    """
+    template = load_clean_template(pipeline.template_path)
+    output_header = pipeline.get_output_header(template.header)
+    context = await load_context(lookups if lookups is not None else pipeline.create_lookups())
+
+    sheet_titles = await run_in_process_pool(list_sheets, pipeline, data_path)
+    if len(sheet_titles) == 1:
+        return await run_in_process_pool(
+            sheets_to_xlsx, pipeline, data_path, sheet_titles, output_header, context, template.content, output_path
+        )
+
+    paths = [new_temp_path(suffix=".pickle") for _ in sheet_titles]
+    try:
+        await asyncio.gather(*[
+            run_in_process_pool(sheet_to_spool, pipeline, data_path, title, output_header, context, path)
+            for title, path in zip(sheet_titles, paths)
+        ])
+        return await run_in_process_pool(spooled_sheets_to_xlsx, template.content, paths, output_path)
+    finally:
+        remove_files(paths)
+
+
+async def convert_to_xlsx(
+    pipeline: ConverterPipeline,
+    data_path: str,
+    lookups: Optional[Dict[str, Lookup]] = None
+) -> bytes:
+    """Converte a planilha salva em ``data_path`` e retorna o xlsx gerado."""
+    return await _convert_xlsx(pipeline, data_path, lookups, None)
+
+
+async def convert_to_xlsx_file(
+    pipeline: ConverterPipeline,
+    data_path: str,
+    output_path: str,
+    lookups: Optional[Dict[str, Lookup]] = None
+):
+    """Como ``convert_to_xlsx``, mas o processo do pool grava o xlsx em ``output_path``:
+    o conteúdo não passa pela memória do processo principal (ex: conversão em lote).
+    """
+    await _convert_xlsx(pipeline, data_path, lookups, output_path)
+
+
+async def convert_to_csv(
+    pipeline: ConverterPipeline,
+    data_path: str,
+    lookups: Optional[Dict[str, Lookup]] = None
+) -> List[str]:
+    """Converte a planilha para CSV; cada sheet é gravada em paralelo no seu arquivo.
+
+    Retorna os caminhos (header primeiro, depois as sheets na ordem original)
+    para serem concatenados pelo chamador, que também os remove.
+    """
+    template = load_clean_template(pipeline.template_path)
+    output_header = pipeline.get_output_header(template.header)
+    context = await load_context(lookups if lookups is not None else pipeline.create_lookups())
+
+    sheet_titles = await run_in_process_pool(list_sheets, pipeline, data_path)
+    paths = [new_temp_path(suffix=".csv") for _ in range(len(sheet_titles) + 1)]
+    try:
+        write_csv_rows(paths[0], [], header=output_header)
+        await asyncio.gather(*[
+            run_in_process_pool(sheet_to_csv, pipeline, data_path, title, output_header, context, path)
+            for title, path in zip(sheet_titles, paths[1:])
+        ])
+    except Exception:
+        remove_files(paths)
+        raise
+    return paths
+
+
+async def convert_upload(
+    pipeline: ConverterPipeline,
+    data_file: UploadFile,
+    formato: str,
+    filenames: Dict[str, str],
+    member: Optional[str] = None,
+):
+    """Fluxo completo de um endpoint de conversão: cache, conversão e resposta.
+
+    A planilha pode vir compactada (gzip, zstd ou dentro de um zip, ``member``
+    ou o primeiro arquivo): ela é descompactada em disco só quando não há cache.
+    """
+    validate_output_format(formato)
+    filename = filenames[formato]
+    template = load_clean_template(pipeline.template_path)
+    lookups = pipeline.create_lookups()
+
+    with stage("spool"):
+        data_path, data_hash = await spool_upload_with_hash_async(data_file, suffix=".xlsx")
+    try:
+        # Mesmo arquivo (e mesmos dados consultados): serve direto do cache
+        with stage("db_lookups"):
+            versions = await asyncio.gather(*[lookups[name].version() for name in sorted(lookups)])
+        cache_key = conversion_cache.make_key(data_hash, member or "", pipeline.name, formato, template.mtime, *versions)
+        with stage("cache"):
+            cached = conversion_cache.open(cache_key)
+        if cached is not None:
+            add_bytes_out(os.fstat(cached.fileno()).st_size)
+            return cached_file_response(cached, MEDIA_TYPES[formato], filename, hit=True)
+
+        # Só a conversão passa pelo controle de admissão (respostas do cache são leves)
+        memory = estimate_memory(pipeline.name, [compressed.expanded_size(data_path, member)])
+        async with admission_controller.admit(pipeline.name, memory):
+            with stage("decompress"):
+                xlsx_path = await run_in_process_pool(compressed.decompress_to_file, data_path, member)
+            if xlsx_path:
+                remove_files([data_path])
+                data_path = xlsx_path
+            if formato == "csv":
+                paths = await convert_to_csv(pipeline, data_path, lookups)
+                add_bytes_out(sum(os.path.getsize(path) for path in paths))
+                with stage("cache"):
+                    cached = conversion_cache.open(cache_key) if conversion_cache.put_files(cache_key, paths) else None
+                if cached is not None:
+                    remove_files(paths)
+                    return cached_file_response(cached, MEDIA_TYPES[formato], filename, hit=False)
+                return csv_file_response(paths, filename=filename)
+
+            content = await convert_to_xlsx(pipeline, data_path, lookups)
+            add_bytes_out(len(content))
+            with stage("cache"):
+                conversion_cache.put_bytes(cache_key, content)
+            return StreamingResponse(
+                io.BytesIO(content),
+                media_type=XLSX_MEDIA_TYPE,
+                headers={"Content-Disposition": f"attachment; filename={filename}", "X-Cache": "MISS"}
+            )
+    finally:
+        remove_files([data_path])
+
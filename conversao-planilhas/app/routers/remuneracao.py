@@ -1,12 +1,10 @@
 # routers/remuneracao.py
-import openpyxl
-import io
-from typing import Optional
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from starlette.responses import StreamingResponse
+from typing import List, Optional
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
 from unidecode import unidecode
 
 from ..auth import get_current_active_user
+from .pipeline import ConstantColumn, ConverterPipeline, convert_upload
 from .utils import find_resource_file
 
 router = APIRouter(
@@ -27,39 +25,21 @@ def normalize_header(header: str) -> str:
     return normalized.strip()
 
 
-def find_relevant_sheets(wb_data):
-    """Encontra todas as sheets relevantes (EMISSÕES e EMISSÃO AC)."""
+def find_relevant_sheets(reader) -> List[str]:
+    """Encontra os nomes de todas as sheets relevantes (EMISSÕES e EMISSÃO AC)."""
     relevant_sheets = []
-    for sheet_name in wb_data.sheetnames:
+    for sheet_name in reader.sheetnames:
         normalized_name = unidecode(sheet_name).lower().strip()
         if normalized_name.startswith("emissoes") or normalized_name.startswith("emissao ac"):
-            relevant_sheets.append(wb_data[sheet_name])
+            relevant_sheets.append(sheet_name)
     
     # Se não encontrou nenhuma, usa a sheet ativa
     if not relevant_sheets:
-        relevant_sheets.append(wb_data.active)
+        relevant_sheets.append(reader.active_title)
     
     return relevant_sheets
 
 
-def process_sheet_data(ws_data, base_header_ordered, base_to_data_column_map):
-    """Processa dados de uma sheet e retorna lista de linhas."""
-    rows = []
-    for data_row in ws_data.iter_rows(min_row=2):
-        if all(cell.value is None for cell in data_row):
-            continue
-
-        new_row_values = []
-        for col_name in base_header_ordered:
-            if col_name == "VOUCHER":
-                new_row_values.append("")
-            else:
-                data_col_index = base_to_data_column_map[col_name]
-                new_row_values.append(data_row[data_col_index - 1].value)
-        rows.append(new_row_values)
-    return rows
-
-
 class RemuneracaoColumnInfo:
     def __init__(self, name: str, alternative_names: list[str]):
         self.name = name
@@ -144,6 +124,38 @@ def find_data_column_for_base_column(
     )
 
 
+def map_sheet_columns(header_values, base_header_ordered) -> dict:
+    """Mapeia cada coluna base (exceto VOUCHER) para o índice da coluna na sheet de dados."""
+    base_col_name_to_info = {col_info.name: col_info for col_info in remuneracao_columns}
+    data_header_map = {value: index for index, value in enumerate(header_values, start=1) if value}
+    base_to_data_column_map = {}
+    for base_col_name in base_header_ordered:
+        if base_col_name == "VOUCHER":
+            continue
+        col_info = base_col_name_to_info.get(base_col_name)
+        base_to_data_column_map[base_col_name] = find_data_column_for_base_column(
+            base_col_name, col_info, data_header_map
+        )
+    return base_to_data_column_map
+
+
+def map_remuneracao_columns(header_values, output_header) -> list:
+    """Coluna de dados de cada coluna de saída (VOUCHER é preenchida por transformação)."""
+    base_to_data_column_map = map_sheet_columns(header_values, output_header)
+    return [base_to_data_column_map.get(col_name) for col_name in output_header]
+
+
+remuneracao_pipeline = ConverterPipeline(
+    name="remuneracao",
+    template_path=REMUNERACAO_BASE_FILE_PATH,
+    select_sheets=find_relevant_sheets,
+    map_columns=map_remuneracao_columns,
+    transforms=[ConstantColumn("VOUCHER", "")],
+)
+
+REMUNERACAO_OUTPUT_FILENAMES = {"xlsx": "Remuneracao-Convertida.xlsx", "csv": "Remuneracao-Convertida.csv"}
+
+
 @router.post(
     "/converter-remuneracao/",
     summary="Converte planilha de remuneração",
@@ -151,59 +163,12 @@ def find_data_column_for_base_column(
                 "copia os dados e retorna o arquivo convertido."
 )
 async def converter_remuneracao(
-    data_file: UploadFile = File(..., description="Planilha de dados a ser processada (ex: Digiforte.xlsx)")
+    data_file: UploadFile = File(..., description="Planilha de dados a ser processada (ex: Digiforte.xlsx; pode vir em .gz, .zip ou .zst)"),
+    formato: str = Form("xlsx", description="Formato de saída: xlsx ou csv"),
+    membro: Optional[str] = Form(None, description="Planilha dentro do zip enviado (padrão: o primeiro arquivo)")
 ):
     try:
-        # 1. Carrega template base
-        try:
-            wb_base = openpyxl.load_workbook(REMUNERACAO_BASE_FILE_PATH)
-            ws_base = wb_base.active
-        except FileNotFoundError:
-            raise HTTPException(
-                status_code=500,
-                detail="Erro interno no servidor: O arquivo de template base não foi encontrado."
-            )
-
-        # 2. Carrega arquivo de dados e encontra sheets relevantes
-        wb_data = openpyxl.load_workbook(data_file.file)
-        relevant_sheets = find_relevant_sheets(wb_data)
-
-        # 3. Prepara mapeamentos base
-        base_col_name_to_info = {col_info.name: col_info for col_info in remuneracao_columns}
-        base_header_ordered = [cell.value for cell in ws_base[1] if cell.value]
-
-        # 4. Limpa template
-        if ws_base.max_row > 1:
-            ws_base.delete_rows(idx=2, amount=ws_base.max_row - 1)
-
-        # 5. Processa cada sheet e copia dados
-        for ws_data in relevant_sheets:
-            # Mapeia colunas para esta sheet específica
-            data_header_map = {cell.value: cell.column for cell in ws_data[1] if cell.value}
-            base_to_data_column_map = {}
-            for base_col_name in base_header_ordered:
-                if base_col_name == "VOUCHER":
-                    continue
-                col_info = base_col_name_to_info.get(base_col_name)
-                base_to_data_column_map[base_col_name] = find_data_column_for_base_column(
-                    base_col_name, col_info, data_header_map
-                )
-
-            # Processa e adiciona linhas desta sheet
-            rows = process_sheet_data(ws_data, base_header_ordered, base_to_data_column_map)
-            for row in rows:
-                ws_base.append(row)
-
-        # 6. Retorna arquivo convertido
-        output_buffer = io.BytesIO()
-        wb_base.save(output_buffer)
-        output_buffer.seek(0)
-
-        return StreamingResponse(
-            output_buffer,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": "attachment; filename=Remuneracao-Convertida.xlsx"}
-        )
+        return await convert_upload(remuneracao_pipeline, data_file, formato, REMUNERACAO_OUTPUT_FILENAMES, membro)
 
     except HTTPException:
         raise
@@ -213,4 +178,3 @@ async def converter_remuneracao(
             status_code=500,
             detail=f"Ocorreu um erro inesperado ao processar o arquivo: {str(e)}"
         )
-
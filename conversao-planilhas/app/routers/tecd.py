@@ -1,14 +1,14 @@
 # routers/tecd.py
-import openpyxl
-import io
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from starlette.responses import StreamingResponse
+import asyncio
+from typing import List, Optional
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from unidecode import unidecode
 
 from .. import crud
 from ..database import engine
 from ..auth import get_current_active_user
+from .pipeline import ConstantColumn, ConverterPipeline, Lookup, RowTransform, convert_upload
 from .utils import find_resource_file
 
 router = APIRouter(
@@ -18,6 +18,7 @@ router = APIRouter(
 
 TECD_BASE_FILE_PATH = find_resource_file("Valid-Tec-D.xlsx")
 TECD_PRECO_FIXO = 17
+TECD_OUTPUT_FILENAMES = {"xlsx": "Remuneracao-Convertida.xlsx", "csv": "TEC-D-Convertida.csv"}
 
 
 class TecdColumnInfo:
@@ -70,6 +71,113 @@ def is_name_matching(tecd_column_info: TecdColumnInfo, header_name: str) -> bool
     return False
 
 
+def map_tecd_columns(header_values) -> dict:
+    """Mapeia o índice de cada coluna TEC-D para o índice da coluna na sheet de dados."""
+    column_map = {}
+    for col_info in tecd_columns:
+        found = False
+        for column, value in enumerate(header_values, start=1):
+            if value is None:
+                continue
+            if is_name_matching(col_info, value):
+                column_map[col_info.index] = column
+                found = True
+                break
+        if not found:
+            detail_msg = f"Coluna '{col_info.name}' não encontrada na planilha enviada."
+            print(f"Erro de Validação: {detail_msg}")
+            print(f"Colunas disponíveis: {[value for value in header_values if value]}")
+            raise HTTPException(status_code=400, detail=detail_msg)
+    return column_map
+
+
+def find_tecd_sheet(reader) -> List[str]:
+    """Retorna a sheet "EMISSÕES" ou, se não existir, a sheet ativa."""
+    for sheet_name in reader.sheetnames:
+        if unidecode(sheet_name).lower().strip() == "emissoes":
+            return [sheet_name]
+    return [reader.active_title]
+
+
+def map_tecd_output_columns(header_values, output_header) -> list:
+    """Coluna de dados de cada coluna de saída, na ordem de ``tecd_columns``."""
+    column_map = map_tecd_columns(header_values)
+    return [column_map[col_info.index] for col_info in tecd_columns]
+
+
+def tecd_output_header(template_header) -> List[str]:
+    return [col_info.name for col_info in tecd_columns]
+
+
+def substitute_virtual_localidade(new_row_values: list, context: dict):
+    """Troca a localidade virtual pela localidade física do agente de validação."""
+    nome_agente = new_row_values[11].strip()
+    cpf_agente = new_row_values[12].replace(".", "").replace("-", "").strip()
+    nome_localidade = new_row_values[10].strip()
+    is_virtual = bool(nome_localidade and "VIRTUAL" in nome_localidade.upper())
+
+    if is_virtual:
+        localidades_por_cpf = context[AgenteLocalidadeLookup.name]
+        if cpf_agente not in localidades_por_cpf:
+            raise HTTPException(status_code=404, detail=f"Agente {nome_agente} com CPF {cpf_agente} não encontrado.")
+        localidade = localidades_por_cpf[cpf_agente]
+        if localidade is None:
+            raise HTTPException(status_code=404, detail=f"Agente {nome_agente} não associado a uma localidade física.")
+        new_row_values[9], new_row_values[10] = localidade
+
+
+class AgenteLocalidadeLookup(Lookup):
+    """Localidade física de cada agente (por CPF), carregada com uma única consulta.
+
+    Uma mesma instância pode ser compartilhada entre várias conversões
+    (ex: conversão em lote) para evitar consultas repetidas ao banco.
+    """
+    name = "localidades_por_cpf"
+
+    def __init__(self):
+        self._localidades_por_cpf: Optional[dict] = None
+        # Conversões do mesmo lote começam juntas: só a primeira faz a consulta
+        self._lock = asyncio.Lock()
+
+    async def load(self) -> dict:
+        """Retorna {cpf: (codigo_localidade, nome)}; agentes sem localidade mapeiam para None."""
+        async with self._lock:
+            if self._localidades_por_cpf is None:
+                async with AsyncSession(engine) as session:
+                    rows = await crud.get_agentes_localidades(session)
+                self._localidades_por_cpf = {
+                    cpf: (codigo, nome) if codigo is not None else None
+                    for cpf, codigo, nome in rows
+                }
+        return self._localidades_por_cpf
+
+    async def version(self) -> str:
+        """Carimbo de versão dos dados de agentes/localidades (usado no cache de conversões).
+
+        É o contador de alterações do banco (``versoes_dados``): uma consulta pela
+        chave, sem carregar a tabela, então um acerto no cache não custa a consulta
+        que ele evita. Lido antes do ``load``: se os dados mudarem entre os dois, o
+        resultado fica sob a versão antiga, que nenhuma requisição nova vai pedir.
+        """
+        async with AsyncSession(engine) as session:
+            return str(await crud.get_versao_dados(session, crud.VERSAO_AGENTES_LOCALIDADES))
+
+
+tecd_pipeline = ConverterPipeline(
+    name="tecd",
+    template_path=TECD_BASE_FILE_PATH,
+    select_sheets=find_tecd_sheet,
+    map_columns=map_tecd_output_columns,
+    output_header=tecd_output_header,
+    transforms=[
+        RowTransform(substitute_virtual_localidade),
+        ConstantColumn("TEC-D R$ ", TECD_PRECO_FIXO),
+        ConstantColumn("TOTAL TEC-D R$", TECD_PRECO_FIXO),
+    ],
+    lookups=[AgenteLocalidadeLookup],
+)
+
+
 @router.post(
     "/converter-tecd/",
     summary="Converte planilha de TEC-D",
@@ -77,95 +185,12 @@ def is_name_matching(tecd_column_info: TecdColumnInfo, header_name: str) -> bool
                 "copia os dados e retorna o arquivo convertido."
 )
 async def converter_tecd(
-    data_file: UploadFile = File(..., description="Planilha de dados a ser processada (ex: Digiforte.xlsx)")
+    data_file: UploadFile = File(..., description="Planilha de dados a ser processada (ex: Digiforte.xlsx; pode vir em .gz, .zip ou .zst)"),
+    formato: str = Form("xlsx", description="Formato de saída: xlsx ou csv"),
+    membro: Optional[str] = Form(None, description="Planilha dentro do zip enviado (padrão: o primeiro arquivo)")
 ):
     try:
-        # 1. Carrega o "template" (base)
-        try:
-            wb_base = openpyxl.load_workbook(TECD_BASE_FILE_PATH)
-            ws_base = wb_base.active
-        except FileNotFoundError:
-            print(f"Erro Crítico: Arquivo base não encontrado em: {TECD_BASE_FILE_PATH}")
-            raise HTTPException(
-                status_code=500, 
-                detail="Erro interno no servidor: O arquivo de template base não foi encontrado."
-            )
-
-        # 2. Carrega o "arquivo de dados"
-        wb_data = openpyxl.load_workbook(data_file.file)
-        ws_data = wb_data.active
-        for sheet_name in wb_data.sheetnames:
-            if unidecode(sheet_name).lower().strip() == "emissoes":
-                ws_data = wb_data[sheet_name]
-                break
-        
-        # 3. Mapeia os cabeçalhos
-        column_map = {}
-        for col_info in tecd_columns:
-            found = False
-            for cell in ws_data[1]:
-                if cell.value is None:
-                    continue
-                if is_name_matching(col_info, cell.value):
-                    column_map[col_info.index] = cell.column
-                    found = True
-                    break
-            if not found:
-                detail_msg = f"Coluna '{col_info.name}' não encontrada na planilha enviada."
-                print(f"Erro de Validação: {detail_msg}")
-                print(f"Colunas disponíveis: {[cell.value for cell in ws_data[1] if cell.value]}")
-                raise HTTPException(status_code=400, detail=detail_msg)
-
-        # 5. Limpa o "template"
-        if ws_base.max_row > 1:
-            ws_base.delete_rows(idx=2, amount=ws_base.max_row - 1)
-
-        # 6. Copia os dados
-        for data_row in ws_data.iter_rows(min_row=2):
-            if all(cell.value is None for cell in data_row):
-                continue
-            
-            new_row_values = []
-            for tecd_col in tecd_columns:
-                data_col_index = column_map[tecd_col.index]
-                value_to_copy = data_row[data_col_index - 1].value
-                new_row_values.append(value_to_copy)
-            
-            # Lógica específica do TEC-D
-            nome_agente = new_row_values[11].strip()
-            cpf_agente = new_row_values[12].replace(".", "").replace("-", "").strip()
-            nome_localidade = new_row_values[10].strip()
-            is_virtual = bool(nome_localidade and "VIRTUAL" in nome_localidade.upper())
-
-            if is_virtual:
-                async with AsyncSession(engine) as session:
-                    db_agente = await crud.get_agente_by_cpf(session, cpf=cpf_agente)
-                    if not db_agente:
-                        raise HTTPException(status_code=404, detail=f"Agente {nome_agente} com CPF {cpf_agente} não encontrado.")
-                    
-                    db_localidade = await crud.get_localidade(session, localidade_id=db_agente.localidade_id)
-                    if not db_localidade:
-                        raise HTTPException(status_code=404, detail=f"Agente {nome_agente} não associado a uma localidade física.")
-
-                    new_row_values[9] = db_localidade.codigo_localidade
-                    new_row_values[10] = db_localidade.nome
-
-            new_row_values[27] = TECD_PRECO_FIXO
-            new_row_values[29] = TECD_PRECO_FIXO
-
-            ws_base.append(new_row_values)
-        
-        # 7. Salva em buffer
-        output_buffer = io.BytesIO()
-        wb_base.save(output_buffer)
-        output_buffer.seek(0)
-
-        # 8. Retorna o buffer
-        return StreamingResponse(
-            output_buffer,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": "attachment; filename=Remuneracao-Convertida.xlsx"}
-        )
+        return await convert_upload(tecd_pipeline, data_file, formato, TECD_OUTPUT_FILENAMES, membro)
 
     except HTTPException as e:
         raise e
@@ -177,4 +202,3 @@ async def converter_tecd(
             status_code=500, 
             detail=f"Ocorreu um erro inesperado ao processar o arquivo: {str(e)}"
         )
-
@@ -0,0 +1,262 @@
+# routers/upload_stream.py
+"""Leitura do corpo multipart enquanto ele ainda está chegando.
+
+Nos endpoints com ``UploadFile`` o Starlette só chama a função depois de
+receber e salvar o upload inteiro; o processamento começa com a rede já
+parada. Aqui o corpo da requisição é entregue ao ``python_multipart`` pedaço
+por pedaço (no event loop) e os eventos (início de parte, dados, fim) vão
+para uma fila limitada, consumida por uma thread que processa os dados ao
+mesmo tempo que o resto do arquivo é recebido.
+
+A fila limitada faz a contrapressão: se a thread não der conta, o event loop
+para de ler o corpo (e o TCP segura o cliente) em vez de acumular o upload na
+memória.
+
+A thread roda no processo da API e segura o GIL enquanto processa: as outras
+requisições desse processo ficam mais lentas durante o upload. Por isso a
+pista do endpoint admite uma requisição por vez (``LANE_MAX_CONCURRENT`` em
+``admission``), e o trabalho pesado em lote continua indo para o pool de
+processos.
+
+Uso::
+
+    stream = MultipartStream(request.headers.get("content-type"))
+    resultado = await consume_in_thread(stream, request.stream(), func)
+
+e, em ``func(stream)`` (na thread), ``for part in stream.parts(): ... part.chunks() ...``.
+"""
+import asyncio
+import contextvars
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+
+from ..config import settings
+from ..instrumentation import stage
+
+_upload_stream_executor: Optional[ThreadPoolExecutor] = None
+
+# Intervalo (segundos) com que os dois lados conferem se o outro desistiu
+_POLL_INTERVAL = 0.1
+
+
+def get_upload_stream_executor() -> ThreadPoolExecutor:
+    global _upload_stream_executor
+    if _upload_stream_executor is None:
+        _upload_stream_executor = ThreadPoolExecutor(
+            max_workers=settings.UPLOAD_STREAM_WORKERS,
+            thread_name_prefix="upload-stream",
+        )
+    return _upload_stream_executor
+
+
+class StreamAborted(Exception):
+    """O outro lado (leitura do corpo ou processamento) desistiu."""
+
+
+class StreamedPart:
+    """Uma parte do multipart (campo ou arquivo), lida na ordem em que chega."""
+
+    def __init__(self, stream: "MultipartStream", name: str, filename: Optional[str]):
+        self._stream = stream
+        self.name = name
+        self.filename = filename
+        self._finished = False
+        # Pedaços já lidos por head(), devolvidos primeiro por chunks()
+        self._head: List[bytes] = []
+
+    def _next_chunk(self) -> Optional[bytes]:
+        while not self._finished:
+            event = self._stream._next_event()
+            if event[0] == "data":
+                return event[1]
+            if event[0] == "end":
+                self._finished = True
+            else:
+                raise HTTPException(status_code=400, detail="Corpo multipart incompleto")
+        return None
+
+    def head(self, size: int) -> bytes:
+        """Primeiros ``size`` bytes da parte (ou menos, se ela for menor), sem consumi-los."""
+        data = b"".join(self._head)
+        while len(data) < size:
+            chunk = self._next_chunk()
+            if chunk is None:
+                break
+            self._head.append(chunk)
+            data += chunk
+        return data[:size]
+
+    def chunks(self) -> Iterator[bytes]:
+        """Pedaços de bytes da parte, conforme chegam (só pode ser percorrido uma vez)."""
+        while self._head:
+            yield self._head.pop(0)
+        while True:
+            chunk = self._next_chunk()
+            if chunk is None:
+                return
+            yield chunk
+
+    def read(self) -> bytes:
+        return b"".join(self.chunks())
+
+    def text(self, encoding: str = "utf-8") -> str:
+        return self.read().decode(encoding)
+
+    def drain(self):
+        for _ in self.chunks():
+            pass
+
+
+class MultipartStream:
+    """Liga o parser multipart (event loop) à thread que consome as partes."""
+
+    def __init__(self, content_type: Optional[str], max_queued_chunks: Optional[int] = None):
+        media_type, options = parse_options_header(content_type or "")
+        boundary = options.get(b"boundary")
+        if media_type != b"multipart/form-data" or not boundary:
+            raise HTTPException(status_code=400, detail="Envie os arquivos como multipart/form-data")
+
+        self._events: queue.Queue = queue.Queue(maxsize=max_queued_chunks or settings.UPLOAD_STREAM_QUEUE_CHUNKS)
+        self._aborted = False
+        # Eventos gerados pelo parser durante um write(), antes de irem para a fila
+        self._pending: List[Tuple] = []
+        self._header_field = b""
+        self._header_value = b""
+        self._headers: dict = {}
+        self._parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    # --- Callbacks do parser (event loop) ---
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name")
+        if name is None:
+            raise HTTPException(status_code=400, detail="Parte do multipart sem nome")
+        filename = options.get(b"filename")
+        self._pending.append((
+            "part",
+            name.decode("latin-1"),
+            filename.decode("utf-8", "replace") if filename is not None else None,
+        ))
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        self._pending.append(("data", data[start:end]))
+
+    def _on_part_end(self):
+        self._pending.append(("end",))
+
+    # --- Lado do event loop ---
+
+    async def _put(self, event: Tuple):
+        while True:
+            if self._aborted:
+                raise StreamAborted()
+            try:
+                self._events.put_nowait(event)
+                return
+            except queue.Full:
+                # A thread ainda está processando: para de ler o corpo por enquanto
+                await asyncio.sleep(0.005)
+
+    async def feed(self, body: AsyncIterator[bytes]):
+        """Lê o corpo da requisição e entrega as partes à thread consumidora.
+
+        Se o consumidor desistir (erro de validação, por exemplo), a leitura
+        para; em qualquer erro daqui o consumidor é avisado e também para.
+        """
+        try:
+            async for chunk in body:
+                if chunk:
+                    self._parser.write(chunk)
+                events, self._pending = self._pending, []
+                for event in events:
+                    await self._put(event)
+            self._parser.finalize()
+            await self._put(("done",))
+        except StreamAborted:
+            pass
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self):
+        self._aborted = True
+
+    # --- Lado da thread ---
+
+    def _next_event(self) -> Tuple:
+        with stage("upload_wait"):
+            while True:
+                try:
+                    return self._events.get(timeout=_POLL_INTERVAL)
+                except queue.Empty:
+                    if self._aborted:
+                        raise StreamAborted()
+
+    def parts(self) -> Iterator[StreamedPart]:
+        """Partes na ordem do corpo; o que não for lido de uma parte é descartado ao pedir a próxima."""
+        try:
+            while True:
+                event = self._next_event()
+                if event[0] == "done":
+                    return
+                if event[0] != "part":
+                    raise HTTPException(status_code=400, detail="Corpo multipart inválido")
+                part = StreamedPart(self, event[1], event[2])
+                yield part
+                part.drain()
+        except BaseException:
+            self.abort()
+            raise
+
+
+def _run_consumer(func, stream: MultipartStream, *args):
+    try:
+        return func(stream, *args)
+    finally:
+        # Terminou (ou falhou): o event loop não precisa mais ler o corpo
+        stream.abort()
+
+
+async def consume_in_thread(stream: MultipartStream, body: AsyncIterator[bytes], func, *args):
+    """Lê ``body`` no event loop enquanto ``func(stream, *args)`` consome as partes numa thread.
+
+    As medições da requisição (``stage``) feitas na thread entram na requisição atual.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    consumer = loop.run_in_executor(get_upload_stream_executor(), context.run, _run_consumer, func, stream, *args)
+    try:
+        await stream.feed(body)
+    except BaseException:
+        # Espera a thread parar antes de devolver o erro
+        await asyncio.wait([consumer])
+        raise
+    return await consumer
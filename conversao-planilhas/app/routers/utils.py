@@ -1,5 +1,26 @@
 # routers/utils.py
+import asyncio
+import csv
+import hashlib
+import io
+import os
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime, time
+from decimal import Decimal
+from functools import lru_cache
 from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+import openpyxl
+from fastapi import HTTPException
+from starlette.background import BackgroundTask
+from starlette.responses import StreamingResponse
+
+from ..config import settings
+from ..instrumentation import call_with_stats, is_collecting, merge_stats, stage
 
 
 # Resolve resource paths relative to this file so the code works
@@ -35,3 +56,257 @@ def find_resource_file(filename: str) -> str:
     # none found; return the first candidate for clearer error reporting later
     return str(candidates[0])
 
+
+
+# Header com o cursor da próxima página nas listagens paginadas por chave
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_PAGE_SIZE = 1000
+
+
+def set_next_cursor(response, items: list, limit: int):
+    """Informa o cursor (id do último item) quando a página veio cheia."""
+    if items and len(items) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = str(items[-1].id)
+
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Retorna o pool de processos compartilhado pelos conversores.
+
+    O pool é criado sob demanda para que a importação dos roteadores não
+    dispare processos (ex: em scripts ou no reload do uvicorn).
+    """
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=settings.CONVERSION_WORKERS)
+    return _process_pool
+
+
+def shutdown_process_pool():
+    """Encerra o pool de processos (se existir), esperando as tarefas em andamento."""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=True)
+        _process_pool = None
+
+
+class WorkerHTTPError(Exception):
+    """Transporta um HTTPException levantado dentro do pool de processos.
+
+    O HTTPException do FastAPI não pode ser reconstruído a partir do pickle,
+    então o erro é convertido no processo filho e refeito no processo principal.
+    """
+    def __init__(self, status_code: int, detail):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class WorkerError(RuntimeError):
+    """Erro do pool de processos que não sobreviveria ao pickle (vira só o tipo e a mensagem)."""
+
+
+def _call_in_worker(func, collect_stats: bool, *args):
+    try:
+        if collect_stats:
+            return call_with_stats(func, *args)
+        return func(*args), None
+    except HTTPException as e:
+        raise WorkerHTTPError(e.status_code, e.detail)
+    except Exception as e:
+        # Uma exceção que não pode ser refeita no processo principal derruba o pool
+        # inteiro (BrokenProcessPool), levando junto as outras tarefas em andamento
+        try:
+            pickle.loads(pickle.dumps(e))
+        except Exception:
+            raise WorkerError(f"{type(e).__name__}: {e}") from None
+        raise
+
+
+async def run_in_process_pool(func, *args):
+    """Executa ``func(*args)`` no pool de processos sem bloquear o event loop."""
+    global _process_pool
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+    try:
+        result, stats = await loop.run_in_executor(pool, _call_in_worker, func, is_collecting(), *args)
+        merge_stats(stats)
+        return result
+    except WorkerHTTPError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except BrokenProcessPool:
+        # Um processo morreu (ex: falta de memória); o próximo uso recria o pool
+        if _process_pool is pool:
+            _process_pool = None
+        raise
+
+
+def spool_upload_to_disk(upload_file, suffix: str = "") -> str:
+    """Copia o conteúdo de um UploadFile para um arquivo temporário e retorna o caminho.
+
+    Necessário quando o arquivo precisa ser aberto por outros processos.
+    O chamador é responsável por remover o arquivo.
+    """
+    return spool_upload_with_hash(upload_file, suffix)[0]
+
+
+def spool_upload_with_hash(upload_file, suffix: str = "") -> Tuple[str, str]:
+    """Como ``spool_upload_to_disk``, mas também retorna o SHA-256 do conteúdo."""
+    digest = hashlib.sha256()
+    upload_file.file.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        while chunk := upload_file.file.read(CSV_CHUNK_SIZE):
+            digest.update(chunk)
+            tmp.write(chunk)
+        return tmp.name, digest.hexdigest()
+
+
+# A cópia (e o SHA-256) de um upload grande leva segundos: roda numa thread,
+# para não travar o event loop e as requisições leves (CRUD, autenticação)
+
+async def spool_upload_to_disk_async(upload_file, suffix: str = "") -> str:
+    """Como ``spool_upload_to_disk``, mas numa thread"""
+    return await asyncio.to_thread(spool_upload_to_disk, upload_file, suffix)
+
+
+async def spool_upload_with_hash_async(upload_file, suffix: str = "") -> Tuple[str, str]:
+    """Como ``spool_upload_with_hash``, mas numa thread"""
+    return await asyncio.to_thread(spool_upload_with_hash, upload_file, suffix)
+
+
+class TemplateBase:
+    """Template já limpo (somente o header) pronto para receber linhas."""
+    def __init__(self, content: bytes, header: list, mtime: float):
+        self.content = content
+        self.header = header
+        self.mtime = mtime
+
+
+@lru_cache(maxsize=8)
+def _load_clean_template(path: str, mtime: float) -> TemplateBase:
+    wb_base = openpyxl.load_workbook(path)
+    ws_base = wb_base.active
+    if ws_base.max_row > 1:
+        ws_base.delete_rows(idx=2, amount=ws_base.max_row - 1)
+    header = [cell.value for cell in ws_base[1]]
+    output_buffer = io.BytesIO()
+    wb_base.save(output_buffer)
+    return TemplateBase(output_buffer.getvalue(), header, mtime)
+
+
+def load_clean_template(path: str) -> TemplateBase:
+    """Carrega o template base uma única vez (recarrega se o arquivo mudar)."""
+    try:
+        mtime = os.path.getmtime(path)
+    except FileNotFoundError:
+        print(f"Erro Crítico: Arquivo base não encontrado em: {path}")
+        raise HTTPException(
+            status_code=500,
+            detail="Erro interno no servidor: O arquivo de template base não foi encontrado."
+        )
+    return _load_clean_template(path, mtime)
+
+
+def write_rows_to_template(template_content: bytes, rows: List[list], output_path: Optional[str] = None) -> Optional[bytes]:
+    """Preenche uma cópia do template com as linhas e retorna o xlsx gerado.
+
+    Com ``output_path`` o xlsx é gravado nesse arquivo e nada é retornado.
+    """
+    with stage("template_load"):
+        wb_base = openpyxl.load_workbook(io.BytesIO(template_content))
+        ws_base = wb_base.active
+    with stage("row_copy"):
+        for row in rows:
+            ws_base.append(row)
+    with stage("save"):
+        if output_path is not None:
+            wb_base.save(output_path)
+            return None
+        output_buffer = io.BytesIO()
+        wb_base.save(output_buffer)
+        return output_buffer.getvalue()
+
+
+# --- Saída em CSV ---
+
+OUTPUT_FORMATS = ("xlsx", "csv")
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+CSV_MEDIA_TYPE = "text/csv; charset=utf-8"
+MEDIA_TYPES = {"xlsx": XLSX_MEDIA_TYPE, "csv": CSV_MEDIA_TYPE}
+CSV_DELIMITER = ";"
+CSV_CHUNK_SIZE = 64 * 1024
+
+
+def validate_output_format(formato: str):
+    if formato not in OUTPUT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Formato de saída inválido. Use: {', '.join(OUTPUT_FORMATS)}"
+        )
+
+
+def format_csv_value(value) -> str:
+    """Formata um valor de célula para o CSV (datas DD/MM/YYYY e vírgula decimal)."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, datetime):
+        if value.hour == value.minute == value.second == 0:
+            return value.strftime("%d/%m/%Y")
+        return value.strftime("%d/%m/%Y %H:%M:%S")
+    if isinstance(value, date):
+        return value.strftime("%d/%m/%Y")
+    if isinstance(value, time):
+        return value.strftime("%H:%M:%S")
+    if isinstance(value, float):
+        text = repr(value)
+        if "e" in text or "E" in text:
+            text = format(Decimal(text), "f")
+        return text.replace(".", ",")
+    return str(value)
+
+
+def write_csv_rows(output_path: str, rows: Iterable[list], header: Optional[list] = None):
+    """Escreve as linhas em CSV (separado por ponto e vírgula), uma a uma."""
+    with open(output_path, "w", encoding="utf-8", newline="") as output:
+        writer = csv.writer(output, delimiter=CSV_DELIMITER)
+        if header is not None:
+            writer.writerow(header)
+        with stage("row_copy"):
+            for row in rows:
+                writer.writerow([format_csv_value(value) for value in row])
+
+
+def new_temp_path(suffix: str = "") -> str:
+    """Cria um arquivo temporário vazio e retorna o caminho (o chamador remove)."""
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    return path
+
+
+def remove_files(paths: List[str]):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _iter_files(paths: List[str]):
+    for path in paths:
+        with open(path, "rb") as f:
+            while chunk := f.read(CSV_CHUNK_SIZE):
+                yield chunk
+
+
+def csv_file_response(paths: List[str], filename: str) -> StreamingResponse:
+    """Envia os arquivos CSV concatenados, na ordem, e remove-os ao final."""
+    return StreamingResponse(
+        _iter_files(paths),
+        media_type=CSV_MEDIA_TYPE,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+        background=BackgroundTask(remove_files, paths)
+    )
@@ -0,0 +1,320 @@
+# routers/xlsx_reader.py
+"""Leitor de linhas de planilhas .xlsx direto do XML.
+
+Os conversores só precisam dos valores das células. O modo somente leitura do
+openpyxl ainda cria um objeto por célula e resolve estilos que não usamos, então
+aqui os arquivos ``xl/worksheets/sheetN.xml`` são lidos com ``iterparse`` direto
+do zip. Strings compartilhadas são resolvidas sob demanda e datas/números só são
+convertidos nas colunas que o conversor realmente usa.
+
+Se o arquivo não puder ser lido por aqui (ex: formato inesperado), o openpyxl
+continua sendo usado como alternativa (``open_sheet_reader``).
+"""
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Iterator, List, Optional, Set
+
+import openpyxl
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import column_index_from_string
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel, from_ISO8601
+
+SHEET_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+_SHEET_DATA = f"{{{SHEET_MAIN_NS}}}sheetData"
+_ROW = f"{{{SHEET_MAIN_NS}}}row"
+_CELL = f"{{{SHEET_MAIN_NS}}}c"
+_VALUE = f"{{{SHEET_MAIN_NS}}}v"
+_FORMULA = f"{{{SHEET_MAIN_NS}}}f"
+_INLINE_STRING = f"{{{SHEET_MAIN_NS}}}is"
+_TEXT = f"{{{SHEET_MAIN_NS}}}t"
+_RICH_RUN = f"{{{SHEET_MAIN_NS}}}r"
+_SHARED_ITEM = f"{{{SHEET_MAIN_NS}}}si"
+
+
+class XlsxFormatError(Exception):
+    """O arquivo não está no formato esperado pelo leitor XML."""
+
+
+def _cast_number(value: str):
+    """Converte o texto de uma célula numérica da mesma forma que o openpyxl."""
+    if "." in value or "E" in value or "e" in value:
+        return float(value)
+    return int(value)
+
+
+def _string_item_text(element) -> str:
+    """Texto de um <si>/<is>, concatenando os trechos de rich text (ignora <rPh>)."""
+    text = element.findtext(_TEXT)
+    if text is not None:
+        return text
+    return "".join(run.findtext(_TEXT) or "" for run in element.iter(_RICH_RUN))
+
+
+class _LazySharedStrings:
+    """Tabela de strings compartilhadas lida aos poucos, só até o índice pedido."""
+
+    def __init__(self, archive: zipfile.ZipFile, path: Optional[str]):
+        self._strings: List[str] = []
+        self._source = None
+        self._parser = None
+        if path and path in archive.namelist():
+            self._source = archive.open(path)
+            self._parser = ET.iterparse(self._source, events=("end",))
+
+    def __getitem__(self, index: int) -> str:
+        while index >= len(self._strings) and self._parser is not None:
+            try:
+                _, element = next(self._parser)
+            except StopIteration:
+                self.close()
+                break
+            if element.tag == _SHARED_ITEM:
+                self._strings.append(_string_item_text(element))
+                element.clear()
+        return self._strings[index]
+
+    def close(self):
+        if self._source is not None:
+            self._source.close()
+        self._source = None
+        self._parser = None
+
+
+def _iter_row_elements(source) -> Iterator[ET.Element]:
+    """Elementos ``<row>`` completos da sheet, um por vez.
+
+    Só eventos "start" (custam o mesmo que só "end"): uma linha está completa
+    quando a próxima começa ou quando o arquivo acaba. Depois de usada, a linha
+    é esvaziada e tirada do ``<sheetData>``; só limpá-la deixaria um elemento
+    vazio por linha na árvore, e a memória cresceria com o tamanho da planilha.
+    """
+    sheet_data = None
+    previous = None
+    for _, element in ET.iterparse(source, events=("start",)):
+        if element.tag != _ROW:
+            if element.tag == _SHEET_DATA:
+                sheet_data = element
+            continue
+        if previous is not None:
+            yield previous
+            previous.clear()
+            if sheet_data is not None:
+                sheet_data.remove(previous)
+        previous = element
+    if previous is not None:
+        yield previous
+
+
+class XlsxSheetReader:
+    """Lê as linhas das sheets de um .xlsx direto do XML."""
+
+    def __init__(self, path: str):
+        try:
+            self._archive = zipfile.ZipFile(path)
+        except zipfile.BadZipFile as e:
+            raise XlsxFormatError(str(e))
+        try:
+            self._load_workbook()
+            self._load_styles()
+        except (KeyError, ET.ParseError) as e:
+            self._archive.close()
+            raise XlsxFormatError(str(e))
+        self._shared_strings = _LazySharedStrings(self._archive, self._shared_strings_path)
+        self._column_indexes = {}
+
+    def _load_workbook(self):
+        workbook_path = "xl/workbook.xml"
+        for rel in ET.fromstring(self._archive.read("_rels/.rels")).iter(f"{{{PKG_REL_NS}}}Relationship"):
+            if rel.get("Type", "").endswith("/officeDocument"):
+                workbook_path = rel.get("Target").lstrip("/")
+                break
+
+        workbook = ET.fromstring(self._archive.read(workbook_path))
+        if workbook.tag != f"{{{SHEET_MAIN_NS}}}workbook":
+            # Ex: arquivos no formato "Strict Open XML"
+            raise XlsxFormatError(f"Namespace não suportado: {workbook.tag}")
+
+        base_dir = posixpath.dirname(workbook_path)
+        rels_path = posixpath.join(base_dir, "_rels", posixpath.basename(workbook_path) + ".rels")
+        targets = {}
+        self._shared_strings_path = None
+        self._styles_path = None
+        for rel in ET.fromstring(self._archive.read(rels_path)).iter(f"{{{PKG_REL_NS}}}Relationship"):
+            target = rel.get("Target")
+            if target.startswith("/"):
+                target = target.lstrip("/")
+            else:
+                target = posixpath.normpath(posixpath.join(base_dir, target))
+            targets[rel.get("Id")] = target
+            rel_type = rel.get("Type", "")
+            if rel_type.endswith("/sharedStrings"):
+                self._shared_strings_path = target
+            elif rel_type.endswith("/styles"):
+                self._styles_path = target
+
+        properties = workbook.find(f"{{{SHEET_MAIN_NS}}}workbookPr")
+        date1904 = properties is not None and properties.get("date1904") in ("1", "true")
+        self._epoch = CALENDAR_MAC_1904 if date1904 else CALENDAR_WINDOWS_1900
+
+        self._sheet_paths = {}
+        self.sheetnames: List[str] = []
+        for sheet in workbook.iter(f"{{{SHEET_MAIN_NS}}}sheet"):
+            name = sheet.get("name")
+            self.sheetnames.append(name)
+            self._sheet_paths[name] = targets[sheet.get(f"{{{REL_NS}}}id")]
+
+        active_index = 0
+        view = workbook.find(f"{{{SHEET_MAIN_NS}}}bookViews/{{{SHEET_MAIN_NS}}}workbookView")
+        if view is not None and view.get("activeTab"):
+            active_index = int(view.get("activeTab"))
+        if not self.sheetnames:
+            raise XlsxFormatError("Planilha sem sheets.")
+        self.active_title = self.sheetnames[min(active_index, len(self.sheetnames) - 1)]
+
+    def _load_styles(self):
+        """Descobre quais estilos de célula (atributo ``s``) representam datas."""
+        self._date_styles: Set[int] = set()
+        self._timedelta_styles: Set[int] = set()
+        if not self._styles_path or self._styles_path not in self._archive.namelist():
+            return
+        styles = ET.fromstring(self._archive.read(self._styles_path))
+        custom_formats = {}
+        for num_fmt in styles.iter(f"{{{SHEET_MAIN_NS}}}numFmt"):
+            custom_formats[int(num_fmt.get("numFmtId"))] = num_fmt.get("formatCode", "")
+        cell_xfs = styles.find(f"{{{SHEET_MAIN_NS}}}cellXfs")
+        if cell_xfs is None:
+            return
+        for style_id, xf in enumerate(cell_xfs.iter(f"{{{SHEET_MAIN_NS}}}xf")):
+            fmt_id = int(xf.get("numFmtId", 0))
+            fmt = custom_formats.get(fmt_id) or BUILTIN_FORMATS.get(fmt_id)
+            if fmt and is_date_format(fmt):
+                self._date_styles.add(style_id)
+                if is_timedelta_format(fmt):
+                    self._timedelta_styles.add(style_id)
+
+    def iter_rows(
+        self,
+        title: str,
+        min_row: int = 1,
+        max_row: Optional[int] = None,
+        columns: Optional[Set[int]] = None
+    ) -> Iterator[tuple]:
+        """Itera as linhas da sheet como tuplas de valores (coluna 1 no índice 0).
+
+        ``columns`` limita a conversão (datas, números, strings compartilhadas) às
+        colunas informadas (índices a partir de 1). Nas demais colunas o texto cru
+        do XML é mantido, o que basta para saber se a linha está vazia.
+        """
+        path = self._sheet_paths[title]
+        with self._archive.open(path) as source:
+            row_counter = 0
+            for element in _iter_row_elements(source):
+                row_number = element.get("r")
+                row_counter = int(row_number) if row_number else row_counter + 1
+                if max_row is not None and row_counter > max_row:
+                    break
+                if row_counter >= min_row:
+                    yield self._parse_row(element, columns)
+
+    def _column_index(self, coordinate: str) -> int:
+        letters = coordinate.rstrip("0123456789")
+        index = self._column_indexes.get(letters)
+        if index is None:
+            index = self._column_indexes[letters] = column_index_from_string(letters)
+        return index
+
+    def _parse_row(self, row_element, columns: Optional[Set[int]]) -> tuple:
+        values: list = []
+        column = 0
+        for cell in row_element:
+            if cell.tag != _CELL:
+                continue
+            coordinate = cell.get("r")
+            if coordinate:
+                column = self._column_index(coordinate)
+            else:
+                column += 1
+
+            data_type = cell.get("t", "n")
+            if data_type == "inlineStr":
+                child = cell.find(_INLINE_STRING)
+                value = _string_item_text(child) if child is not None else None
+            else:
+                value = cell.findtext(_VALUE) or None
+
+            if columns is None or column in columns:
+                value = self._convert(cell, data_type, value)
+
+            if value is None:
+                continue
+            if column > len(values):
+                values.extend([None] * (column - len(values)))
+            values[column - 1] = value
+        return tuple(values)
+
+    def _convert(self, cell, data_type: str, value):
+        formula = cell.find(_FORMULA)
+        if formula is not None and formula.text:
+            # Mesmo comportamento do openpyxl sem data_only
+            return "=" + formula.text
+        if value is None:
+            return None
+        if data_type == "n":
+            value = _cast_number(value)
+            style_id = int(cell.get("s", 0))
+            if style_id in self._date_styles:
+                try:
+                    return from_excel(value, self._epoch, timedelta=style_id in self._timedelta_styles)
+                except (OverflowError, ValueError):
+                    return "#VALUE!"
+            return value
+        if data_type == "s":
+            return self._shared_strings[int(value)]
+        if data_type == "b":
+            return bool(int(value))
+        if data_type == "d":
+            return from_ISO8601(value)
+        return value
+
+    def close(self):
+        self._shared_strings.close()
+        self._archive.close()
+
+
+class OpenpyxlSheetReader:
+    """Mesma interface do ``XlsxSheetReader``, usando o openpyxl (somente leitura)."""
+
+    def __init__(self, path: str):
+        self._wb = openpyxl.load_workbook(path, read_only=True)
+        self.sheetnames: List[str] = self._wb.sheetnames
+        self.active_title = self._wb.active.title
+
+    def iter_rows(
+        self,
+        title: str,
+        min_row: int = 1,
+        max_row: Optional[int] = None,
+        columns: Optional[Set[int]] = None
+    ) -> Iterator[tuple]:
+        return self._wb[title].iter_rows(min_row=min_row, max_row=max_row, values_only=True)
+
+    def close(self):
+        self._wb.close()
+
+
+def open_sheet_reader(path: str):
+    """Abre o arquivo com o leitor XML e, se não for possível, com o openpyxl."""
+    try:
+        return XlsxSheetReader(path)
+    except XlsxFormatError as e:
+        print(f"Leitor XML indisponível para o arquivo ({e}); usando openpyxl.")
+        return OpenpyxlSheetReader(path)
+
+
+def read_header(reader, title: str) -> tuple:
+    """Retorna os valores da primeira linha da sheet."""
+    return next(iter(reader.iter_rows(title, min_row=1, max_row=1)), ())
@@ -1,4 +1,5 @@
 from pydantic import BaseModel, EmailStr
+from datetime import datetime
 from typing import Optional, List
 
 # --- User / Auth ---
@@ -62,14 +63,23 @@ class AgenteCreate(AgenteBase):
 # Schema para leitura (retorna o ID do agente e o ID da localidade)
 class Agente(AgenteBase):
     id: int
-    localidade_id: int
+    localidade_id: Optional[int] = None
 
     class Config:
         from_attributes = True
 
 # Schema complexo: Retorna um Agente com os dados da Localidade aninhados
 class AgenteWithLocalidade(Agente):
-    localidade: Localidade
+    localidade: Optional[Localidade] = None
+
+# Listagem de agentes com a localidade (que pode não estar definida) aninhada
+class AgenteComLocalidade(AgenteBase):
+    id: int
+    localidade_id: Optional[int] = None
+    localidade: Optional[Localidade] = None
+
+    class Config:
+        from_attributes = True
 
 # Schema complexo: Retorna uma Localidade com a lista de Agentes aninhada
 class LocalidadeWithAgentes(Localidade):
@@ -79,6 +89,25 @@ class AgenteUpdateLocalidade(BaseModel):
     cpf: str
     localidade_codigo: str
 
+# --- Importação em lote ---
+
+# Linha de importação de agente (a localidade é informada pelo código)
+class AgenteImport(AgenteBase):
+    localidade_codigo: Optional[str] = None
+
+class ImportRowResult(BaseModel):
+    linha: int
+    chave: str
+    status: str  # "inserido", "atualizado" ou "erro"
+    detalhe: Optional[str] = None
+
+class ImportReport(BaseModel):
+    total: int
+    inseridos: int
+    atualizados: int
+    erros: int
+    linhas: List[ImportRowResult] = []
+
 # --- Commission Calculation ---
 
 class SaleInfo(BaseModel):
@@ -99,6 +128,10 @@ class ContadorInfo(BaseModel):
     total_vendas: float
     total_comissao: float
     total_comissao_renovacao: float = 0.0
+    # Exact totals (decimal text, e.g. "1234.56"); the floats above are kept for compatibility
+    total_vendas_exato: Optional[str] = None
+    total_comissao_exato: Optional[str] = None
+    total_comissao_renovacao_exato: Optional[str] = None
     vendas: List[SaleInfo] = []
 
 class SellerInfo(BaseModel):
@@ -108,6 +141,9 @@ class SellerInfo(BaseModel):
     total_vendas: float
     total_comissao: float
     total_comissao_renovacao: float = 0.0
+    total_vendas_exato: Optional[str] = None
+    total_comissao_exato: Optional[str] = None
+    total_comissao_renovacao_exato: Optional[str] = None
     contadores: List[ContadorInfo] = []
     vendas: List[SaleInfo] = []
 
@@ -117,8 +153,121 @@ class RenewalPartnerInfo(BaseModel):
     faixa_comissao: str
     total_vendas: float
     total_comissao: float
+    total_vendas_exato: Optional[str] = None
+    total_comissao_exato: Optional[str] = None
     sellers: List[SellerInfo] = []
 
 class ComissaoResponse(BaseModel):
     sellers: List[SellerInfo]
-    parceiro_renovacao: Optional[RenewalPartnerInfo] = None
\ No newline at end of file
+    parceiro_renovacao: Optional[RenewalPartnerInfo] = None
+
+# --- Commission History ---
+
+class ComissaoTotais(BaseModel):
+    quantidade_vendas: int
+    total_vendas: float
+    total_comissao: float
+    total_comissao_renovacao: float
+    total_vendas_exato: str
+    total_comissao_exato: str
+    total_comissao_renovacao_exato: str
+
+class ComissaoExecucaoInfo(ComissaoTotais):
+    id: int
+    periodo: str
+    data_inicio: datetime
+    data_fim: datetime
+    criado_em: datetime
+
+class ComissaoSeriePonto(ComissaoTotais):
+    periodo: str
+    execucao_id: int
+
+class ComissaoRankingItem(ComissaoTotais):
+    posicao: int
+    cnpj_cpf: str
+    nome: str
+    faixa_comissao: str
+    execucao_id: int
+
+# --- Commission Ledger ---
+
+class ComissaoLedgerCreate(BaseModel):
+    data_inicio: str  # DD/MM/YYYY
+    data_fim: str
+
+class ComissaoLedgerInfo(BaseModel):
+    id: int
+    periodo: str
+    data_inicio: datetime
+    data_fim: datetime
+    aberto: bool
+    criado_em: datetime
+    atualizado_em: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class ComissaoLedgerTotalInfo(ComissaoTotais):
+    tipo: str
+    cnpj_cpf: str
+    nome: str
+    faixa_comissao: str
+
+class ComissaoLedgerDetalhe(ComissaoLedgerInfo):
+    totais: List[ComissaoLedgerTotalInfo] = []
+
+class ComissaoLedgerAtualizacao(BaseModel):
+    ledger: ComissaoLedgerDetalhe
+    lidas: int
+    novas: int
+    alteradas: int
+    inalteradas: int
+    # Repeated sales (same Nº Pedido / Nº Protocolo) dropped by the dedup policy
+    duplicadas: int = 0
+    # Partners changed since the last upload: the period was rebuilt from this upload
+    recalculado: bool
+
+# --- Commission Diff ---
+
+# Amounts in a diff are exact decimal text ("1234.56"), never floats
+
+class ComissaoDiffVenda(BaseModel):
+    numero_pedido: str
+    numero_protocolo: str
+    # None on the side where the sale does not exist
+    valor_antes: Optional[str] = None
+    valor_depois: Optional[str] = None
+    comissao_antes: Optional[str] = None
+    comissao_depois: Optional[str] = None
+    comissao_renovacao_antes: Optional[str] = None
+    comissao_renovacao_depois: Optional[str] = None
+    is_renovacao_antes: Optional[bool] = None
+    is_renovacao_depois: Optional[bool] = None
+
+class ComissaoDiffParceiro(BaseModel):
+    tipo: str  # vendedor, contador or renovacao
+    cnpj_cpf: str
+    nome: str
+    situacao: str  # adicionado, removido or alterado
+    faixa_antes: Optional[str] = None
+    faixa_depois: Optional[str] = None
+    quantidade_vendas_delta: int
+    total_vendas_delta: str
+    total_comissao_delta: str
+    total_comissao_renovacao_delta: str
+    vendas_adicionadas: List[ComissaoDiffVenda] = []
+    vendas_removidas: List[ComissaoDiffVenda] = []
+    vendas_alteradas: List[ComissaoDiffVenda] = []
+
+class ComissaoDiff(BaseModel):
+    # Sales are counted once per seller (contador lists repeat them)
+    vendas_adicionadas: int
+    vendas_removidas: int
+    vendas_alteradas: int
+    faixas_alteradas: int
+    total_vendas_delta: str
+    total_comissao_delta: str
+    total_comissao_renovacao_delta: str
+    # Only partners that changed
+    parceiros: List[ComissaoDiffParceiro] = []
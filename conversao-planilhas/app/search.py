@@ -0,0 +1,166 @@
+# search.py
+"""Índice em memória para a busca de agentes por nome ou CPF.
+
+Os nomes são normalizados com unidecode (sem acentos, minúsculos) e quebrados
+em palavras; a busca casa o prefixo de cada palavra digitada com as palavras do
+nome, ou o prefixo dos dígitos com o CPF. As listas ordenadas permitem achar os
+prefixos com ``bisect`` sem percorrer todos os agentes.
+
+O índice é carregado do banco na primeira busca e atualizado pelas escritas do
+``crud``. Como cada processo do servidor tem o seu índice, ele também é
+recarregado depois de ``SEARCH_INDEX_TTL_SECONDS`` para pegar escritas feitas
+por outros processos.
+"""
+import asyncio
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from unidecode import unidecode
+
+from . import models
+from .config import settings
+
+
+# Maior caractere possível: tudo que começa com o prefixo fica antes de prefixo + PREFIX_END
+PREFIX_END = "\uffff"
+CPF_CHARS = set("0123456789.-/ ")
+
+
+def fold_text(text: str) -> str:
+    return unidecode(str(text or "")).lower().strip()
+
+
+def name_tokens(nome: str) -> List[str]:
+    return [token for token in "".join(ch if ch.isalnum() else " " for ch in fold_text(nome)).split() if token]
+
+
+def only_digits(text: str) -> str:
+    return "".join(ch for ch in str(text or "") if ch.isdigit())
+
+
+def _prefix_range(sorted_values: list, prefix) -> Tuple[int, int]:
+    """Faixa ``[start, end)`` dos valores ordenados que começam com ``prefix``."""
+    start = bisect_left(sorted_values, prefix)
+    end = bisect_left(sorted_values, _prefix_end(prefix))
+    return start, end
+
+
+def _prefix_end(prefix):
+    if isinstance(prefix, tuple):
+        return (prefix[0] + PREFIX_END,)
+    return prefix + PREFIX_END
+
+
+class AgenteSearchIndex:
+    """Índice de nomes (por palavra) e CPFs dos agentes."""
+
+    def __init__(self):
+        self._agentes: Dict[int, Tuple[str, str]] = {}  # id -> (nome normalizado, cpf)
+        self._token_ids: Dict[str, Set[int]] = {}
+        self._sorted_tokens: List[str] = []
+        self._sorted_cpfs: List[Tuple[str, int]] = []
+        self._dirty = False
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    # --- Manutenção ---
+
+    def _add(self, agente_id: int, nome: str, cpf: str):
+        self._agentes[agente_id] = (fold_text(nome), cpf or "")
+        for token in name_tokens(nome):
+            self._token_ids.setdefault(token, set()).add(agente_id)
+        self._dirty = True
+
+    def _remove(self, agente_id: int):
+        previous = self._agentes.pop(agente_id, None)
+        if previous is None:
+            return
+        for token in name_tokens(previous[0]):
+            ids = self._token_ids.get(token)
+            if ids is not None:
+                ids.discard(agente_id)
+                if not ids:
+                    del self._token_ids[token]
+        self._dirty = True
+
+    def _rebuild_sorted(self):
+        if self._dirty:
+            self._sorted_tokens = sorted(self._token_ids)
+            self._sorted_cpfs = sorted((cpf, agente_id) for agente_id, (_, cpf) in self._agentes.items())
+            self._dirty = False
+
+    def upsert(self, agente_id: int, nome: str, cpf: str):
+        """Atualiza um agente no índice (chamado pelo crud após gravar)."""
+        if self._loaded_at is None:
+            return
+        self._remove(agente_id)
+        self._add(agente_id, nome, cpf)
+
+    def invalidate(self):
+        """Força a recarga do banco na próxima busca (ex: após importação em lote)."""
+        self._loaded_at = None
+
+    async def ensure_loaded(self, db: AsyncSession):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < settings.SEARCH_INDEX_TTL_SECONDS:
+            return
+        async with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < settings.SEARCH_INDEX_TTL_SECONDS:
+                return
+            result = await db.execute(select(
+                models.AgenteValidacao.id,
+                models.AgenteValidacao.nome,
+                models.AgenteValidacao.cpf,
+            ))
+            self._agentes = {}
+            self._token_ids = {}
+            for agente_id, nome, cpf in result.all():
+                self._add(agente_id, nome, cpf)
+            self._rebuild_sorted()
+            self._loaded_at = time.monotonic()
+
+    # --- Busca ---
+
+    def _ids_for_token(self, prefix: str) -> Set[int]:
+        start, end = _prefix_range(self._sorted_tokens, prefix)
+        ids: Set[int] = set()
+        for token in self._sorted_tokens[start:end]:
+            ids |= self._token_ids[token]
+        return ids
+
+    def search(self, query: str, limit: int = 20) -> List[int]:
+        """Ids dos agentes que casam com a busca, os mais relevantes primeiro.
+
+        Todas as palavras digitadas precisam ser prefixo de alguma palavra do nome;
+        uma busca só com dígitos (e pontuação de CPF) procura pelo prefixo do CPF.
+        """
+        self._rebuild_sorted()
+        folded = fold_text(query)
+        digits = only_digits(folded)
+        if digits and all(ch in CPF_CHARS for ch in folded):
+            start, end = self._cpf_range(digits)
+            return [agente_id for _, agente_id in self._sorted_cpfs[start:min(end, start + limit)]]
+
+        tokens = name_tokens(folded)
+        if not tokens:
+            return []
+        ids: Optional[Set[int]] = None
+        for token in tokens:
+            token_ids = self._ids_for_token(token)
+            ids = token_ids if ids is None else ids & token_ids
+            if not ids:
+                return []
+
+        # Nomes que começam com o texto digitado vêm primeiro, depois ordem alfabética
+        def rank(agente_id: int):
+            nome = self._agentes[agente_id][0]
+            return (not nome.startswith(folded), nome, agente_id)
+        return sorted(ids, key=rank)[:limit]
+
+    def _cpf_range(self, prefix: str) -> Tuple[int, int]:
+        return _prefix_range(self._sorted_cpfs, (prefix,))
+
+
+agente_search_index = AgenteSearchIndex()
@@ -0,0 +1,413 @@
+# benchmarks/datagen.py
+"""Gerador determinístico de dados de teste para os benchmarks.
+
+Gera, a partir de uma semente:
+
+- ``parceiros.csv``: vendedores, contadores (ligados a um vendedor pelo
+  "Gestor 01") e o parceiro de renovação;
+- ``vendas.csv``: vendas no formato do relatório exportado, com
+  assimetria configurável de vendas por vendedor/contador e fração de renovações;
+- ``vendas.parquet``: as mesmas vendas, tipadas como na exportação do data
+  warehouse (precisa do ``pyarrow``);
+- planilhas XLSX no formato Digiforte (remuneração e TEC-D).
+
+Uso:
+    python -m benchmarks.datagen vendas --rows 100000 --output /tmp/bench
+    python -m benchmarks.datagen vendas --rows 100000 --parquet --output /tmp/bench
+    python -m benchmarks.datagen remuneracao --rows 100000 --output /tmp/bench
+"""
+import argparse
+import csv
+import os
+import random
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import List, Optional, Tuple
+
+import openpyxl
+from unidecode import unidecode
+
+RENEWAL_PARTNER_CPF_CNPJ = "34151313001"
+RENEWAL_PARTNER_NAME = "Renova Certificados"
+
+# Limite de linhas de uma sheet do Excel (incluindo o header)
+XLSX_MAX_ROWS_PER_SHEET = 1_048_575
+
+PRODUTOS = [
+    "e-CPF A1", "e-CPF A3 Cartão", "e-CPF A3 Token", "e-CNPJ A1", "e-CNPJ A3 Cartão",
+    "e-CNPJ A3 Token", "NF-e A1", "Renovação e-CPF A1", "Renovação e-CNPJ A1",
+]
+NOMES = ["Ana", "Bruno", "Carla", "Diego", "Érica", "Fábio", "Gisele", "Hélio", "Íris", "João", "Lúcia", "Márcio"]
+SOBRENOMES = ["Silva", "Souza", "Oliveira", "Conceição", "Araújo", "Gonçalves", "Lima", "Pereira", "Simões"]
+CIDADES = [("Florianópolis", "SC"), ("São José", "SC"), ("Curitiba", "PR"), ("Porto Alegre", "RS"), ("São Paulo", "SP")]
+
+
+def format_cpf(number: int) -> str:
+    digits = f"{number % 10 ** 11:011d}"
+    return f"{digits[:3]}.{digits[3:6]}.{digits[6:9]}-{digits[9:]}"
+
+
+def format_cnpj(number: int) -> str:
+    digits = f"{number % 10 ** 14:014d}"
+    return f"{digits[:2]}.{digits[2:5]}.{digits[5:8]}/{digits[8:12]}-{digits[12:]}"
+
+
+def format_brl(value: float) -> str:
+    """1234.5 -> '1.234,50'"""
+    return f"{value:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+def random_name(rng: random.Random) -> str:
+    return f"{rng.choice(NOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}"
+
+
+def zipf_weights(count: int, skew: float) -> List[float]:
+    """Pesos acumulados (``cum_weights``) com distribuição de Zipf: skew 0 = uniforme; quanto maior, mais concentrado.
+
+    Acumulados uma vez só: com ``weights`` o ``random.choices`` refaz a soma a cada sorteio.
+    """
+    return list(accumulate(1.0 / (rank ** skew) for rank in range(1, count + 1)))
+
+
+# --- Parceiros e vendas ---
+
+class Parceiros:
+    """Documentos gerados, usados para montar vendas coerentes com os parceiros."""
+
+    def __init__(self, sellers: List[Tuple[str, str]], contadores: List[Tuple[str, str]]):
+        self.sellers = sellers          # (documento, nome)
+        self.contadores = contadores    # (documento, nome)
+
+
+def generate_parceiros(
+    path: str,
+    sellers: int = 50,
+    contadores: int = 2000,
+    contador_skew: float = 1.1,
+    seed: int = 42,
+) -> Parceiros:
+    """Escreve o CSV de parceiros; ``contador_skew`` concentra contadores em poucos vendedores."""
+    rng = random.Random(seed)
+    seller_rows = []
+    for index in range(sellers):
+        nome = f"{random_name(rng)} {index}"
+        seller_rows.append((format_cpf(10_000_000_000 + index * 7919), nome, f"{rng.choice([10, 15, 20, 25])}%"))
+
+    weights = zipf_weights(sellers, contador_skew)
+    contador_rows = []
+    for index in range(contadores):
+        gestor = rng.choices(seller_rows, cum_weights=weights)[0]
+        documento = format_cnpj(20_000_000_000_000 + index * 104_729)
+        faixa = rng.choice(["5%", "10%", "Faixa 15%", "30 VENDIDO 25 EMITIDO %"])
+        contador_rows.append((documento, f"Contabilidade {random_name(rng)} {index}", faixa, gestor[1]))
+
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(["Tipo Parceiro", "Faixa de Comissão", "CNPJ/CPF", "Nome/Razão Social", "Gestor 01", "Status"])
+        for documento, nome, faixa in seller_rows:
+            writer.writerow(["Vendedor", faixa, documento, f"{nome} - Comercial", "", "Ativo"])
+        writer.writerow(["Parceiro", "10%", format_cpf(int(RENEWAL_PARTNER_CPF_CNPJ)), RENEWAL_PARTNER_NAME, "", "Ativo"])
+        for documento, nome, faixa, gestor in contador_rows:
+            writer.writerow(["Contador", faixa, documento, nome, f"{gestor} - Comercial", "Ativo"])
+
+    return Parceiros(
+        sellers=[(documento, nome) for documento, nome, _ in seller_rows],
+        contadores=[(documento, nome) for documento, nome, _, _ in contador_rows],
+    )
+
+
+def generate_vendas(
+    path: str,
+    rows: int,
+    parceiros: Parceiros,
+    seller_skew: float = 1.0,
+    contador_share: float = 0.7,
+    renewal_share: float = 0.2,
+    paid_share: float = 0.85,
+    month: Tuple[int, int] = (2024, 1),
+    seed: int = 42,
+):
+    """Escreve o CSV de vendas.
+
+    ``contador_share`` é a fração de vendas feitas por contadores (o restante
+    direto por vendedores) e ``seller_skew`` a concentração de vendas em poucos
+    parceiros. ``renewal_share`` é a fração criada pelo parceiro de renovação.
+    Algumas vendas caem fora do mês, não estão pagas ou têm valor zero, como
+    acontece no relatório real.
+    """
+    rng = random.Random(seed + 1)
+    seller_weights = zipf_weights(len(parceiros.sellers), seller_skew)
+    contador_weights = zipf_weights(len(parceiros.contadores), seller_skew) if parceiros.contadores else []
+    year, month_number = month
+    start = datetime(year, month_number, 1)
+
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow([
+            "Nº Pedido", "Nº Protocolo", "Data Venda", "Valor Venda", "Status Financeiro", "Doc. Vendedor",
+            "Usuário de Criação do pedido", "Produto", "Cliente", "Doc. Cliente", "Observação",
+        ])
+        for index in range(rows):
+            if parceiros.contadores and rng.random() < contador_share:
+                documento = rng.choices(parceiros.contadores, cum_weights=contador_weights)[0][0]
+            else:
+                documento = rng.choices(parceiros.sellers, cum_weights=seller_weights)[0][0]
+            usuario = f"{RENEWAL_PARTNER_NAME.upper()} - API" if rng.random() < renewal_share else f"usuario{rng.randrange(500)}"
+            # ~3% fora do período (mês seguinte)
+            data_venda = start + timedelta(days=rng.randrange(31 if rng.random() < 0.97 else 40), seconds=rng.randrange(86400))
+            valor = 0.0 if rng.random() < 0.01 else round(rng.lognormvariate(5, 0.6), 2)
+            writer.writerow([
+                f"{1_000_000 + index}",
+                f"PRT{seed}{index:09d}",
+                data_venda.strftime("%d/%m/%Y %H:%M:%S"),
+                format_brl(valor),
+                "PAGO" if rng.random() < paid_share else rng.choice(["PENDENTE", "CANCELADO"]),
+                documento,
+                usuario,
+                rng.choice(PRODUTOS),
+                random_name(rng),
+                format_cpf(rng.randrange(10 ** 11)),
+                "" if rng.random() < 0.9 else "Cliente pediu; \"urgência\"",
+            ])
+
+
+# Registros por row group do Parquet de vendas
+PARQUET_ROW_GROUP_SIZE = 100_000
+
+
+def convert_vendas_to_parquet(csv_path: str, parquet_path: str):
+    """Converte o vendas.csv gerado para Parquet: Data Venda como timestamp, Valor Venda como double e o resto texto."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    with open(csv_path, encoding="utf-8-sig", newline="") as f:
+        reader = csv.reader(f, delimiter=";")
+        header = next(reader)
+        types = {"Data Venda": pa.timestamp("us"), "Valor Venda": pa.float64()}
+        schema = pa.schema([(name, types.get(name, pa.string())) for name in header])
+        date_index, value_index = header.index("Data Venda"), header.index("Valor Venda")
+
+        def write(writer, rows):
+            columns = [list(column) for column in zip(*rows)]
+            columns[date_index] = [datetime.strptime(value, "%d/%m/%Y %H:%M:%S") for value in columns[date_index]]
+            columns[value_index] = [float(value.replace(".", "").replace(",", ".")) for value in columns[value_index]]
+            writer.write_table(pa.table(columns, schema=schema))
+
+        with pq.ParquetWriter(parquet_path, schema) as writer:
+            rows = []
+            for row in reader:
+                rows.append(row)
+                if len(rows) == PARQUET_ROW_GROUP_SIZE:
+                    write(writer, rows)
+                    rows = []
+            if rows:
+                write(writer, rows)
+
+
+# --- Planilhas Digiforte ---
+
+REMUNERACAO_HEADERS = [
+    "PEDIDO", "SOLICITACAO", "SKU", "PRODUTO", "TITULAR", "CPF", "EMAIL", "CNPJ", "RAZAO_SOCIAL",
+    "Código Localidade", "Localidade Atendimento", "Nome Agente Validação", "CPF Agente Validação",
+    "Data Primeira Verificação", "CODIGO_ORIGEM", "NOME_ORIGEM", "SERIAL_CERTIFICADO", "DATA_EMISSAO",
+    "DATA_EXPIRACAO", "DATA_REVOGACAO", "Data Hora Primeira Verificação", "DATA_ULTIMO_STATUS", "ULTIMO_STATUS",
+    "Cidade Validação", "Estado Validação", "AR", "TICKET_ANTERIOR", "PRECO", "Data de Venda", "PRECO BASE",
+    "% REM", "BIO", "TOTAL R$", "OBSERVACAO",
+]
+
+TECD_HEADERS = [
+    "Pedido", "Solicitação", "SKU", "Produto", "Titular", "CPF", "Email", "CNPJ", "Razão Social",
+    "Codigo Localidade", "Localidade Atendimento", "Nome Agente Validação", "CPF Agente Validação",
+    "Data Primeira Verificação", "Código Origem", "Nome Origem", "Preço", "Serial Certificado", "Data Emissão",
+    "Data Expiração", "Data Revogação", "Data Hora Primeira Verificação", "Data Último Status", "Último Status",
+    "Cidade Validação", "Estado Validação", "AR", "Preço TEC-D", "BIO", "Total TEC-D",
+]
+
+
+def agent_cpfs(count: int) -> List[str]:
+    """CPFs dos agentes de validação usados nas planilhas (mesma lista para o banco/lookup)."""
+    return [f"{30_000_000_000 + index * 3571:011d}" for index in range(count)]
+
+
+# Tipo de valor de cada coluna (header sem acentos, minúsculo); o resto recebe um código
+_COLUMN_KINDS = {
+    "pedido": "pedido", "solicitacao": "solicitacao", "sku": "sku", "produto": "produto",
+    "titular": "titular", "cpf": "cpf", "email": "email", "cnpj": "cnpj",
+    "razao_social": "razao_social", "razao social": "razao_social",
+    "codigo localidade": "codigo_localidade", "localidade atendimento": "localidade",
+    "nome agente validacao": "agente", "cpf agente validacao": "cpf_agente",
+    "data primeira verificacao": "verificacao", "data hora primeira verificacao": "verificacao",
+    "data_emissao": "emissao", "data emissao": "emissao", "data_ultimo_status": "emissao",
+    "data ultimo status": "emissao", "data de venda": "verificacao",
+    "data_expiracao": "expiracao", "data expiracao": "expiracao",
+    "data_revogacao": "vazio", "data revogacao": "vazio",
+    "ultimo_status": "status", "ultimo status": "status",
+    "cidade validacao": "cidade", "estado validacao": "estado",
+    "preco": "preco", "preco base": "preco", "preco tec-d": "preco",
+    "total r$": "total", "total tec-d": "total", "bio": "bio", "% rem": "percentual",
+}
+
+
+def _column_kinds(headers: List[str]) -> List[str]:
+    return [_COLUMN_KINDS.get(unidecode(header).lower().strip(), "codigo") for header in headers]
+
+
+def _digiforte_row(rng: random.Random, index: int, kinds: List[str], agents: List[str], virtual_share: float) -> list:
+    verificacao = datetime(2024, 1, 1) + timedelta(minutes=rng.randrange(60 * 24 * 30))
+    emissao = verificacao + timedelta(minutes=rng.randrange(120))
+    cidade, estado = rng.choice(CIDADES)
+    agent_index = rng.randrange(len(agents))
+    preco = round(rng.uniform(80, 400), 2)
+    virtual = rng.random() < virtual_share
+    empresa = rng.random() < 0.4
+    values = {
+        "pedido": 5_000_000 + index,
+        "solicitacao": f"SOL{index:09d}",
+        "sku": f"SKU-{agent_index % 40:03d}",
+        "produto": rng.choice(PRODUTOS),
+        "titular": random_name(rng),
+        "cpf": format_cpf(rng.randrange(10 ** 11)),
+        "email": f"cliente{index}@exemplo.com.br",
+        "cnpj": format_cnpj(rng.randrange(10 ** 14)) if empresa else None,
+        "razao_social": f"Empresa {index} Ltda" if empresa else None,
+        "codigo_localidade": "VIRT" if virtual else f"L{agent_index % 20:03d}",
+        "localidade": "AR VIRTUAL" if virtual else f"Loja {agent_index % 20}",
+        "agente": f"Agente {agent_index}",
+        "cpf_agente": format_cpf(int(agents[agent_index])),
+        "verificacao": verificacao,
+        "emissao": emissao,
+        "expiracao": emissao + timedelta(days=365),
+        "vazio": None,
+        "status": rng.choice(["EMITIDO", "REVOGADO", "EXPIRADO"]),
+        "cidade": cidade,
+        "estado": estado,
+        "preco": preco,
+        "total": round(preco * 0.3, 2),
+        "bio": 5.0,
+        "percentual": 0.3,
+        "codigo": f"C{rng.randrange(10 ** 6)}",
+    }
+    return [values[kind] for kind in kinds]
+
+
+def _write_digiforte_xlsx(
+    path: str,
+    rows: int,
+    headers: List[str],
+    sheet_titles: List[str],
+    agents: List[str],
+    virtual_share: float,
+    seed: int,
+    max_rows_per_sheet: int = XLSX_MAX_ROWS_PER_SHEET,
+):
+    rng = random.Random(seed + 2)
+    kinds = _column_kinds(headers)
+    wb = openpyxl.Workbook(write_only=True)
+    # Sheet de resumo antes dos dados, como nos arquivos exportados
+    wb.create_sheet("Resumo").append(["Relatório gerado para benchmark"])
+    written = 0
+    sheet_index = 0
+    while written < rows or sheet_index == 0:
+        if sheet_index >= len(sheet_titles):
+            raise ValueError(f"{rows} linhas não cabem em {len(sheet_titles)} sheet(s)")
+        ws = wb.create_sheet(sheet_titles[sheet_index])
+        ws.append(headers)
+        for _ in range(min(rows - written, max_rows_per_sheet)):
+            ws.append(_digiforte_row(rng, written, kinds, agents, virtual_share))
+            written += 1
+        sheet_index += 1
+    wb.save(path)
+
+
+def generate_remuneracao_xlsx(path: str, rows: int, agents: int = 200, seed: int = 42, sheets: int = 0):
+    """Planilha de remuneração; linhas além do limite do Excel vão para sheets "EMISSÕES N" extras."""
+    sheets = sheets or max(1, -(-rows // XLSX_MAX_ROWS_PER_SHEET))
+    titles = ["EMISSÕES"] + [f"EMISSÕES {index + 1}" for index in range(1, sheets)]
+    per_sheet = -(-rows // sheets) if rows else 0
+    _write_digiforte_xlsx(path, rows, REMUNERACAO_HEADERS, titles, agent_cpfs(agents), 0.0, seed, per_sheet)
+
+
+def generate_tecd_xlsx(path: str, rows: int, agents: int = 200, virtual_share: float = 0.1, seed: int = 42):
+    """Planilha de TEC-D (uma sheet "EMISSÕES"); ``virtual_share`` das linhas usam a localidade virtual."""
+    if rows > XLSX_MAX_ROWS_PER_SHEET:
+        raise ValueError(f"A planilha de TEC-D tem uma única sheet (máximo de {XLSX_MAX_ROWS_PER_SHEET} linhas)")
+    _write_digiforte_xlsx(path, rows, TECD_HEADERS, ["EMISSÕES"], agent_cpfs(agents), virtual_share, seed)
+
+
+# --- Arquivos em cache ---
+
+def dataset_path(directory: str, kind: str, rows: int, seed: int, extension: str) -> str:
+    return os.path.join(directory, f"{kind}-{rows}-s{seed}.{extension}")
+
+
+def ensure_comissao_dataset(directory: str, rows: int, seed: int = 42, **options) -> Tuple[str, str]:
+    """Gera (se ainda não existirem) e retorna os caminhos de vendas.csv e parceiros.csv."""
+    os.makedirs(directory, exist_ok=True)
+    parceiros_path = dataset_path(directory, "parceiros", rows, seed, "csv")
+    vendas_path = dataset_path(directory, "vendas", rows, seed, "csv")
+    if not (os.path.exists(parceiros_path) and os.path.exists(vendas_path)):
+        contadores = options.pop("contadores", max(50, min(20_000, rows // 50)))
+        sellers = options.pop("sellers", 50)
+        contador_skew = options.pop("contador_skew", 1.1)
+        parceiros = generate_parceiros(
+            parceiros_path, sellers=sellers, contadores=contadores, contador_skew=contador_skew, seed=seed
+        )
+        generate_vendas(vendas_path, rows, parceiros, seed=seed, **options)
+    return vendas_path, parceiros_path
+
+
+def ensure_vendas_parquet(directory: str, rows: int, seed: int = 42) -> str:
+    """Gera (se ainda não existir) e retorna o caminho do vendas.parquet, a partir do vendas.csv."""
+    vendas_path, _ = ensure_comissao_dataset(directory, rows, seed)
+    parquet_path = dataset_path(directory, "vendas", rows, seed, "parquet")
+    if not os.path.exists(parquet_path):
+        convert_vendas_to_parquet(vendas_path, parquet_path)
+    return parquet_path
+
+
+def ensure_xlsx_dataset(directory: str, kind: str, rows: int, seed: int = 42, agents: int = 200) -> str:
+    os.makedirs(directory, exist_ok=True)
+    path = dataset_path(directory, kind, rows, seed, "xlsx")
+    if not os.path.exists(path):
+        if kind == "remuneracao":
+            generate_remuneracao_xlsx(path, rows, agents=agents, seed=seed)
+        else:
+            generate_tecd_xlsx(path, rows, agents=agents, seed=seed)
+    return path
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Gera dados sintéticos para os benchmarks")
+    parser.add_argument("kind", choices=["vendas", "remuneracao", "tecd"])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(__file__), "data"))
+    parser.add_argument("--sellers", type=int, default=50)
+    parser.add_argument("--contadores", type=int, default=None, help="padrão: rows / 50 (entre 50 e 20000)")
+    parser.add_argument("--contador-skew", type=float, default=1.1, help="concentração de contadores por vendedor")
+    parser.add_argument("--seller-skew", type=float, default=1.0, help="concentração de vendas por parceiro")
+    parser.add_argument("--renewal-share", type=float, default=0.2)
+    parser.add_argument("--parquet", action="store_true", help="também gera vendas.parquet (precisa do pyarrow)")
+    parser.add_argument("--agents", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    if args.kind == "vendas":
+        options = dict(
+            sellers=args.sellers,
+            contador_skew=args.contador_skew,
+            seller_skew=args.seller_skew,
+            renewal_share=args.renewal_share,
+        )
+        if args.contadores is not None:
+            options["contadores"] = args.contadores
+        paths = ensure_comissao_dataset(args.output, args.rows, args.seed, **options)
+        if args.parquet:
+            paths += (ensure_vendas_parquet(args.output, args.rows, args.seed),)
+    else:
+        paths = (ensure_xlsx_dataset(args.output, args.kind, args.rows, args.seed, args.agents),)
+    for path in paths:
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+# benchmarks/run.py
+"""Benchmarks das funções dos endpoints (comissão e conversores).
+
+Cada caso roda em um subprocesso próprio, para que o pico de memória (RSS)
+medido seja só o dele: o do subprocesso mais o dos workers do pool de
+processos, lido depois que o pool é encerrado. Para cada caso são medidos:
+
+- latência de cada repetição (mínimo, mediana, p95 e máximo);
+- vazão em linhas por segundo (pela mediana);
+- tempo de cada etapa (as mesmas do header ``Server-Timing``);
+- pico de RSS do processo e dos workers.
+
+Os resultados são gravados em JSON (com o commit do git) para comparar
+execuções:
+
+    python -m benchmarks.run --rows 10000 100000
+    python -m benchmarks.run --rows 100000 --compare benchmarks/results/anterior.json
+
+Os dados de entrada são gerados por ``benchmarks.datagen`` e ficam em
+``benchmarks/data`` entre execuções.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+# A aplicação lê as configurações do ambiente ao ser importada; valores
+# suficientes para importar os roteadores sem um banco de verdade.
+BENCHMARK_ENV = {
+    "DATABASE_URL": "sqlite+aiosqlite:///:memory:",
+    "SECRET_KEY": "benchmark",
+    "ADMIN_TOKEN": "benchmark",
+    "CORS_ORIGINS": "http://localhost",
+    "CONVERSION_CACHE_ENABLED": "false",
+    "INSTRUMENTATION_ENABLED": "true",
+}
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DATA_DIR = os.path.join(PROJECT_DIR, "benchmarks", "data")
+DEFAULT_RESULTS_DIR = os.path.join(PROJECT_DIR, "benchmarks", "results")
+
+DATA_INICIO = "01/01/2024"
+DATA_FIM = "31/01/2024"
+
+
+# --- Casos ---
+
+class Case:
+    """Um benchmark: ``setup`` prepara os dados e retorna a função medida a cada repetição."""
+
+    def __init__(self, name: str, description: str, setup: Callable[[str, int, int], Callable[[], None]]):
+        self.name = name
+        self.description = description
+        self.setup = setup
+
+
+def _upload(path: str):
+    from fastapi import UploadFile
+    return UploadFile(file=open(path, "rb"), filename=os.path.basename(path))
+
+
+def _close_uploads(*uploads):
+    for upload in uploads:
+        upload.file.close()
+
+
+def _setup_parse_csv(data_dir: str, rows: int, seed: int):
+    from app.routers.comissao import parse_comissao_csvs
+    from app.routers.csv_reader import open_csv_lines
+    from benchmarks.datagen import ensure_comissao_dataset
+
+    vendas_path, parceiros_path = ensure_comissao_dataset(data_dir, rows, seed)
+
+    def run():
+        with open_csv_lines(vendas_path) as vendas, open_csv_lines(parceiros_path) as parceiros:
+            parse_comissao_csvs(vendas, parceiros)
+    return run
+
+
+def _setup_process_sales(data_dir: str, rows: int, seed: int):
+    from app.routers import comissao
+    from app.routers.csv_reader import open_csv_lines
+    from benchmarks.datagen import ensure_comissao_dataset
+
+    vendas_path, parceiros_path = ensure_comissao_dataset(data_dir, rows, seed)
+    with open_csv_lines(vendas_path) as vendas, open_csv_lines(parceiros_path) as parceiros:
+        vendas_rows, parceiros_rows = comissao.parse_comissao_csvs(vendas, parceiros)
+    inicio, fim = comissao.validate_dates(DATA_INICIO, DATA_FIM)
+    renewal_name, _, renewal_faixa = comissao.find_renewal_partner_info(parceiros_rows)
+    renewal_bps = comissao.parse_commission_bps(renewal_faixa)
+
+    def run():
+        # Os totais são acumulados nos objetos, então cada repetição parte do zero
+        totals = comissao.PartnerTotals()
+        sellers_dict, contadores_dict, contador_to_seller, _ = comissao.build_sellers_and_contadores(
+            parceiros_rows, totals
+        )
+        comissao.process_sales(
+            vendas_rows, inicio, fim,
+            sellers_dict, contadores_dict, contador_to_seller, totals,
+            renewal_name, renewal_bps
+        )
+    return run
+
+
+def _setup_calcular_comissao(data_dir: str, rows: int, seed: int, parquet: bool = False):
+    from app.routers.comissao import calcular_comissao
+    from benchmarks.datagen import ensure_comissao_dataset, ensure_vendas_parquet
+
+    vendas_path, parceiros_path = ensure_comissao_dataset(data_dir, rows, seed)
+    if parquet:
+        vendas_path = ensure_vendas_parquet(data_dir, rows, seed)
+
+    def run():
+        vendas_upload, parceiros_upload = _upload(vendas_path), _upload(parceiros_path)
+        try:
+            asyncio.run(calcular_comissao(
+                vendas_upload, parceiros_upload, DATA_INICIO, DATA_FIM, None, None, False, None, None
+            ))
+        finally:
+            _close_uploads(vendas_upload, parceiros_upload)
+    return run
+
+
+class StaticLookup:
+    """Lookup com valor fixo, no lugar da consulta ao banco."""
+
+    def __init__(self, name: str, value):
+        self.name = name
+        self.value = value
+
+    async def load(self):
+        return self.value
+
+    async def version(self) -> str:
+        return ""
+
+
+def _converter_setup(kind: str, formato: str):
+    def setup(data_dir: str, rows: int, seed: int):
+        from app.routers.pipeline import convert_to_csv, convert_to_xlsx
+        from app.routers.utils import remove_files
+        from benchmarks.datagen import agent_cpfs, ensure_xlsx_dataset
+
+        data_path = ensure_xlsx_dataset(data_dir, kind, rows, seed)
+        if kind == "remuneracao":
+            from app.routers.remuneracao import remuneracao_pipeline as pipeline
+            lookups = {}
+        else:
+            from app.routers.tecd import AgenteLocalidadeLookup, tecd_pipeline as pipeline
+            localidades = {cpf: (f"L{index % 20:03d}", f"Loja {index % 20}") for index, cpf in enumerate(agent_cpfs(200))}
+            lookups = {AgenteLocalidadeLookup.name: StaticLookup(AgenteLocalidadeLookup.name, localidades)}
+
+        def run():
+            if formato == "xlsx":
+                asyncio.run(convert_to_xlsx(pipeline, data_path, lookups))
+            else:
+                remove_files(asyncio.run(convert_to_csv(pipeline, data_path, lookups)))
+        return run
+    return setup
+
+
+CASES: Dict[str, Case] = {case.name: case for case in [
+    Case("parse_csv", "comissao.parse_comissao_csvs (vendas.csv + parceiros.csv)", _setup_parse_csv),
+    Case("process_sales", "comissao.build_sellers_and_contadores + process_sales", _setup_process_sales),
+    Case("calcular_comissao", "endpoint /calcular-comissao/ completo", _setup_calcular_comissao),
+    Case(
+        "calcular_comissao_parquet",
+        "endpoint /calcular-comissao/ com vendas em Parquet (precisa do pyarrow)",
+        lambda data_dir, rows, seed: _setup_calcular_comissao(data_dir, rows, seed, parquet=True),
+    ),
+    Case("remuneracao_xlsx", "conversão de remuneração para xlsx", _converter_setup("remuneracao", "xlsx")),
+    Case("remuneracao_csv", "conversão de remuneração para csv", _converter_setup("remuneracao", "csv")),
+    Case("tecd_xlsx", "conversão de TEC-D para xlsx", _converter_setup("tecd", "xlsx")),
+    Case("tecd_csv", "conversão de TEC-D para csv", _converter_setup("tecd", "csv")),
+]}
+
+
+# --- Execução de um caso (no subprocesso) ---
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_case(name: str, rows: int, repeat: int, warmup: int, seed: int, data_dir: str) -> dict:
+    from app import instrumentation
+    from app.routers import utils
+
+    case = CASES[name]
+    run = case.setup(data_dir, rows, seed)
+    for _ in range(warmup):
+        run()
+
+    latencies = []
+    stages: Dict[str, List[float]] = {}
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        _, stats = instrumentation.call_with_stats(run)
+        latencies.append(time.perf_counter() - started_at)
+        for stage_name, seconds in stats["stages"].items():
+            stages.setdefault(stage_name, []).append(seconds)
+
+    main_peak_rss = instrumentation.maxrss_bytes()
+    # Encerrar o pool faz os workers aparecerem em RUSAGE_CHILDREN
+    utils.shutdown_process_pool()
+    workers_peak_rss = instrumentation.maxrss_bytes(children=True)
+
+    median = statistics.median(latencies)
+    return {
+        "case": name,
+        "description": case.description,
+        "rows": rows,
+        "repeat": repeat,
+        "latency_seconds": {
+            "min": min(latencies),
+            "median": median,
+            "p95": percentile(latencies, 0.95),
+            "max": max(latencies),
+        },
+        "rows_per_second": rows / median if median else None,
+        "stages_median_seconds": {stage_name: statistics.median(values) for stage_name, values in stages.items()},
+        "peak_rss_bytes": {"main": main_peak_rss, "workers": workers_peak_rss},
+    }
+
+
+def run_case_in_subprocess(name: str, rows: int, args) -> dict:
+    env = dict(os.environ)
+    for key, value in BENCHMARK_ENV.items():
+        env.setdefault(key, value)
+    command = [
+        sys.executable, "-m", "benchmarks.run", "--worker", name,
+        "--rows", str(rows), "--repeat", str(args.repeat), "--warmup", str(args.warmup),
+        "--seed", str(args.seed), "--data-dir", args.data_dir,
+    ]
+    completed = subprocess.run(command, cwd=PROJECT_DIR, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {"case": name, "rows": rows, "error": completed.stderr.strip().splitlines()[-1:]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+# --- Resultados ---
+
+def git_commit() -> Optional[str]:
+    try:
+        completed = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR, capture_output=True, text=True
+        )
+    except OSError:
+        return None
+    return completed.stdout.strip() or None
+
+
+def _result_key(result: dict):
+    return result["case"], result["rows"]
+
+
+def print_results(results: List[dict], baseline: Optional[List[dict]] = None):
+    baseline_by_key = {_result_key(result): result for result in baseline or [] if "error" not in result}
+    header = f"{'caso':<20} {'linhas':>9} {'mediana (s)':>12} {'p95 (s)':>9} {'linhas/s':>11} {'RSS (MB)':>9} {'workers (MB)':>13}"
+    if baseline is not None:
+        header += f" {'vs base':>9}"
+    print(header)
+    for result in results:
+        if "error" in result:
+            print(f"{result['case']:<20} {result['rows']:>9} erro: {' '.join(result['error'])}")
+            continue
+        latency = result["latency_seconds"]
+        rss = result["peak_rss_bytes"]
+        line = (
+            f"{result['case']:<20} {result['rows']:>9} {latency['median']:>12.3f} {latency['p95']:>9.3f} "
+            f"{result['rows_per_second']:>11.0f} {rss['main'] / 2 ** 20:>9.0f} {rss['workers'] / 2 ** 20:>13.0f}"
+        )
+        base = baseline_by_key.get(_result_key(result))
+        if base is not None:
+            change = latency["median"] / base["latency_seconds"]["median"] - 1
+            line += f" {change:>+9.1%}"
+        print(line)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmarks das funções dos endpoints")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--rows", nargs="+", type=int, default=[10_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--output", help=f"arquivo JSON de saída (padrão: {DEFAULT_RESULTS_DIR}/<data>-<commit>.json)")
+    parser.add_argument("--compare", help="JSON de uma execução anterior para comparar as medianas")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        result = run_case(args.worker, args.rows[0], args.repeat, args.warmup, args.seed, args.data_dir)
+        print(json.dumps(result))
+        return
+
+    results = []
+    for rows in args.rows:
+        for name in args.cases:
+            # Os conversores de TEC-D leem uma única sheet (limite de linhas do Excel)
+            if name.startswith("tecd") and rows > 1_048_575:
+                continue
+            results.append(run_case_in_subprocess(name, rows, args))
+
+    commit = git_commit()
+    timestamp = datetime.now(timezone.utc)
+    report = {
+        "commit": commit,
+        "timestamp": timestamp.isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": args.seed,
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        DEFAULT_RESULTS_DIR, f"{timestamp:%Y%m%d-%H%M%S}-{commit or 'sem-commit'}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    print_results(results, baseline)
+    print(f"\nResultados gravados em {output}")
+
+
+if __name__ == "__main__":
+    main()